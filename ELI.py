@@ -5,11 +5,29 @@
 
 # Initialize system variables
 
-import sys
-
-model = sys.argv[1]
-f = sys.argv[2]
-mask = sys.argv[3]
+import argparse
+
+parser = argparse.ArgumentParser(description='Calculate monthly ELI for one CMIP6 realization')
+parser.add_argument('model', help='Model name, e.g. ACCESS-CM2')
+parser.add_argument('f', help='Path to the ts_Amon file (or Zarr store from ingest.py) for the realization')
+parser.add_argument('mask', help='Path to the sftlf_fx land mask (NetCDF or Zarr) for the model')
+parser.add_argument('--stream', action='store_true', help='Read and process the file in blocks of time steps to bound memory use')
+parser.add_argument('--store', default='/output/store', help='Result store directory the realization is written to (default: /output/store)')
+parser.add_argument('--time-chunk', type=int, default=120, help='Number of time steps per block in streaming mode (default: 120)')
+parser.add_argument('--memory-limit', default=None,
+                    help='Memory budget, e.g. 4G; streams the file in blocks sized to stay under it (overrides --stream and --time-chunk)')
+parser.add_argument('--stage-log', default=None, help='JSON-lines file to record the time and memory of each processing stage in')
+parser.add_argument('--ocean-threshold', type=float, default=1.0,
+                    help='Land fraction below which a grid cell counts as ocean (default: 1.0, every cell that is not entirely land)')
+parser.add_argument('--area-weighting', default='none', choices=['none', 'coslat', 'area'],
+                    help='Weighting of the spatial means: none (every grid point counts equally, as in existing tables), cos(latitude), or the model\'s areacella/areacello cell areas when present (default: none)')
+parser.add_argument('--force', action='store_true', help='Recompute the realization even if the manifest records it as up to date')
+args = parser.parse_args()
+area_weighting = None if args.area_weighting == 'none' else args.area_weighting
+
+model = args.model
+f = args.f
+mask = args.mask
 
 # Directory management
 
@@ -23,7 +41,7 @@ os.chdir(path)
 
 filename = f.split('CMIP6')[1]
 realization_file = filename.split(f'{model}/')[1]
-realization = realization_file.split('.nc')[0]
+realization = realization_file.split('.nc')[0].split('.zarr')[0]
 
 # Print a couple of sanity checks to the screen
 
@@ -35,53 +53,49 @@ print('Realization is', realization)
 
 # Import other important modules
 
-import numpy as np
-import pandas as pd
-import xarray as xr
 import warnings
-from lib import calculate_eli
-
-# Read in files from working directory
-# Read in model data
+from lib import diagnostic_params, input_signatures, is_current, record_result, run_realization, set_stage_log, update_manifest
 
-data = xr.open_dataset(f'{dir}{filename}')
 warnings.simplefilter("ignore","SerializationWarning:")
-
-# Read in land mask
-
+if args.stage_log:
+    set_stage_log(args.stage_log)
+options = {'stream': args.stream, 'time_chunk': args.time_chunk, 'ocean_threshold': args.ocean_threshold,
+           'area_weighting': area_weighting, 'memory_limit': args.memory_limit}
+params = diagnostic_params('eli', options)
+
+# Skip the realization if the manifest shows it was already computed from these exact files
+
+with update_manifest(args.store) as manifest: # Saves the refreshed mtimes of files that were touched but not changed
+    current = not args.force and is_current(manifest, args.store, 'eli', model, f'{dir}{filename}', mask, params)
+if current:
+    print(f"{realization} is up to date in {args.store}; nothing to do")
+    raise SystemExit(0)
+
+# Read in model data and land mask, apply the land mask and calculate ELI with the registered 'eli' diagnostic,
+# which writes it to this realization's own shard in the result store; run consolidate.py to build the tables
+# Streaming mode reads, masks and calculates one block of time steps at a time, so only one block of the field is in
+# memory, and appends each block's ELI to the store's blocks file as soon as it is calculated
+
+signatures = input_signatures(f'{dir}{filename}', mask) # Taken before reading, so a file replaced mid-run is redone next time
+memory_report = {}
 try:
-    land_mask = xr.open_dataset(f'{mask}')
+    run_realization(model, f'{dir}{filename}', mask, ['eli'], store_dir=args.store, memory_report=memory_report, **options)
 except FileNotFoundError:
     print("------------------------------------------")
     print(f"Land mask doesn't exist for {model}; no appropriate reprojection can be done")
     print("------------------------------------------")
+    raise
 
-# Set data array
-
-ts = data['ts']
-
-# Apply land mask
-
-land_masked = ts.where(land_mask['sftlf'] != 100)
-
-# Calculate ELI
-
-calculate_eli(land_masked)
-
-# Send output to CSV
+# Record the result in the manifest
 
-out_file = 'test_table.csv'
-if os.path.isfile(out_file):
-    ELI_series = pd.Series(monthly_ELI, name=realization)
-    eli_output = pd.read_csv(out_file)
-    eli_output.insert(0,realization,ELI_series)
-    eli_output.to_csv(out_file)
-else:
-    ELI_series = pd.Series(monthly_ELI, name=realization)
-    ELI_series.to_csv(out_file)
+with update_manifest(args.store) as manifest:
+    record_result(manifest, args.store, 'eli', model, f'{dir}{filename}', mask, params, signatures)
 
 # Send a nice message to the screen
 
 print("-------------------------------------------------")
 print(f"Successfully output realization {realization} for {model}!")
+if memory_report:
+    print(f"Peak memory {memory_report['observed_peak_mib']:.0f} MiB (estimated {memory_report['estimated_peak_mib']:.0f} MiB, "
+          f"limit {memory_report['memory_limit_mib']:.0f} MiB, {memory_report['time_chunk']} time steps per block)")
 print("-------------------------------------------------")
@@ -0,0 +1,157 @@
+# Script to benchmark the lib hot paths on synthetic CMIP6-like data
+# Times each path and tracks its peak traced memory at several problem sizes, appending the results as JSON lines
+# so runs can be compared against a baseline before a full ensemble run
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+# Initialize system variables
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from lib import (apply_ocean_mask, calculate_eli, calculate_niño, find_realizations, load_observations, load_ocean_mask, run_realization, seasonal_means,
+                 sst_bias_ens_calculator, sst_change_ens_calculator, write_synthetic_ensemble, zonal_avg_ens_calculator, zonal_diff_ens_calculator)
+
+# Problem sizes: model grid and run length (the change calculators need 1850-2100)
+sizes = {'small': {'n_lat': 45, 'n_lon': 90, 'years': 251},
+         'medium': {'n_lat': 90, 'n_lon': 180, 'years': 251},
+         'large': {'n_lat': 180, 'n_lon': 360, 'years': 251}}
+
+parser = argparse.ArgumentParser(description='Benchmark the CMIP6 processing hot paths on synthetic data')
+parser.add_argument('--sizes', nargs='+', default=['small'], choices=sorted(sizes), help='Problem sizes to run (default: small)')
+parser.add_argument('--cases', nargs='+', default=None, help='Only run these cases (default: all)')
+parser.add_argument('--calendar', default='noleap', help='Calendar of the synthetic model runs (default: noleap)')
+parser.add_argument('--convention', default='percent', help='sftlf convention of the synthetic land masks (default: percent)')
+parser.add_argument('--repeat', type=int, default=3, help='Number of timed repetitions per case (default: 3)')
+parser.add_argument('--work-dir', default='/tmp/cmip6_benchmark', help='Directory to write the synthetic data to')
+parser.add_argument('--out', default='benchmarks.jsonl', help='JSON-lines file the results are appended to')
+parser.add_argument('--compare', default=None, help='Baseline JSON-lines file to compare this run against')
+parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown versus the baseline before failing (default: 0.2)')
+args = parser.parse_args()
+
+# Describe the code and machine being measured
+
+try:
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+except OSError:
+    commit = None
+run_info = {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit,
+            'host': platform.node(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'xarray': xr.__version__, 'calendar': args.calendar, 'convention': args.convention}
+
+def measure(case, repeat, setup=None):
+    # Times a case and records its peak traced memory; the first call doubles as a warm-up for the weight caches
+    timings, peak = [], 0
+    for repetition in range(repeat + 1):
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        start = time.perf_counter()
+        case()
+        elapsed = time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        if repetition > 0 or repeat == 0:
+            timings.append(elapsed)
+    return timings, peak
+
+def remove_outputs(data_dir):
+    for out_file in ['composite_bias.nc', 'composite_change.nc', 'djf_zonal_averages.nc', 'hist_zonal_averages.nc', 'future_zonal_averages.nc']:
+        if os.path.isfile(os.path.join(data_dir, out_file)):
+            os.remove(os.path.join(data_dir, out_file))
+
+# Run every case at every size
+
+home_dir = os.getcwd()
+results = []
+for size in args.sizes:
+    data_dir = os.path.join(args.work_dir, f'{size}_{args.calendar}_{args.convention}') + '/'
+    print('---------------------------------------')
+    print(f'Synthetic {size} ensemble in {data_dir}')
+    if not os.path.isdir(os.path.join(data_dir, 'CMIP6')):
+        write_synthetic_ensemble(data_dir, calendar=args.calendar, convention=args.convention, **sizes[size])
+    data_files, mask_file = find_realizations('SYN-A', os.path.join(data_dir, 'CMIP6'))
+    input_bytes = os.path.getsize(data_files[0])
+
+    # Shared inputs, loaded once outside the timed region
+    with xr.open_dataset(data_files[0]) as data:
+        ssts = apply_ocean_mask(data['ts'].load(), load_ocean_mask(mask_file, 'SYN-A'), inplace=True)
+    obs = load_observations(os.path.join(data_dir, 'sst.mnmean.nc'))
+    eli_table = pd.DataFrame({f'r{column}': np.random.default_rng(column).normal(180, 20, len(ssts['time'])) for column in range(300)},
+                             index=[f'{date.year:04d}-{date.month:02d}' for date in ssts['time'].values])
+    model_list = ['SYN-A']
+
+    cases = {'calculate_eli': (lambda: calculate_eli(ssts).values, None),
+             'calculate_niño': (lambda: calculate_niño(ssts), None),
+             'seasonal_means': (lambda: seasonal_means(eli_table, 'DJF'), None),
+             'sst_bias_ens_calculator': (lambda: sst_bias_ens_calculator(0, model_list, obs, data_dir), lambda: remove_outputs(data_dir)),
+             'sst_change_ens_calculator': (lambda: sst_change_ens_calculator(0, model_list, obs, data_dir), lambda: remove_outputs(data_dir)),
+             'zonal_avg_ens_calculator': (lambda: zonal_avg_ens_calculator(0, 'DJF', [120, 280], [5, -5], model_list, obs, data_dir),
+                                          lambda: remove_outputs(data_dir)),
+             'zonal_diff_ens_calculator': (lambda: zonal_diff_ens_calculator(0, 'DJF', 'hist+future', [120, 280], [5, -5], model_list, obs, data_dir),
+                                           lambda: remove_outputs(data_dir)),
+             'run_realization': (lambda: run_realization('SYN-A', data_files[0], mask_file, ['eli', 'niño3.4', 'bias', 'zonal', 'change'], obs=obs), None)}
+
+    for case, (function, setup) in cases.items():
+        if args.cases and case not in args.cases:
+            continue
+        record = dict(run_info, case=case, size=size, shape=[len(ssts['time']), sizes[size]['n_lat'], sizes[size]['n_lon']], repeat=args.repeat)
+        try:
+            timings, peak = measure(function, args.repeat, setup)
+            record.update({'status': 'ok', 'seconds_median': statistics.median(timings), 'seconds_min': min(timings),
+                           'peak_mb': peak/1e6, 'input_mb_per_s': input_bytes/1e6/statistics.median(timings)})
+            print(f"[ok] {case:<26} {size:<7} {record['seconds_median']:8.3f} s  {record['peak_mb']:9.1f} MB peak")
+        except Exception as error:
+            tracemalloc.stop()
+            record.update({'status': 'failed', 'error': f'{type(error).__name__}: {error}'})
+            print(f"[failed] {case:<22} {size:<7} {record['error']}")
+        finally:
+            os.chdir(home_dir)
+        results.append(record)
+    remove_outputs(data_dir)
+
+# Append the results so later runs can be compared against them
+
+with open(args.out, 'a') as out_file:
+    for record in results:
+        out_file.write(json.dumps(record) + '\n')
+print('---------------------------------------')
+print(f'Appended {len(results)} results to {args.out}')
+
+# Compare against the most recent baseline result for each case and size
+
+if args.compare:
+    baseline = {}
+    with open(args.compare) as baseline_file:
+        for line in baseline_file:
+            record = json.loads(line)
+            if record.get('status') == 'ok':
+                baseline[(record['case'], record['size'])] = record
+    regressions = []
+    print('---------------------------------------')
+    print(f"{'case':<26} {'size':<7} {'baseline s':>10} {'now s':>10} {'ratio':>7} {'peak ratio':>10}")
+    for record in results:
+        reference = baseline.get((record['case'], record['size']))
+        if reference is None or record['status'] != 'ok':
+            continue
+        ratio = record['seconds_median']/reference['seconds_median']
+        peak_ratio = record['peak_mb']/reference['peak_mb'] if reference['peak_mb'] else float('nan')
+        flag = '  <- slower' if ratio > 1 + args.tolerance else ''
+        print(f"{record['case']:<26} {record['size']:<7} {reference['seconds_median']:10.3f} {record['seconds_median']:10.3f} {ratio:7.2f} {peak_ratio:10.2f}{flag}")
+        if flag:
+            regressions.append(record['case'])
+    if regressions:
+        print(f'{len(regressions)} cases slowed down by more than {args.tolerance:.0%}')
+        raise SystemExit(1)
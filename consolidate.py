@@ -0,0 +1,21 @@
+# Script to consolidate the per-realization result store into the ensemble tables
+# The tables written here are the ones boxplots.py, heatmaps.py, histograms.py and significance_testing.py read
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+# Initialize system variables
+
+import argparse
+
+from lib import build_ensemble_tables
+
+parser = argparse.ArgumentParser(description='Build the ensemble tables from the per-realization result store')
+parser.add_argument('--store', nargs='+', default=['/output/store'], help='Result store directory (or directories) to read shards from')
+parser.add_argument('--output-dir', default='/output', help='Directory to write the ensemble tables to')
+parser.add_argument('--diagnostics', nargs='+', default=['eli', 'niño3.4'], help='Diagnostics to consolidate')
+args = parser.parse_args()
+
+# Build the tables and send a nice message to the screen
+
+for out_file in build_ensemble_tables(args.store, args.output_dir, args.diagnostics):
+    print(f'Wrote {out_file}')
@@ -0,0 +1,51 @@
+# Script to convert the CMIP6 archive to compressed Zarr stores chunked for reading long time series
+# Writes '<out-dir>/<model>/<file name>.zarr' for every ts_Amon file and sftlf_fx land mask; point --data-dir of
+# run_ensemble.py (or the paths given to ELI.py and niño3-4.py) at the Zarr archive afterwards
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+# Initialize system variables
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lib import ingest_file, ingest_tasks, model_list
+
+parser = argparse.ArgumentParser(description='Convert CMIP6 ts_Amon and sftlf_fx files to chunked, compressed Zarr stores')
+parser.add_argument('--models', nargs='+', default=model_list, help='Models to convert (default: the full 33-model list)')
+parser.add_argument('--data-dir', default='/CMIP6/', help='Directory holding one sub-directory of NetCDF files per model')
+parser.add_argument('--out-dir', default='/CMIP6-zarr/', help='Directory to write the Zarr archive to (may be the same as --data-dir)')
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of files to convert at once (default: all cores)')
+parser.add_argument('--time-chunk', type=int, default=120,
+                    help='Time steps per chunk (default: 120); keep it a multiple of the --time-chunk of streaming runs')
+parser.add_argument('--lat-chunk', type=int, default=64, help='Latitudes per chunk (default: 64)')
+parser.add_argument('--lon-chunk', type=int, default=64, help='Longitudes per chunk (default: 64)')
+parser.add_argument('--level', type=int, default=5, help='zstd compression level, 1-9 (default: 5)')
+parser.add_argument('--overwrite', action='store_true', help='Convert files again even if their Zarr store already exists')
+args = parser.parse_args()
+options = {'time_chunk': args.time_chunk, 'lat_chunk': args.lat_chunk, 'lon_chunk': args.lon_chunk,
+           'level': args.level, 'overwrite': args.overwrite}
+
+# Convert every file on a pool of worker processes; one bad file only fails its own conversion
+
+tasks = ingest_tasks(args.models, args.data_dir, args.out_dir)
+print('---------------------------------------')
+print(f'Converting {len(tasks)} files on {args.workers} workers')
+print('---------------------------------------')
+failures = []
+with ProcessPoolExecutor(max_workers=args.workers) as pool:
+    futures = {pool.submit(ingest_file, in_file, out_file, **options): in_file for in_file, out_file in tasks}
+    for future in as_completed(futures):
+        try:
+            print(f'[ok] {future.result()}')
+        except Exception as error:
+            failures.append(futures[future])
+            print(f'[failed] {futures[future]}: {type(error).__name__}: {error}')
+
+# Send a summary to the screen
+
+print("-------------------------------------------------")
+print(f"Converted {len(tasks) - len(failures)} of {len(tasks)} files successfully")
+for in_file in failures:
+    print(f"  failed: {in_file}")
@@ -1 +1,15 @@
 from .cmip6_processing import *
+from .ensemble import *
+from .results import *
+from .regrid import *
+from .observations import *
+from .engine import *
+from .manifest import *
+from .synthetic import *
+from .instrument import *
+from .significance import *
+from .masks import *
+from .ingest import *
+from .figures import *
+from .summary import *
+from .memory import *
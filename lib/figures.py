@@ -0,0 +1,444 @@
+# Tables the figures are drawn from, keyed by name: (file in the output directory, index column)
+figure_tables = {'ens_averages': ('ens_averages.csv', 'Datetimes'),
+                 'ersst_eli': ('djf_ERSSTv5.csv', 0),
+                 'djf_data': ('djf_data.csv', 0),
+                 'niño_averages': ('monthly_niño_averaged.csv', 0),
+                 'ersst_niño': ('monthly_ERSST_niño.csv', 0),
+                 'niño_table': ('niño_3.4_table.csv', 0)}
+# Summary statistics cached next to a table (see load_summary), keyed by name: (table, whether to add ENSO categories);
+# each is loaded as '<name>' (per-column statistics) and '<name>_kde' (densities)
+figure_summaries = {'ens_summary': ('ens_averages', True),
+                    'ersst_summary': ('ersst_eli', False)}
+# Figures the renderer can draw, keyed by name (see register_figure)
+registered_figures = {}
+# Tables shared by every figure drawn in this process (set once per worker, see render_figures)
+_worker_tables = {}
+
+def register_figure(name, draw, tables, file_name=None, **options):
+    # Adds a figure to the renderer
+    # Inputs:
+    #  name: Name of the figure, used on the command line
+    #  draw: Function (ax, tables, **options) that draws the figure on a single Axes
+    #  tables: Names of the tables and summaries (keys of load_figure_tables) the figure needs; it is skipped if any
+    #          are missing
+    #  file_name: File the figure is saved to (defaults to '<name>.jpg')
+    #  options: Extra keyword arguments passed to draw, e.g. the ELI group of a boxplot
+    # Returns:
+    #  name: The name the figure was registered under
+
+    registered_figures[name] = {'draw': draw, 'tables': list(tables), 'file_name': file_name or f'{name}.jpg',
+                                'options': options}
+
+    return name
+
+def load_figure_tables(output_dir='/output', names=None):
+    # Reads the ensemble tables the figures are drawn from, and their cached summary statistics, once for all of them
+    # NOTE: A summary is only recalculated when its table has changed since the cache was written.
+    # Inputs:
+    #  output_dir: Directory holding the tables (see build_ensemble_tables)
+    #  names: Tables to read (defaults to every table in figure_tables); missing files are left out
+    # Returns:
+    #  tables: Dictionary of DataFrames keyed by table name, plus each available summary in figure_summaries
+
+    # Import necessary modules
+    import os
+    import pandas as pd
+    from .summary import load_summary
+
+    tables = {}
+    for name in names or figure_tables:
+        file_name, index_col = figure_tables[name]
+        path = os.path.join(output_dir, file_name)
+        if os.path.isfile(path):
+            tables[name] = pd.read_csv(path, index_col=index_col)
+    if 'ersst_eli' in tables:
+        tables['ersst_eli'].index.name = 'Datetimes'
+    for name, (table, categorize) in figure_summaries.items():
+        if table in tables:
+            file_name, index_col = figure_tables[table]
+            tables[name], tables[f'{name}_kde'] = load_summary(os.path.join(output_dir, file_name), tables[table],
+                                                               index_col, categorize=categorize)
+
+    return tables
+
+def _table_file(name):
+    # Gets the file a table or summary is read from, for messages about missing inputs
+    name = name[:-len('_kde')] if name.endswith('_kde') else name
+    return figure_tables[figure_summaries[name][0] if name in figure_summaries else name][0]
+
+def eli_groups(ens_summary):
+    # Lists the models in each ENSO category (La Niña-like, neutral and El Niño-like, see eli_category)
+    # Inputs:
+    #  ens_summary: Per-model statistics of ens_averages.csv with a 'category' column (see summary_stats)
+    # Returns:
+    #  groups: Dictionary mapping 'la_nina', 'neutral' and 'el_nino' to lists of model names
+
+    # Import necessary modules
+    from .summary import eli_categories
+
+    groups = {group: list(ens_summary.index[ens_summary['category'] == group]) for group in eli_categories}
+
+    return groups
+
+def _sorted_eli_group(tables, group):
+    # Gets the statistics of a group's models (plus ERSSTv5 for the El Niño- and La Niña-like groups), sorted by median ELI
+    import pandas as pd
+    ens_summary = tables['ens_summary']
+    group_stats = ens_summary.loc[eli_groups(ens_summary)[group]]
+    if group != 'neutral':
+        group_stats = pd.concat([group_stats, tables['ersst_summary'].loc[['ERSST_v5']]])
+    group_stats = group_stats[~group_stats.index.duplicated()]
+    return group_stats.sort_values('median', ascending=False, kind='stable')
+
+def _draw_boxes(ax, stats, palette):
+    # Draws one box per row of precomputed statistics, greying out ERSSTv5 and marking its median across the plot
+    import seaborn as sns
+    if stats.empty: # No model falls in the group, so there is nothing to draw
+        ax.set_xticks([])
+        ax.text(0.5, 0.5, 'No models in this group', ha='center', va='center', transform=ax.transAxes)
+        return
+    boxes = [{'label': label, 'med': row['median'], 'q1': row['q1'], 'q3': row['q3'], 'whislo': row['whislo'],
+              'whishi': row['whishi'], 'fliers': row['fliers']} for label, row in stats.iterrows()]
+    artists = ax.bxp(boxes, positions=range(len(boxes)), widths=0.8, patch_artist=True, manage_ticks=False,
+                     medianprops={'color': 'k'}, flierprops={'marker': 'o', 'markerfacecolor': 'none'})
+    for box, colour in zip(artists['boxes'], sns.color_palette(palette, len(boxes))):
+        box.set_facecolor(colour)
+    ax.set_xticks(range(len(boxes)), list(stats.index))
+    ax.set_xlim(-0.5, len(boxes) - 0.5)
+    if 'ERSST_v5' in stats.index:
+        ax.axhline(stats.loc['ERSST_v5', 'median'], ls='--', color='k')
+        artists['boxes'][list(stats.index).index('ERSST_v5')].set_facecolor('silver')
+
+def draw_eli_boxplot(ax, tables, group, palette, title, rotation=69):
+    # Draws the DJF ELI distribution of every model in an ELI group as boxplots, with ERSSTv5 for comparison
+    # Inputs:
+    #  ax: Axes to draw on
+    #  tables: Dictionary of tables from load_figure_tables
+    #  group: 'la_nina', 'neutral' or 'el_nino' (see eli_groups)
+    #  palette: Seaborn palette for the boxes
+    #  title: Figure title
+    #  rotation: Rotation of the model names on the x axis
+    # Returns:
+    #  ax: The Axes drawn on
+
+    _draw_boxes(ax, _sorted_eli_group(tables, group), palette)
+    ax.set_ybound(140, 220)
+    ax.set_title(title, size=14, loc='center')
+    ax.tick_params(axis='x', labelrotation=rotation)
+    ax.set(xlabel='Models', ylabel='ELI (°E)')
+
+    return ax
+
+def draw_niño_boxplot(ax, tables, group, palette, title, rotation=69, ylabel='Niño-3.4 (°C)', reverse=False):
+    # Draws the Niño 3.4 distribution of every model in an ELI group as boxplots, with ERSSTv5 for comparison
+    # Inputs:
+    #  ax: Axes to draw on
+    #  tables: Dictionary of tables from load_figure_tables
+    #  group: 'la_nina', 'neutral' or 'el_nino' (see eli_groups)
+    #  palette: Seaborn palette for the boxes
+    #  title: Figure title
+    #  rotation: Rotation of the model names on the x axis
+    #  ylabel: Label of the y axis
+    #  reverse: If True, order the models by name in reverse instead of by median ELI
+    # Returns:
+    #  ax: The Axes drawn on
+
+    # Import necessary modules
+    from .summary import summary_stats
+
+    niño_table = tables['niño_averages'][4:171].join(tables['ersst_niño'])
+    models = [model for model in _sorted_eli_group(tables, group).index if model in niño_table.columns]
+    group_stats, _ = summary_stats(niño_table[sorted(models, reverse=True) if reverse else models], categorize=False)
+    _draw_boxes(ax, group_stats, palette)
+    ax.set_ybound(-1.25, 1.25)
+    ax.set_title(title, size=14, loc='center')
+    ax.tick_params(axis='x', labelrotation=rotation)
+    ax.set(xlabel='Models', ylabel=ylabel)
+
+    return ax
+
+def rolling_mean(values, window, center=False, axis=-1):
+    # Calculates a running mean along one axis of an array with a cumulative-sum kernel, in a single pass
+    # NOTE: Gives the same result as pandas' rolling(window, center=center).mean() (NaN wherever the window is
+    #       incomplete or holds a NaN) without copying or transposing a DataFrame.
+    # Inputs:
+    #  values: NumPy array
+    #  window: Number of points in the running mean
+    #  center: If True, label each mean with the middle of its window instead of its last point
+    #  axis: Axis to run along
+    # Returns:
+    #  means: float64 array of the same shape as values
+
+    # Import necessary modules
+    import numpy as np
+
+    values = np.moveaxis(np.asarray(values, dtype=float), axis, -1)
+    missing = np.isnan(values)
+    padding = [(0, 0)]*(values.ndim - 1) + [(1, 0)]
+    sums = np.pad(np.cumsum(np.where(missing, 0, values), axis=-1), padding)
+    gaps = np.pad(np.cumsum(missing, axis=-1), padding)
+    window_sums = sums[..., window:] - sums[..., :-window]
+    complete = (gaps[..., window:] - gaps[..., :-window]) == 0
+    means = np.full(values.shape, np.nan)
+    offset = window//2 if center else window - 1
+    means[..., offset:offset + window_sums.shape[-1]] = np.where(complete, window_sums/window, np.nan)
+    means = np.moveaxis(means, -1, axis)
+
+    return means
+
+def block_reduce(values, shape):
+    # Averages a 2D array down to at most a given shape by taking the NaN-ignoring mean of blocks of cells
+    # Inputs:
+    #  values: 2D NumPy array
+    #  shape: Largest (rows, columns) to keep, e.g. the pixel size of the image the array is drawn into
+    # Returns:
+    #  reduced: 2D array of block means
+    #  row_edges, column_edges: Index of the first row/column of every block, plus the total length
+
+    # Import necessary modules
+    import numpy as np
+
+    edges = [np.unique(np.linspace(0, length, min(length, max(int(limit), 1)) + 1).astype(int))
+             for length, limit in zip(values.shape, shape)]
+    present = ~np.isnan(values)
+    sums, counts = np.where(present, values, 0), present.astype(float)
+    for axis, axis_edges in enumerate(edges):
+        sums = np.add.reduceat(sums, axis_edges[:-1], axis=axis)
+        counts = np.add.reduceat(counts, axis_edges[:-1], axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reduced = sums/counts
+    row_edges, column_edges = edges
+
+    return reduced, row_edges, column_edges
+
+def realization_model(name):
+    # Gets the model a realization's column or row label belongs to ('ts_Amon_<model>_...' or '<model>_<experiment>_...')
+    # Inputs:
+    #  name: Realization label, from realization_name or model_formatter
+    # Returns:
+    #  model: Model name
+    
+    model = (name[len('ts_Amon_'):] if name.startswith('ts_Amon_') else name).split('_')[0]
+
+    return model
+
+def _draw_lod_heatmap(ax, values, row_labels, column_labels, window, center, group_models, xticklabels, label, **limits):
+    # Smooths a realization x time array, optionally averages its rows by model, reduces it to the pixel size of the
+    # Axes and draws it as an image, so the cost depends on the image size rather than the size of the ensemble
+    import numpy as np
+    import pandas as pd
+    values = rolling_mean(values, window, center, axis=1)
+    if group_models:
+        models = pd.Index([realization_model(str(row)) for row in row_labels])
+        codes, row_labels = pd.factorize(models)
+        sums = np.zeros((len(row_labels), values.shape[1]))
+        counts = np.zeros_like(sums)
+        np.add.at(sums, codes, np.nan_to_num(values))
+        np.add.at(counts, codes, ~np.isnan(values))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = sums/counts
+    extent = ax.get_window_extent()
+    reduced, _, _ = block_reduce(values, (extent.height, extent.width))
+    image = ax.imshow(reduced, aspect='auto', interpolation='nearest', cmap='RdBu_r',
+                      extent=(-0.5, values.shape[1] - 0.5, values.shape[0] - 0.5, -0.5), **limits)
+    ax.figure.colorbar(image, ax=ax, label=label)
+    ticks = np.arange(0, values.shape[1], xticklabels)
+    ax.set_xticks(ticks, [column_labels[tick] for tick in ticks])
+    if group_models:
+        ax.set_yticks(range(len(row_labels)), list(row_labels))
+    else:
+        ax.set_yticks([])
+    return ax
+
+def draw_eli_heatmap(ax, tables, window=7, lod=True, group_models=False):
+    # Draws every realization's running-mean DJF ELI as a heatmap
+    # NOTE: In level-of-detail mode (the default) the running mean is a cumulative-sum kernel over the whole array
+    #       and the array is averaged down to the pixel size of the figure before drawing, so the figure costs the
+    #       same however many realizations and seasons there are; lod=False draws every cell with seaborn.
+    # Inputs:
+    #  ax: Axes to draw on
+    #  tables: Dictionary of tables from load_figure_tables
+    #  window: Number of seasons in the running mean
+    #  lod: If True, draw in level-of-detail mode
+    #  group_models: If True, average the realizations of each model into one row (level-of-detail mode only)
+    # Returns:
+    #  ax: The Axes drawn on
+
+    # Import necessary modules
+    import seaborn as sns
+
+    djf_data = tables['djf_data']
+    if lod:
+        _draw_lod_heatmap(ax, djf_data.to_numpy(dtype=float), djf_data.index, djf_data.columns, window, False,
+                          group_models, 40, 'ELI (°E)', vmax=180)
+    else:
+        sns.heatmap(djf_data.T.rolling(window).mean().T, cmap='RdBu_r', vmax=180, xticklabels=40,
+                    cbar_kws={'label': 'ELI (°E)'}, ax=ax)
+        ax.set(yticklabels=[])
+    ax.set_title('ELI Trend of Model Simulations from CMIP6', size=16)
+    ax.set_ylabel('CMIP6 Models', size=12)
+    ax.tick_params(axis='x', labelrotation=75)
+    ax.set_xlabel('Time', size=12)
+
+    return ax
+
+def draw_niño_heatmap(ax, tables, window=7, trim=15, lod=True, group_models=False):
+    # Draws every realization's centred running-mean Niño 3.4 index as a heatmap
+    # Inputs:
+    #  ax: Axes to draw on
+    #  tables: Dictionary of tables from load_figure_tables
+    #  window: Number of months in the running mean
+    #  trim: Number of months left off the end of the record
+    #  lod: If True, draw in level-of-detail mode (see draw_eli_heatmap)
+    #  group_models: If True, average the realizations of each model into one row (level-of-detail mode only)
+    # Returns:
+    #  ax: The Axes drawn on
+
+    # Import necessary modules
+    import seaborn as sns
+
+    niño_table = tables['niño_table']
+    if lod:
+        values = rolling_mean(niño_table.to_numpy(dtype=float), window, center=True, axis=0)[:len(niño_table) - trim].T
+        _draw_lod_heatmap(ax, values, niño_table.columns, niño_table.index[:len(niño_table) - trim], 1, False,
+                          group_models, 40, 'Niño-3.4 (°C)', vmin=-0.4, vmax=0.4)
+    else:
+        sns.heatmap(niño_table.rolling(window, center=True).mean().iloc[:len(niño_table) - trim].T, cmap='RdBu_r',
+                    vmax=0.4, vmin=-0.4, xticklabels=40, yticklabels=False, cbar_kws={'label': 'Niño-3.4 (°C)'}, ax=ax)
+    ax.set_title('Niño-3.4 Trend of Model Simulations from CMIP6')
+    ax.set_xlabel('Time')
+    ax.tick_params(axis='x', labelrotation=75)
+    ax.set_ylabel('CMIP6 Models')
+
+    return ax
+
+def draw_eli_kde(ax, tables):
+    # Draws the kernel density of every model's DJF ELI, coloured by ENSO category, against the ERSSTv5 median
+    # Inputs:
+    #  ax: Axes to draw on
+    #  tables: Dictionary of tables from load_figure_tables
+    # Returns:
+    #  ax: The Axes drawn on
+
+    ens_summary, ens_kde = tables['ens_summary'], tables['ens_summary_kde']
+    colours = {'la_nina': 'b', 'neutral': 'y', 'el_nino': 'r'}
+    for model, row in ens_summary.iterrows():
+        ax.plot(ens_kde.index, ens_kde[model], color=colours.get(row['category'], 'r'), zorder=-row['median'])
+    ax.axvline(x=tables['ersst_summary'].loc['ERSST_v5', 'median'], label='ERSST_v5 Mean', color='k', zorder=200)
+    ax.set_ylim(bottom=0)
+    ax.set_title('Kernel Density Distribution of ELI for Ensemble Members')
+    ax.set_xlabel('ELI (°E)')
+    ax.set_ylabel('')
+    ax.set_yticks([])
+
+    return ax
+
+def draw_eli_histogram(ax, tables):
+    # Draws the distribution of the models' mean DJF ELI against the ERSSTv5 mean
+    # Inputs:
+    #  ax: Axes to draw on
+    #  tables: Dictionary of tables from load_figure_tables
+    # Returns:
+    #  ax: The Axes drawn on
+
+    # Import necessary modules
+    import seaborn as sns
+
+    sns.histplot(data=tables['ens_summary']['mean'], kde=True, ax=ax)
+    ax.set_title('Distribution of Mean ELI values for CMIP6 Ensemble')
+    ax.axvline(label='ERSST_v5 Mean', x=tables['ersst_summary'].loc['ERSST_v5', 'mean'], color='r')
+    ax.set_xlabel('Mean ELI')
+
+    return ax
+
+register_figure('la_nina_boxplot', draw_eli_boxplot, ['ens_summary', 'ersst_summary'], group='la_nina', palette='winter_r',
+                title='ELI Distributions for La Niña-like Models')
+register_figure('el_nino_boxplot', draw_eli_boxplot, ['ens_summary', 'ersst_summary'], group='el_nino', palette='hot',
+                title='ELI Distributions for El Niño-like Models', rotation=90)
+register_figure('neutral_boxplot', draw_eli_boxplot, ['ens_summary', 'ersst_summary'], group='neutral', palette='YlGn',
+                title='Distribution of ELI Values for Neutral ENSO Models compared with ERSST_v5')
+register_figure('nino_en_boxplot', draw_niño_boxplot, ['ens_summary', 'ersst_summary', 'niño_averages', 'ersst_niño'],
+                group='el_nino', palette='hot', title='Niño-3.4 Distributions for El Niño-like Models', rotation=90)
+register_figure('nino_ln_boxplot', draw_niño_boxplot, ['ens_summary', 'ersst_summary', 'niño_averages', 'ersst_niño'],
+                group='la_nina', palette='winter_r', ylabel='Niño-3.4', reverse=True,
+                title='Distribution of Niño-3.4 Values for La Niña-like Models compared with ERSST_v5')
+register_figure('nino_neutral_boxplot', draw_niño_boxplot, ['ens_summary', 'ersst_summary', 'niño_averages', 'ersst_niño'],
+                group='neutral', palette='YlGn', ylabel='Niño-3.4',
+                title='Distribution of Niño-3.4 Values for Neutral ENSO Models compared with ERSST_v5')
+register_figure('full_ens_heatmap', draw_eli_heatmap, ['djf_data'])
+register_figure('full_ens_niño_heatmap', draw_niño_heatmap, ['niño_table'])
+register_figure('model_ens_heatmap', draw_eli_heatmap, ['djf_data'], group_models=True)
+register_figure('model_ens_niño_heatmap', draw_niño_heatmap, ['niño_table'], group_models=True)
+register_figure('ens_kde', draw_eli_kde, ['ens_summary', 'ens_summary_kde', 'ersst_summary'])
+register_figure('ens_hist', draw_eli_histogram, ['ens_summary', 'ersst_summary'])
+
+def render_figure(name, fig_dir, tables=None, dpi=200):
+    # Draws one registered figure on its own Agg canvas and saves it, without a display or pyplot's global state
+    # Inputs:
+    #  name: Key into registered_figures
+    #  fig_dir: Directory to save the figure to
+    #  tables: Dictionary of tables from load_figure_tables (defaults to the tables set for this worker process)
+    #  dpi: Resolution of the saved image
+    # Returns:
+    #  out_file: Path of the saved figure
+
+    # Import necessary modules
+    import os
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    entry = registered_figures[name]
+    tables = _worker_tables if tables is None else tables
+    figure = Figure(figsize=(10, 6), dpi=dpi) # Drawn at the saved resolution, so Axes sizes are in output pixels
+    FigureCanvasAgg(figure)
+    entry['draw'](figure.add_subplot(), tables, **entry['options'])
+    out_file = os.path.join(fig_dir, entry['file_name'])
+    figure.savefig(out_file, dpi=dpi, bbox_inches='tight')
+
+    return out_file
+
+def _set_worker_tables(tables):
+    _worker_tables.clear()
+    _worker_tables.update(tables)
+
+def render_figures(tables, fig_dir, names=None, workers=None, dpi=200):
+    # Renders a set of figures in parallel worker processes, yielding a report for each one as it finishes
+    # NOTE: The tables are sent to each worker once when it starts, not once per figure. Figures whose tables
+    #       are missing are reported as 'skipped'.
+    # Inputs:
+    #  tables: Dictionary of tables from load_figure_tables
+    #  fig_dir: Directory to save the figures to
+    #  names: Figures to render (defaults to every registered figure)
+    #  workers: Number of worker processes (defaults to the number of cores; 1 renders in this process)
+    #  dpi: Resolution of the saved images
+    # Returns:
+    #  Generator of dictionaries with the figure's 'name', 'status' ('ok', 'skipped' or 'failed'), 'file' and 'error'
+
+    # Import necessary modules
+    import os
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    os.makedirs(fig_dir, exist_ok=True)
+    ready = []
+    for name in names or registered_figures:
+        missing = [table for table in registered_figures[name]['tables'] if table not in tables]
+        if missing:
+            yield {'name': name, 'status': 'skipped', 'file': None,
+                   'error': f"missing {', '.join(sorted(set(_table_file(table) for table in missing)))}"}
+        else:
+            ready.append(name)
+    if workers == 1:
+        for name in ready:
+            try:
+                yield {'name': name, 'status': 'ok', 'file': render_figure(name, fig_dir, tables, dpi), 'error': None}
+            except Exception as error:
+                yield {'name': name, 'status': 'failed', 'file': None, 'error': f'{type(error).__name__}: {error}'}
+        return
+    needed = {table: tables[table] for name in ready for table in registered_figures[name]['tables']}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_tables, initargs=(needed,)) as pool:
+        futures = {pool.submit(render_figure, name, fig_dir, None, dpi): name for name in ready}
+        for future in as_completed(futures):
+            try:
+                yield {'name': futures[future], 'status': 'ok', 'file': future.result(), 'error': None}
+            except Exception as error:
+                yield {'name': futures[future], 'status': 'failed', 'file': None, 'error': f'{type(error).__name__}: {error}'}
@@ -0,0 +1,189 @@
+# Input formats the readers accept, in order of preference when a realization exists in both
+input_extensions = ['.zarr', '.nc']
+
+def is_zarr(path):
+    # Checks whether a path is a Zarr store rather than a NetCDF file
+    # Inputs:
+    #  path: Path to an input file or store
+    # Returns:
+    #  zarr_store: True for a '.zarr' path or a directory holding Zarr metadata
+
+    # Import necessary modules
+    import os
+
+    path = str(path).rstrip('/')
+    zarr_store = path.endswith('.zarr') or (os.path.isdir(path) and any(os.path.exists(os.path.join(path, name))
+                                                                         for name in ('zarr.json', '.zgroup')))
+
+    return zarr_store
+
+def open_data(path, chunks=None):
+    # Opens a NetCDF file or a Zarr store lazily, so every reader accepts either format
+    # NOTE: Zarr stores are opened through their consolidated metadata when they have it (ingest_file always
+    #       writes it), so opening costs one small read instead of one per array.
+    # Inputs:
+    #  path: Path to a '.nc' file or a '.zarr' store
+    #  chunks: Optional dask chunks, as for xr.open_dataset (None reads lazily without dask)
+    # Returns:
+    #  data: Lazily opened Dataset
+
+    # Import necessary modules
+    import xarray as xr
+
+    engine = 'zarr' if is_zarr(path) else None
+    data = xr.open_dataset(path, engine=engine, chunks=chunks)
+
+    return data
+
+def input_stem(path):
+    # Gets an input's file name without its '.nc' or '.zarr' extension
+    # Inputs:
+    #  path: Path to a '.nc' file or a '.zarr' store
+    # Returns:
+    #  stem: File name minus the extension
+
+    # Import necessary modules
+    import os
+
+    stem = os.path.basename(str(path).rstrip('/'))
+    for extension in input_extensions:
+        if stem.endswith(extension):
+            stem = stem[:-len(extension)]
+            break
+
+    return stem
+
+def input_size(path):
+    # Gets the size on disk of an input, summing every file of a Zarr store
+    # Inputs:
+    #  path: Path to a '.nc' file or a '.zarr' store
+    # Returns:
+    #  size: Size in bytes
+
+    # Import necessary modules
+    import os
+
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+    return size
+
+def find_inputs(directory, prefix):
+    # Finds the inputs in a directory whose names start with a prefix, in either format
+    # NOTE: When a realization exists as both NetCDF and Zarr (e.g. ingested next to the originals), the Zarr
+    #       store is used.
+    # Inputs:
+    #  directory: Directory to search
+    #  prefix: Start of the file names, e.g. 'ts_Amon' or 'sftlf_fx'
+    # Returns:
+    #  paths: Sorted list of paths, one per realization
+
+    # Import necessary modules
+    import os
+    import glob
+
+    found = {}
+    for extension in reversed(input_extensions):
+        for path in glob.glob(os.path.join(directory, f'{prefix}*{extension}')):
+            found[input_stem(path)] = path
+    paths = [found[stem] for stem in sorted(found)]
+
+    return paths
+
+def _compressor_encoding(level):
+    # Gets the encoding that compresses a Zarr array with Blosc/zstd, for either major version of zarr
+    import zarr
+    if int(zarr.__version__.split('.')[0]) >= 3:
+        from zarr.codecs import BloscCodec
+        return {'compressors': [BloscCodec(cname='zstd', clevel=level, shuffle='shuffle')]}
+    from numcodecs import Blosc
+    return {'compressor': Blosc(cname='zstd', clevel=level, shuffle=Blosc.SHUFFLE)}
+
+def ingest_file(in_file, out_file, time_chunk=120, lat_chunk=64, lon_chunk=64, level=5, overwrite=False):
+    # Converts a NetCDF input to a compressed, consolidated Zarr store chunked for reading long time series
+    # NOTE: CMIP6 files are usually chunked one global field per time step, so reading a band or a box for the whole
+    #       run touches every chunk. Here each chunk holds a small lat/lon tile over many time steps, so a tropical
+    #       band reads only the tiles it covers and a time series is a handful of chunks. The default time_chunk
+    #       matches the streaming block size of run_realization; keep the two aligned (or time_chunk a multiple of
+    #       the block size) so no chunk is decompressed more than once. The store is written next to its final path
+    #       and renamed into place, so a failed ingest never leaves a partial store behind.
+    # Inputs:
+    #  in_file: Path to a '.nc' file (a ts_Amon realization or a sftlf_fx land mask)
+    #  out_file: Path of the '.zarr' store to write
+    #  time_chunk: Time steps per chunk
+    #  lat_chunk, lon_chunk: Grid points per chunk along latitude and longitude
+    #  level: zstd compression level (1-9)
+    #  overwrite: If True, replace an existing store (by default an existing store is kept)
+    # Returns:
+    #  out_file: Path of the Zarr store
+
+    # Import necessary modules
+    import os
+    import uuid
+    import shutil
+    import warnings
+
+    if os.path.exists(out_file) and not overwrite:
+        return out_file
+    sizes = {'time': time_chunk, 'lat': lat_chunk, 'lon': lon_chunk}
+    with open_data(in_file) as data:
+        chunks = {dim: min(sizes[dim], data.sizes[dim]) for dim in data.dims if dim in sizes}
+        data = data.chunk(chunks)
+        encoding = {}
+        for name, variable in data.data_vars.items():
+            variable.encoding = {}
+            encoding[name] = {'chunks': tuple(chunks.get(dim, variable.sizes[dim]) for dim in variable.dims),
+                              **_compressor_encoding(level)}
+        for name in data.coords:
+            data[name].encoding.pop('chunks', None)
+            data[name].encoding.pop('preferred_chunks', None)
+        os.makedirs(os.path.dirname(os.path.abspath(out_file)), exist_ok=True)
+        temp_file = f'{out_file.rstrip("/")}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+        try:
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', message='Consolidated metadata') # Not yet in the Zarr v3 spec, but xarray reads it
+                data.to_zarr(temp_file, mode='w', encoding=encoding, consolidated=True)
+            if os.path.exists(out_file):
+                shutil.rmtree(out_file)
+            os.replace(temp_file, out_file)
+        finally:
+            if os.path.exists(temp_file):
+                shutil.rmtree(temp_file)
+
+    return out_file
+
+def ingest_tasks(models, data_dir='/CMIP6/', out_dir='/CMIP6-zarr/'):
+    # Lists the NetCDF files of each model that need converting, and the Zarr store each one is written to
+    # Inputs:
+    #  models: List of model names
+    #  data_dir: Directory holding one sub-directory of NetCDF files per model
+    #  out_dir: Directory to write '<model>/<file name>.zarr' stores to (can be data_dir itself)
+    # Returns:
+    #  tasks: List of (in_file, out_file) tuples, realizations first and then the land mask for each model
+
+    # Import necessary modules
+    import os
+    import glob
+
+    tasks = []
+    for model in models:
+        for prefix in ['ts_Amon', 'sftlf_fx']:
+            for in_file in sorted(glob.glob(os.path.join(data_dir, model, f'{prefix}*.nc'))):
+                tasks.append((in_file, os.path.join(out_dir, model, f'{input_stem(in_file)}.zarr')))
+
+    return tasks
+
+def ingest_model(model, data_dir='/CMIP6/', out_dir='/CMIP6-zarr/', **options):
+    # Converts a model's realizations and land mask to Zarr, laid out the same way as the NetCDF archive
+    # Inputs:
+    #  model: Model name, e.g. 'ACCESS-CM2'
+    #  data_dir: Directory holding one sub-directory of NetCDF files per model
+    #  out_dir: Directory to write '<model>/<file name>.zarr' stores to (can be data_dir itself)
+    #  options: Chunking and compression settings passed on to ingest_file
+    # Returns:
+    #  out_files: List of the model's Zarr stores
+
+    out_files = [ingest_file(in_file, out_file, **options) for in_file, out_file in ingest_tasks([model], data_dir, out_dir)]
+
+    return out_files
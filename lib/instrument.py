@@ -0,0 +1,195 @@
+from contextlib import contextmanager as _contextmanager
+
+def stage_log_file():
+    # Gets the JSON-lines file stage measurements are appended to ($CMIP6_STAGE_LOG; None turns logging off)
+    # Returns:
+    #  log_file: Path to the stage log, or None
+
+    # Import necessary modules
+    import os
+
+    log_file = os.environ.get('CMIP6_STAGE_LOG') or None
+
+    return log_file
+
+def set_stage_log(log_file):
+    # Sets the stage log for this process and any worker processes it starts afterwards
+    # Inputs:
+    #  log_file: Path to the JSON-lines stage log (None turns logging off)
+    # Returns:
+    #  log_file: The stage log that is now in use
+
+    # Import necessary modules
+    import os
+
+    if log_file:
+        os.environ['CMIP6_STAGE_LOG'] = os.path.abspath(log_file)
+    else:
+        os.environ.pop('CMIP6_STAGE_LOG', None)
+
+    return stage_log_file()
+
+def _read_counters():
+    # Reads this process's cumulative bytes read: 'read_bytes' from storage and 'rchar' through read calls (Linux only)
+    counters = {}
+    try:
+        with open('/proc/self/io') as io_file:
+            for line in io_file:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters.get('read_bytes'), counters.get('rchar')
+
+def _status_mib(field):
+    # Reads a memory field ('VmRSS', 'VmHWM') of this process from /proc/self/status in MiB (None where unavailable)
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1])/1024 # Reported in kB, which the kernel means as KiB
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _peak_rss_mib():
+    # Reads the process's peak resident set size since it started or since reset_peak_rss (ru_maxrss, in kB on Linux
+    # and bytes on macOS, where the peak can't be reset)
+    import sys
+    import resource
+    peak = _status_mib('VmHWM')
+    if peak is not None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/2**20 if sys.platform == 'darwin' else peak/1024
+
+def current_rss_mib():
+    # Gets the resident set size of this process right now
+    # Returns:
+    #  rss: Resident memory in MiB (the peak so far where the current value can't be read)
+
+    rss = _status_mib('VmRSS')
+    if rss is None:
+        rss = _peak_rss_mib()
+
+    return rss
+
+def reset_peak_rss():
+    # Resets this process's peak resident set size to its current size, so the next peak belongs to the work that follows
+    # NOTE: Linux only; elsewhere the peak stays the high-water mark since the process started.
+    # Returns:
+    #  reset: True if the peak was reset
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+
+    return True
+
+def _write_record(record, log_file):
+    # Appends a record as one line with a single write, so lines from parallel workers never interleave
+    import os
+    import json
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    descriptor = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(descriptor, (json.dumps(record) + '\n').encode())
+    finally:
+        os.close(descriptor)
+
+@_contextmanager
+def stage(name, **fields):
+    # Measures one stage of a realization run and appends it to the stage log as a JSON line
+    # NOTE: Costs a few system calls per stage, and nothing at all when no stage log is set. Peak RSS is the
+    #       process's high-water mark so far (or since reset_peak_rss), so in a long-lived worker it can come from an
+    #       earlier realization unless the run resets it, as memory-budget runs do.
+    # Inputs:
+    #  name: Stage name, e.g. 'open', 'mask', 'compute', 'write'
+    #  fields: Identifying fields to record with the stage, e.g. model, realization, diagnostic
+    # Returns:
+    #  Context manager; the record is written when the block exits (with status 'failed' if it raised)
+
+    # Import necessary modules
+    import os
+    import time
+    from datetime import datetime, timezone
+
+    log_file = stage_log_file()
+    if log_file is None:
+        yield
+        return
+    read_start, rchar_start = _read_counters()
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'failed'
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        read_end, rchar_end = _read_counters()
+        record = {'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'), 'pid': os.getpid(), 'stage': name,
+                  **fields, 'status': status, 'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+                  'read_bytes': None if read_start is None else read_end - read_start,
+                  'rchar': None if rchar_start is None else rchar_end - rchar_start,
+                  'peak_rss_mib': round(_peak_rss_mib(), 1)}
+        _write_record(record, log_file)
+
+def read_stage_logs(log_files):
+    # Reads one or more stage logs into a table
+    # Inputs:
+    #  log_files: Path (or list of paths) to JSON-lines stage logs
+    # Returns:
+    #  stages: DataFrame with one row per recorded stage
+
+    # Import necessary modules
+    import json
+    import pandas as pd
+
+    log_files = [log_files] if isinstance(log_files, str) else list(log_files)
+    records = []
+    for log_file in log_files:
+        with open(log_file) as log:
+            records.extend(json.loads(line) for line in log if line.strip())
+    stages = pd.DataFrame(records)
+
+    return stages
+
+def stage_report(log_files, top=10):
+    # Ranks the slowest models, stages and realizations across an ensemble run
+    # Inputs:
+    #  log_files: Path (or list of paths) to JSON-lines stage logs
+    #  top: Number of rows to keep in each ranking
+    # Returns:
+    #  report: Dictionary of DataFrames: 'models' (time per model), 'stages' (time per stage), 'realizations'
+    #          (slowest single stages), 'memory' (estimated vs. observed peak memory of memory-budget runs, worst
+    #          underestimates first) and 'failed' (stages that raised)
+
+    # Import necessary modules
+    import pandas as pd
+
+    stages = read_stage_logs(log_files)
+    for column in ['model', 'realization', 'read_bytes']:
+        if column not in stages:
+            stages[column] = None
+    stages['read_mib'] = stages['read_bytes'].astype(float)/2**20
+    summary = {'wall_s': 'sum', 'cpu_s': 'sum', 'read_mib': 'sum', 'peak_rss_mib': 'max'}
+    report = {'models': stages.groupby('model').agg({**summary, 'realization': 'nunique'})
+                              .sort_values('wall_s', ascending=False).head(top),
+              'stages': stages.groupby('stage').agg({**summary, 'status': 'count'}).rename(columns={'status': 'count'})
+                              .assign(mean_wall_s=lambda table: table['wall_s']/table['count'])
+                              .sort_values('wall_s', ascending=False).head(top),
+              'realizations': stages.sort_values('wall_s', ascending=False)
+                                    [['model', 'realization', 'stage', 'wall_s', 'cpu_s', 'read_mib', 'peak_rss_mib']].head(top),
+              'memory': pd.DataFrame(),
+              'failed': stages[stages['status'] != 'ok']}
+    if 'estimated_peak_mib' in stages:
+        budgets = stages[stages['stage'] == 'budget']
+        report['memory'] = (budgets[['model', 'realization', 'memory_limit_mib', 'estimated_peak_mib', 'peak_rss_mib', 'time_chunk', 'lat_chunk']]
+                            .assign(observed_vs_estimated=lambda table: table['peak_rss_mib']/table['estimated_peak_mib'])
+                            .sort_values('observed_vs_estimated', ascending=False).head(top))
+
+    return report
@@ -0,0 +1,286 @@
+from contextlib import contextmanager as _contextmanager
+
+def manifest_path(store_dir):
+    # Gets the path of the manifest that records what has been computed into a result store
+    # Inputs:
+    #  store_dir: Root directory of the result store
+    # Returns:
+    #  path: Path to the store's 'manifest.json'
+
+    # Import necessary modules
+    import os
+
+    path = os.path.join(store_dir, 'manifest.json')
+
+    return path
+
+def load_manifest(store_dir):
+    # Reads a result store's manifest
+    # Inputs:
+    #  store_dir: Root directory of the result store
+    # Returns:
+    #  manifest: Dictionary of manifest entries keyed by diagnostic and input file (empty for a new store)
+
+    # Import necessary modules
+    import os
+    import json
+
+    path = manifest_path(store_dir)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    return manifest
+
+def save_manifest(manifest, store_dir):
+    # Writes a result store's manifest, replacing the previous one in a single step
+    # Inputs:
+    #  manifest: Dictionary of manifest entries (see load_manifest)
+    #  store_dir: Root directory of the result store
+    # Returns:
+    #  path: Path to the written manifest
+
+    # Import necessary modules
+    import os
+    import json
+    import uuid
+
+    path = manifest_path(store_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+    return path
+
+@_contextmanager
+def update_manifest(store_dir):
+    # Reads, updates and rewrites a result store's manifest while holding a lock on it
+    # NOTE: Any number of processes (per-model scripts, ensemble runs) can record results in the same store at once;
+    #       each one re-reads the manifest inside the lock, so no process drops entries another has just written.
+    #       The lock is an fcntl lock on 'manifest.json.lock', so it is only taken on platforms that have fcntl.
+    # Inputs:
+    #  store_dir: Root directory of the result store
+    # Returns:
+    #  Context manager yielding the manifest (see load_manifest); it is saved when the block exits without raising
+
+    # Import necessary modules
+    import os
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    os.makedirs(store_dir, exist_ok=True)
+    with open(f'{manifest_path(store_dir)}.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            manifest = load_manifest(store_dir)
+            yield manifest
+            save_manifest(manifest, store_dir)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def file_signature(path, previous=None):
+    # Identifies the contents of an input file by its size, modification time and SHA-1 hash
+    # NOTE: Hashing reads the whole file, so the hash of a previous signature is reused when the size and mtime
+    #       haven't changed; a file that was only touched is hashed again and still recognised as unchanged.
+    #       A Zarr store is hashed over the names and contents of all its files, with its total size and the
+    #       latest mtime among them.
+    # Inputs:
+    #  path: Path to the file (or Zarr store directory)
+    #  previous: Signature recorded for the file earlier, if any
+    # Returns:
+    #  signature: Dictionary with the file's 'size', 'mtime' and 'sha1'
+
+    # Import necessary modules
+    import os
+    import hashlib
+
+    if os.path.isdir(path):
+        files = sorted(os.path.relpath(os.path.join(root, name), path) for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [None]
+    statuses = [os.stat(path if name is None else os.path.join(path, name)) for name in files]
+    signature = {'size': sum(status.st_size for status in statuses), 'mtime': max((status.st_mtime for status in statuses), default=0)}
+    if previous and previous['size'] == signature['size'] and previous['mtime'] == signature['mtime']:
+        signature['sha1'] = previous['sha1']
+        return signature
+    file_hash = hashlib.sha1()
+    for name in files:
+        if name is not None:
+            file_hash.update(name.encode())
+        with open(path if name is None else os.path.join(path, name), 'rb') as data:
+            for block in iter(lambda: data.read(16*1024*1024), b''):
+                file_hash.update(block)
+    signature['sha1'] = file_hash.hexdigest()
+
+    return signature
+
+def input_signatures(data_file, mask_file, previous=None):
+    # Gets the signatures of the files a realization's result is computed from
+    # NOTE: Take these before the files are opened, so a file replaced while the result is computed is recorded
+    #       with its old signature and picked up again by the next run.
+    # Inputs:
+    #  data_file: Path to the realization's ts_Amon file
+    #  mask_file: Path to the matching sftlf_fx land mask
+    #  previous: Manifest entry recorded for the realization earlier, if any (see file_signature)
+    # Returns:
+    #  signatures: Dictionary with the 'input' and 'mask' signatures (see file_signature)
+
+    previous = previous or {}
+    signatures = {'input': file_signature(data_file, previous.get('input')),
+                  'mask': file_signature(mask_file, previous.get('mask'))}
+
+    return signatures
+
+def diagnostic_params(diagnostic, options=None):
+    # Gets the settings that change a diagnostic's result, as recorded in the manifest
+    # NOTE: Settings that only change how the work is done (stream, time_chunk) are left out on purpose.
+    # Inputs:
+    #  diagnostic: Key into registered_diagnostics
+    #  options: Dictionary of run_realization keyword arguments (obs_file, diagnostic_options, ocean_threshold,
+    #           area_weighting, ...)
+    # Returns:
+    #  params: JSON-compatible dictionary of the diagnostic's settings
+
+    # Import necessary modules
+    import os
+    import json
+    from .engine import registered_diagnostics
+
+    options = options or {}
+    params = dict((options.get('diagnostic_options') or {}).get(diagnostic, {}))
+    if options.get('ocean_threshold') is not None:
+        params['ocean_threshold'] = options['ocean_threshold']
+    if registered_diagnostics.get(diagnostic, {}).get('weighted') and options.get('area_weighting'):
+        params['area_weighting'] = options['area_weighting']
+    if registered_diagnostics.get(diagnostic, {}).get('needs_obs') and options.get('obs_file'):
+        params['obs_file'] = os.path.abspath(options['obs_file'])
+    params = json.loads(json.dumps(params))
+
+    return params
+
+def _entry_key(diagnostic, data_file):
+    import os
+    return f'{diagnostic}|{os.path.abspath(data_file)}'
+
+def is_current(manifest, store_dir, diagnostic, model, data_file, mask_file, params=None):
+    # Checks whether a realization's stored result is still valid for its input, land mask and settings
+    # Inputs:
+    #  manifest: Dictionary of manifest entries (see load_manifest), updated in place with the new mtimes of files
+    #            that were touched but not changed; save it (see update_manifest) so they aren't hashed again
+    #  store_dir: Root directory of the result store
+    #  diagnostic: Name of the diagnostic, e.g. 'eli'
+    #  model: Model name
+    #  data_file: Path to the realization's ts_Amon file
+    #  mask_file: Path to the matching sftlf_fx land mask
+    #  params: Settings the result was computed with (see diagnostic_params)
+    # Returns:
+    #  current: True if the shard exists and nothing it was computed from has changed
+
+    # Import necessary modules
+    import os
+    from .ensemble import realization_name
+    from .results import shard_path
+
+    entry = manifest.get(_entry_key(diagnostic, data_file))
+    if entry is None or entry['params'] != (params or {}) or entry['model'] != model:
+        return False
+    if not os.path.isfile(shard_path(store_dir, diagnostic, model, realization_name(data_file))):
+        return False
+    for path, key in ((data_file, 'input'), (mask_file, 'mask')):
+        if path is None or not os.path.exists(path):
+            return False
+        signature = file_signature(path, entry[key])
+        if signature['sha1'] != entry[key]['sha1']:
+            return False
+        entry[key] = signature # Refresh the mtime of files that were touched but not changed
+
+    return True
+
+def record_result(manifest, store_dir, diagnostic, model, data_file, mask_file, params=None, signatures=None):
+    # Records in the manifest that a realization's result has been written to the store
+    # Inputs:
+    #  manifest: Dictionary of manifest entries (see load_manifest), updated in place
+    #  store_dir: Root directory of the result store
+    #  diagnostic: Name of the diagnostic, e.g. 'eli'
+    #  model: Model name
+    #  data_file: Path to the realization's ts_Amon file
+    #  mask_file: Path to the matching sftlf_fx land mask
+    #  params: Settings the result was computed with (see diagnostic_params)
+    #  signatures: Signatures of the input and land mask taken before the result was computed (see
+    #              input_signatures); worked out here if not given
+    # Returns:
+    #  entry: The manifest entry that was recorded
+
+    # Import necessary modules
+    import os
+    from .ensemble import realization_name
+    from .results import shard_path
+
+    key = _entry_key(diagnostic, data_file)
+    signatures = signatures or input_signatures(data_file, mask_file, manifest.get(key))
+    entry = {'diagnostic': diagnostic, 'model': model, 'file': os.path.abspath(data_file),
+             'mask_file': os.path.abspath(mask_file), 'params': params or {},
+             'input': signatures['input'], 'mask': signatures['mask'],
+             'shard': shard_path(store_dir, diagnostic, model, realization_name(data_file))}
+    manifest[key] = entry
+
+    return entry
+
+def invalidate(manifest, store_dir, diagnostic, data_file):
+    # Removes a realization's result from the store and the manifest
+    # Inputs:
+    #  manifest: Dictionary of manifest entries (see load_manifest), updated in place
+    #  store_dir: Root directory of the result store
+    #  diagnostic: Name of the diagnostic, e.g. 'eli'
+    #  data_file: Path to the realization's ts_Amon file
+    # Returns:
+    #  removed: True if there was a result to remove
+
+    # Import necessary modules
+    import os
+
+    entry = manifest.pop(_entry_key(diagnostic, data_file), None)
+    if entry is None:
+        return False
+    if os.path.isfile(entry['shard']):
+        os.remove(entry['shard'])
+
+    return True
+
+def pending_tasks(tasks, manifest, store_dir, options=None):
+    # Narrows a list of ensemble tasks down to the diagnostics whose results are missing or out of date
+    # NOTE: Results for inputs that changed, or that no longer exist, are removed from the store so they can't
+    #       end up in the consolidated tables.
+    # Inputs:
+    #  tasks: List of (diagnostics, model, data_file, mask_file) tuples (see ensemble_tasks)
+    #  manifest: Dictionary of manifest entries (see load_manifest), updated in place
+    #  store_dir: Root directory of the result store
+    #  options: Dictionary of run_realization keyword arguments (see diagnostic_params)
+    # Returns:
+    #  pending: List of tasks, each holding only the diagnostics that still need to be computed
+
+    # Import necessary modules
+    import os
+
+    pending, requested = [], set()
+    for diagnostics, model, data_file, mask_file in tasks:
+        stale = []
+        for diagnostic in diagnostics:
+            requested.add(diagnostic)
+            if not is_current(manifest, store_dir, diagnostic, model, data_file, mask_file, diagnostic_params(diagnostic, options)):
+                invalidate(manifest, store_dir, diagnostic, data_file)
+                stale.append(diagnostic)
+        if stale:
+            pending.append((tuple(stale), model, data_file, mask_file))
+    for entry in list(manifest.values()):
+        if entry['diagnostic'] in requested and not os.path.exists(entry['file']):
+            invalidate(manifest, store_dir, entry['diagnostic'], entry['file'])
+
+    return pending
@@ -0,0 +1,202 @@
+# Land fraction scale factor for each sftlf convention found in the CMIP6 archive
+sftlf_conventions = {'fraction': 1, 'max10': 10, 'percent': 100}
+# Land fractions read in this process, keyed by (mask file, size, mtime)
+_land_fractions = {}
+# Ocean masks built in this process, keyed by (model, mask file, size, mtime, threshold)
+_ocean_masks = {}
+# Area weights built in this process, keyed by (model, grid fingerprint, method)
+_area_weights = {}
+# Ways of weighting grid cells by area: 'coslat' from the latitudes alone, 'area' from the model's areacella/areacello
+# file when one matches the grid (falling back to 'coslat' otherwise)
+area_weight_methods = ['coslat', 'area']
+
+def land_fraction(sftlf):
+    # Normalizes a land area field to a fraction between 0 and 1, whatever convention the model used
+    # NOTE: Models store sftlf as a fraction (0-1), in tenths (0-10) or as a percentage (0-100); the convention is
+    #       taken from the largest value, since every global grid has some cells that are entirely land.
+    # Inputs:
+    #  sftlf: DataArray of land area (the 'sftlf' variable of a sftlf_fx file)
+    # Returns:
+    #  fraction: float32 DataArray of land fraction, with a 'convention' attribute of 'fraction', 'max10' or 'percent'
+
+    largest = float(sftlf.max())
+    convention = 'fraction' if largest <= 1 else 'max10' if largest <= 10 else 'percent'
+    fraction = (sftlf/sftlf_conventions[convention]).astype('float32').rename('land_fraction')
+    fraction.attrs = {'units': '1', 'convention': convention}
+
+    return fraction
+
+def load_land_fraction(mask_file):
+    # Reads a model's land mask once per process and normalizes it to a land fraction
+    # Inputs:
+    #  mask_file: Path to a sftlf_fx file or Zarr store
+    # Returns:
+    #  fraction: float32 DataArray of land fraction (see land_fraction)
+
+    # Import necessary modules
+    import os
+    from .ingest import open_data
+
+    status = os.stat(mask_file)
+    key = (os.path.abspath(mask_file), status.st_size, status.st_mtime)
+    if key not in _land_fractions:
+        with open_data(mask_file) as land_mask:
+            _land_fractions[key] = land_fraction(land_mask['sftlf'].load())
+    fraction = _land_fractions[key]
+
+    return fraction
+
+def ocean_mask(fraction, threshold=1.0):
+    # Thresholds a land fraction into a boolean ocean mask
+    # Inputs:
+    #  fraction: DataArray of land fraction between 0 and 1 (see land_fraction)
+    #  threshold: Cells with a land fraction below this count as ocean (1.0 keeps every cell that isn't entirely land)
+    # Returns:
+    #  mask: Boolean DataArray, True over ocean
+
+    mask = (fraction < threshold).rename('ocean_mask')
+    mask.attrs = {'threshold': threshold, 'convention': fraction.attrs.get('convention')}
+
+    return mask
+
+def load_ocean_mask(mask_file, model=None, threshold=1.0, cache_dir=None):
+    # Gets a model's boolean ocean mask, building it only once per mask file and threshold
+    # NOTE: Masks are also stored next to the regridding weights, so other processes and later runs load them without
+    #       reading the land mask again; a mask file that is replaced (new size or mtime) gets a new entry.
+    # Inputs:
+    #  mask_file: Path to the model's sftlf_fx file
+    #  model: Model name (defaults to the mask file name)
+    #  threshold: Land fraction below which a cell counts as ocean (see ocean_mask)
+    #  cache_dir: Directory to store masks in (defaults to regrid.default_cache_dir(); False disables the disk cache)
+    # Returns:
+    #  mask: Boolean DataArray on the model grid, True over ocean
+
+    # Import necessary modules
+    import os
+    import uuid
+    import hashlib
+    import numpy as np
+    import xarray as xr
+    from .regrid import default_cache_dir
+
+    status = os.stat(mask_file)
+    signature = (os.path.abspath(mask_file), status.st_size, status.st_mtime)
+    key = (model or os.path.basename(mask_file),) + signature + (threshold,)
+    if key not in _ocean_masks:
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        name = hashlib.sha1(repr(signature + (float(threshold),)).encode()).hexdigest()
+        mask_cache = os.path.join(cache_dir, f'ocean_mask_{name}.npz') if cache_dir else None
+        if mask_cache and os.path.isfile(mask_cache):
+            with np.load(mask_cache) as stored:
+                mask = xr.DataArray(stored['mask'], coords={'lat': stored['lat'], 'lon': stored['lon']}, dims=('lat', 'lon'),
+                                    name='ocean_mask', attrs={'threshold': threshold, 'convention': str(stored['convention'])})
+        else:
+            mask = ocean_mask(load_land_fraction(mask_file), threshold).transpose('lat', 'lon').reset_coords(drop=True)
+            if mask_cache:
+                os.makedirs(cache_dir, exist_ok=True)
+                temp_file = f'{mask_cache}.{os.getpid()}.{uuid.uuid4().hex}.npz'
+                np.savez(temp_file, mask=mask.values, lat=mask['lat'].values, lon=mask['lon'].values,
+                         convention=str(mask.attrs['convention']))
+                os.replace(temp_file, mask_cache)
+        _ocean_masks[key] = mask
+    mask = _ocean_masks[key]
+
+    return mask
+
+def apply_ocean_mask(data, mask, inplace=False):
+    # Sets land cells to NaN
+    # NOTE: With inplace=True, in-memory data is masked without copying the field, so every other reference to it
+    #       sees the mask too; only use it on an array the caller just read and owns (e.g. a block loaded from a
+    #       file), never on a view of someone else's data. Dask-backed data is always masked lazily.
+    # Inputs:
+    #  data: DataArray with 'lat' and 'lon' dimensions
+    #  mask: Boolean ocean mask on the same grid (see load_ocean_mask)
+    #  inplace: If True and data is a floating point array that isn't dask-backed, load it and overwrite land cells in place
+    # Returns:
+    #  masked: The masked DataArray
+
+    # Import necessary modules
+    import numpy as np
+
+    if inplace and data.chunks is None:
+        data = data.load() # A field still backed by its file is read now, so the mask lands in the array it keeps
+    if inplace and isinstance(data.data, np.ndarray) and np.issubdtype(data.dtype, np.floating):
+        land = ~mask.transpose('lat', 'lon').values
+        values = data.transpose(..., 'lat', 'lon').values
+        np.copyto(values, np.nan, where=land)
+        return data
+    masked = data.where(mask)
+
+    return masked
+
+def area_weights(lat, cell_area=None):
+    # Gets the relative area of each grid cell, for area-weighted means
+    # NOTE: On a regular lat/lon grid a cell's area is proportional to the cosine of its latitude, so the cos(lat)
+    #       weights are one value per latitude; a cell area field (areacella/areacello) also covers grids whose
+    #       cells differ in size along longitude. Either way only the relative sizes matter.
+    # Inputs:
+    #  lat: Latitude coordinate (DataArray)
+    #  cell_area: Optional DataArray of cell areas on (lat, lon)
+    # Returns:
+    #  weights: float64 DataArray of weights on (lat) or (lat, lon), with a 'source' attribute
+
+    # Import necessary modules
+    import numpy as np
+
+    if cell_area is None:
+        weights = np.cos(np.deg2rad(lat.astype('float64'))).clip(min=0).rename('area_weights')
+        weights.attrs = {'source': 'coslat'}
+    else:
+        weights = (cell_area.astype('float64')/float(cell_area.max())).rename('area_weights')
+        weights.attrs = {'source': cell_area.attrs.get('source', cell_area.name)}
+
+    return weights
+
+def _cell_area_file(mask_file, grid):
+    # Finds the areacella (or areacello) file next to a land mask whose grid matches it (None if there isn't one)
+    import os
+    from .ingest import find_inputs, open_data
+    from .regrid import grid_fingerprint
+    for variable in ['areacella', 'areacello']:
+        for area_file in find_inputs(os.path.dirname(os.path.abspath(mask_file)), f'{variable}_fx'):
+            with open_data(area_file) as area_data:
+                if variable in area_data and {'lat', 'lon'} <= set(area_data[variable].dims) and \
+                   grid_fingerprint(area_data['lat'].values, area_data['lon'].values) == grid:
+                    return area_file, variable
+    return None, None
+
+def load_area_weights(mask_file, model=None, method='coslat'):
+    # Gets a model's area weights, building them only once per model, grid and method in this process
+    # NOTE: Weights are built on the land mask's grid, so they line up with the ocean mask (see load_ocean_mask).
+    #       With method='area', the model directory is searched for an areacella_fx (then areacello_fx) file on
+    #       the same grid; when there is none the cos(lat) weights are used, as the 'source' attribute records.
+    # Inputs:
+    #  mask_file: Path to the model's sftlf_fx file
+    #  model: Model name (defaults to the mask file name)
+    #  method: One of area_weight_methods
+    # Returns:
+    #  weights: float64 DataArray of relative cell areas (see area_weights)
+
+    # Import necessary modules
+    import os
+    from .ingest import open_data
+    from .regrid import grid_fingerprint
+
+    if method not in area_weight_methods:
+        raise ValueError(f'Unknown area weighting "{method}"; choose from {area_weight_methods}')
+    fraction = load_land_fraction(mask_file)
+    grid = grid_fingerprint(fraction['lat'].values, fraction['lon'].values)
+    key = (model or os.path.basename(mask_file), grid, method)
+    if key not in _area_weights:
+        cell_area = None
+        if method == 'area':
+            area_file, variable = _cell_area_file(mask_file, grid)
+            if area_file is not None:
+                with open_data(area_file) as area_data:
+                    cell_area = area_data[variable].load().assign_coords(lat=fraction['lat'], lon=fraction['lon'])
+                cell_area.attrs['source'] = os.path.basename(area_file)
+        _area_weights[key] = area_weights(fraction['lat'], cell_area)
+    weights = _area_weights[key]
+
+    return weights
@@ -0,0 +1,86 @@
+# Peak memory of a streamed block as a multiple of the block's size as read: the block itself, its masked copy and
+# the temporaries of NaN-aware reductions and float64 arithmetic (measured at 1.2-3.1x with one block in memory at
+# a time; rounded up so the estimate stays an upper bound)
+block_overhead = 3.5
+# Peak memory of a block of ensemble_stats's streamed Welford update as a multiple of the block's size as read: the
+# block converted to float64, the running mean and sum of squared deviations, the float64 temporaries of the update and
+# the variance written out with the mean (measured at 10.5-12.7x for float32 input; rounded up like block_overhead)
+welford_overhead = 14
+# Allowance for the grid-sized arrays of a run (ocean mask, land fraction, area weights, regridding weights, time-mean
+# fields), in float64 copies of one global field
+grid_copies = 8
+# Allowance for everything else a run allocates that doesn't scale with the grid or the block, in MiB
+fixed_overhead_mib = 32
+
+def parse_memory_limit(limit):
+    # Reads a memory size such as '4G', '512MB' or '2.5GiB' (K, M, G and T are powers of 1024 with or without the 'i',
+    # so '512MB' is 512 MiB, the unit every memory figure is reported in; a bare number is bytes)
+    # Inputs:
+    #  limit: Size as a string or a number of bytes
+    # Returns:
+    #  limit_bytes: Size in bytes
+
+    # Import necessary modules
+    import re
+
+    if isinstance(limit, (int, float)):
+        return int(limit)
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([kmgt]?)(i?b)?\s*', str(limit).lower())
+    if match is None:
+        raise ValueError(f'Cannot read memory limit "{limit}"; give it as e.g. 4G or 512M')
+    limit_bytes = int(float(match.group(1))*1024**' kmgt'.index(match.group(2) or ' '))
+
+    return limit_bytes
+
+def plan_chunks(data_file, memory_limit, region=None, variable='ts', overhead=block_overhead):
+    # Chooses the block size to stream a realization in so its peak memory stays under a budget
+    # NOTE: Only the file's metadata is read. The estimate is the process's current memory (which includes anything
+    #       already loaded, e.g. observations), a fixed allowance for grid-sized arrays, and overhead times the
+    #       block, which assumes one block in memory at a time (dask's synchronous scheduler, or stream_index). The
+    #       block is as many whole time steps as fit, rounded down to whole chunks of a Zarr store so no chunk is
+    #       decompressed twice; when not even one time step fits, it is split into bands of latitude as well. Bands
+    #       only bound the peak of diagnostics that reduce each grid point or band on its own (the field diagnostics);
+    #       run_realization refuses to band the blockwise index diagnostics, which need whole time steps.
+    # Inputs:
+    #  data_file: Path to a ts_Amon file or Zarr store
+    #  memory_limit: Memory budget for the process, as a size string or bytes (see parse_memory_limit)
+    #  region: Optional dictionary of select_region bounds the run reads, e.g. eli_region
+    #  variable: Variable that is streamed
+    #  overhead: Peak memory of a block as a multiple of its size as read (block_overhead for run_realization,
+    #            welford_overhead for ensemble_stats)
+    # Returns:
+    #  plan: Dictionary with 'time_chunk', 'lat_chunk' (None for whole time steps), 'memory_limit_mib', 'baseline_mib'
+    #        (memory in use before the run) and 'estimated_peak_mib'
+
+    # Import necessary modules
+    import math
+    from .cmip6_processing import select_region
+    from .ingest import open_data
+    from .instrument import current_rss_mib
+
+    with open_data(data_file) as data:
+        field = data[variable]
+        grid_mib = data.sizes['lat']*data.sizes['lon']*8/2**20
+        if region is not None:
+            field = select_region(field, **region)
+        steps, rows = field.sizes['time'], field.sizes['lat']
+        step_mib = overhead*field.dtype.itemsize*math.prod(size for dim, size in field.sizes.items() if dim != 'time')/2**20
+        preferred = field.encoding.get('preferred_chunks', {}).get('time')
+    limit_mib = parse_memory_limit(memory_limit)/2**20
+    baseline_mib = current_rss_mib()
+    fixed_mib = baseline_mib + fixed_overhead_mib + grid_copies*grid_mib
+    available_mib = limit_mib - fixed_mib
+    time_chunk, lat_chunk = min(steps, int(available_mib//step_mib)) if available_mib > 0 else 0, None
+    if time_chunk < 1:
+        lat_chunk = int(available_mib//(step_mib/rows)) if available_mib > 0 else 0
+        if lat_chunk < 1:
+            raise MemoryError(f'{data_file} needs at least {fixed_mib + step_mib/rows:.0f} MiB '
+                              f'to stream, over the {limit_mib:.0f} MiB limit ({baseline_mib:.0f} MiB already in use)')
+        time_chunk = 1
+    elif preferred and preferred < time_chunk < steps:
+        time_chunk -= time_chunk % preferred
+    block_mib = step_mib*time_chunk*(1 if lat_chunk is None else lat_chunk/rows)
+    plan = {'time_chunk': time_chunk, 'lat_chunk': lat_chunk, 'memory_limit_mib': round(limit_mib, 1),
+            'baseline_mib': round(baseline_mib, 1), 'estimated_peak_mib': round(fixed_mib + block_mib, 1)}
+
+    return plan
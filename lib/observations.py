@@ -0,0 +1,35 @@
+# Observations already loaded in this process, keyed by (file, season)
+_observations = {}
+
+def load_observations(obs_file='/chinook2/nathane1/Thesis/sst.mnmean.nc', season='DJF'):
+    # Loads the observational SSTs the ensemble calculators compare against, once per process
+    # NOTE: Only the pieces the calculators need are kept in memory: the grid, the seasonal field in Kelvin and its
+    #       climatology. Later calls with the same file and season return the same Dataset without touching disk.
+    # Inputs:
+    #  obs_file: Observational SST file (e.g. ERSSTv5 'sst.mnmean.nc', in °C)
+    #  season: Season to keep (see season_months)
+    # Returns:
+    #  obs: Dataset on the observational grid with
+    #   - 'sst': Seasonal SSTs in Kelvin, with 'YYYY-MM' time labels so they line up with any model calendar
+    #   - 'climatology': Time mean of 'sst'
+    #   and the file, season and first/last month in its attributes
+
+    # Import necessary modules
+    import os
+    import xarray as xr
+    from .cmip6_processing import relabel_months, select_season, time_fields
+
+    key = (os.path.abspath(obs_file), season)
+    if key in _observations:
+        return _observations[key]
+
+    with xr.open_dataset(obs_file) as obs_data:
+        season_ssts = select_season(time_fields(obs_data['sst']), season).load()
+    kelvin_ssts = relabel_months(season_ssts + 273.15)
+    kelvin_ssts.attrs['units'] = 'K'
+    obs = xr.Dataset({'sst': kelvin_ssts, 'climatology': kelvin_ssts.mean('time', keep_attrs=True)})
+    obs.attrs.update({'file': key[0], 'season': str(season),
+                      'first_month': str(kelvin_ssts['time'].values[0]), 'last_month': str(kelvin_ssts['time'].values[-1])})
+    _observations[key] = obs
+
+    return obs
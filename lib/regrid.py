@@ -0,0 +1,168 @@
+# Weights computed in this process, keyed by (source fingerprint, target fingerprint)
+_weights_cache = {}
+
+def grid_fingerprint(lat, lon):
+    # Identifies a rectilinear grid by its coordinate values
+    # Inputs:
+    #  lat: Latitude coordinate values
+    #  lon: Longitude coordinate values
+    # Returns:
+    #  fingerprint: Short hex string that is the same for any two grids with identical coordinates
+
+    # Import necessary modules
+    import hashlib
+    import numpy as np
+
+    grid_hash = hashlib.sha1()
+    for coordinate in (lat, lon):
+        values = np.ascontiguousarray(np.asarray(coordinate, dtype='float64'))
+        grid_hash.update(str(values.shape).encode())
+        grid_hash.update(values.tobytes())
+    fingerprint = grid_hash.hexdigest()[:16]
+
+    return fingerprint
+
+def default_cache_dir():
+    # Gets the directory regridding weights are stored in ($CMIP6_REGRID_CACHE, or ~/.cache/cmip6_processing/regrid)
+    # Returns:
+    #  cache_dir: Path to the weight cache directory
+
+    # Import necessary modules
+    import os
+
+    cache_dir = os.environ.get('CMIP6_REGRID_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'cmip6_processing', 'regrid'))
+
+    return cache_dir
+
+def _linear_weights_1d(source, target):
+    # Finds the two neighbouring source points and their linear interpolation weights for every target point
+    import numpy as np
+
+    source = np.asarray(source, dtype='float64')
+    target = np.asarray(target, dtype='float64')
+    if len(source) < 2:
+        raise ValueError('Need at least two source points along each axis to interpolate')
+    order = np.argsort(source)
+    sorted_source = source[order]
+    position = np.clip(np.searchsorted(sorted_source, target, side='right') - 1, 0, len(source) - 2)
+    upper_weight = (target - sorted_source[position]) / (sorted_source[position + 1] - sorted_source[position])
+    inside = (target >= sorted_source[0]) & (target <= sorted_source[-1])
+
+    return order[position], order[position + 1], 1 - upper_weight, upper_weight, inside
+
+def bilinear_weights(source_lat, source_lon, target_lat, target_lon):
+    # Builds the sparse matrix that bilinearly interpolates a (lat, lon) field from one rectilinear grid to another
+    # NOTE: Equivalent to interp_like(...) with the default linear method; target points outside the source grid
+    #       are NaN. Neighbours with zero weight are left out, so an exact grid match never picks up a NaN neighbour.
+    # Inputs:
+    #  source_lat, source_lon: Coordinates of the grid being interpolated from
+    #  target_lat, target_lon: Coordinates of the grid being interpolated to
+    # Returns:
+    #  weights: scipy.sparse CSR matrix of shape (target points, source points)
+    #  inside: Boolean array over target points, False where the target lies outside the source grid
+
+    # Import necessary modules
+    import numpy as np
+    from scipy import sparse
+
+    lat_index = _linear_weights_1d(source_lat, target_lat)
+    lon_index = _linear_weights_1d(source_lon, target_lon)
+    n_source_lon = len(source_lon)
+    n_target_lat, n_target_lon = len(target_lat), len(target_lon)
+    target_rows = np.arange(n_target_lat*n_target_lon).reshape(n_target_lat, n_target_lon)
+
+    rows, columns, values = [], [], []
+    for lat_corner, lat_weight in ((lat_index[0], lat_index[2]), (lat_index[1], lat_index[3])):
+        for lon_corner, lon_weight in ((lon_index[0], lon_index[2]), (lon_index[1], lon_index[3])):
+            rows.append(target_rows.ravel())
+            columns.append((lat_corner[:, None]*n_source_lon + lon_corner[None, :]).ravel())
+            values.append((lat_weight[:, None]*lon_weight[None, :]).ravel())
+    rows, columns, values = np.concatenate(rows), np.concatenate(columns), np.concatenate(values)
+    inside = (lat_index[4][:, None] & lon_index[4][None, :]).ravel()
+    keep = (values != 0) & inside[rows]
+    weights = sparse.csr_matrix((values[keep], (rows[keep], columns[keep])),
+                                shape=(n_target_lat*n_target_lon, len(source_lat)*n_source_lon))
+
+    return weights, inside
+
+def regrid_weights(source_lat, source_lon, target_lat, target_lon, cache_dir=None):
+    # Gets bilinear weights for a (source grid, target grid) pair, computing them only if they aren't cached
+    # NOTE: Weights are kept in memory for the life of the process and stored on disk keyed by both grid
+    #       fingerprints, so repeated ensemble passes never regenerate them.
+    # Inputs:
+    #  source_lat, source_lon: Coordinates of the grid being interpolated from
+    #  target_lat, target_lon: Coordinates of the grid being interpolated to
+    #  cache_dir: Directory to store weights in (defaults to default_cache_dir(); False disables the disk cache)
+    # Returns:
+    #  weights: scipy.sparse CSR matrix of shape (target points, source points)
+    #  inside: Boolean array over target points, False where the target lies outside the source grid
+
+    # Import necessary modules
+    import os
+    import uuid
+    import numpy as np
+    from scipy import sparse
+
+    key = (grid_fingerprint(source_lat, source_lon), grid_fingerprint(target_lat, target_lon))
+    if key in _weights_cache:
+        return _weights_cache[key]
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    weight_file = os.path.join(cache_dir, f'{key[0]}_to_{key[1]}.npz') if cache_dir else None
+    if weight_file and os.path.isfile(weight_file):
+        with np.load(weight_file) as stored:
+            weights = sparse.csr_matrix((stored['data'], stored['indices'], stored['indptr']), shape=tuple(stored['shape']))
+            inside = stored['inside']
+    else:
+        weights, inside = bilinear_weights(source_lat, source_lon, target_lat, target_lon)
+        if weight_file:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_file = f'{weight_file}.{os.getpid()}.{uuid.uuid4().hex}.npz'
+            np.savez(temp_file, data=weights.data, indices=weights.indices, indptr=weights.indptr,
+                     shape=np.array(weights.shape), inside=inside)
+            os.replace(temp_file, weight_file)
+    _weights_cache[key] = (weights, inside)
+
+    return weights, inside
+
+def regrid_like(data, target, cache_dir=None):
+    # Bilinearly interpolates data onto the lat/lon grid of a target dataset with cached weights;
+    # a drop-in replacement for data.interp_like(target) on rectilinear grids
+    # NOTE: Every time step is regridded in one sparse matrix product; dask-backed input stays lazy, and input
+    #       chunked along lat/lon (e.g. a time mean of blocks split into bands of latitude) is joined into whole
+    #       fields first.
+    # Inputs:
+    #  data: DataArray (or Dataset) with 'lat' and 'lon' dimensions; Dataset variables without both are dropped
+    #  target: DataArray or Dataset with the 'lat' and 'lon' coordinates to interpolate to
+    #  cache_dir: Directory to store weights in (see regrid_weights)
+    # Returns:
+    #  regridded: The input data on the target grid
+
+    # Import necessary modules
+    import numpy as np
+    import xarray as xr
+
+    if isinstance(data, xr.Dataset):
+        return xr.Dataset({name: regrid_like(variable, target, cache_dir) for name, variable in data.data_vars.items()
+                           if 'lat' in variable.dims and 'lon' in variable.dims}, attrs=data.attrs)
+
+    if data.chunks is not None:
+        data = data.chunk({'lat': -1, 'lon': -1})
+    target_lat, target_lon = target['lat'].values, target['lon'].values
+    weights, inside = regrid_weights(data['lat'].values, data['lon'].values, target_lat, target_lon, cache_dir)
+
+    def apply_weights(values):
+        lead_shape = values.shape[:-2]
+        flat_values = values.reshape(-1, values.shape[-2]*values.shape[-1]).astype('float64')
+        regridded_values = np.asarray(weights @ flat_values.T).T
+        regridded_values[:, ~inside] = np.nan
+        return regridded_values.reshape(lead_shape + (len(target_lat), len(target_lon)))
+
+    regridded = xr.apply_ufunc(apply_weights, data, input_core_dims=[['lat', 'lon']], output_core_dims=[['lat', 'lon']],
+                               exclude_dims={'lat', 'lon'}, dask='parallelized', output_dtypes=['float64'],
+                               dask_gufunc_kwargs={'output_sizes': {'lat': len(target_lat), 'lon': len(target_lon)}},
+                               keep_attrs=True)
+    regridded = regridded.assign_coords(lat=target_lat, lon=target_lon).transpose(*data.dims)
+
+    return regridded
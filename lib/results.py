@@ -0,0 +1,268 @@
+def shard_path(store_dir, diagnostic, model, realization):
+    # Gets the path of the shard holding one realization's result for one diagnostic
+    # Inputs:
+    #  store_dir: Root directory of the result store
+    #  diagnostic: Name of the diagnostic, e.g. 'eli'
+    #  model: Model name
+    #  realization: Realization name (file name of the input without extension)
+    # Returns:
+    #  path: Path to the realization's NetCDF shard
+
+    # Import necessary modules
+    import os
+
+    path = os.path.join(store_dir, diagnostic, model, f'{realization}.nc')
+
+    return path
+
+def blocks_path(store_dir, model, realization):
+    # Gets the path of the CSV file a streaming run appends each block's indices to while it runs
+    # NOTE: The file only shows how far an unfinished run got; it is removed once the realization's shards are written.
+    # Inputs:
+    #  store_dir: Root directory of the result store
+    #  model: Model name
+    #  realization: Realization name (file name of the input without extension)
+    # Returns:
+    #  path: Path to the realization's blocks file
+
+    # Import necessary modules
+    import os
+
+    path = os.path.join(store_dir, 'blocks', model, f'{realization}.csv')
+
+    return path
+
+def write_shard(result, store_dir, diagnostic, model, realization, column=None):
+    # Writes one realization's result to its own NetCDF shard in the result store
+    # NOTE: Shards are written to a temporary file and renamed into place, so any number of processes can write
+    #       to the same store at once and a rerun simply replaces the realization's previous shard.
+    # Inputs:
+    #  result: pandas Series (e.g. indexed by 'YYYY-MM' labels) or DataArray holding the realization's result
+    #  store_dir: Root directory of the result store
+    #  diagnostic: Name of the diagnostic, e.g. 'eli'
+    #  model: Model name
+    #  realization: Realization name (file name of the input without extension)
+    #  column: Column name to use for the realization in consolidated tables (defaults to the result's name)
+    # Returns:
+    #  path: Path to the written shard
+
+    # Import necessary modules
+    import os
+    import uuid
+    import xarray as xr
+
+    if column is None:
+        column = realization if result.name is None else str(result.name)
+    if not isinstance(result, xr.DataArray):
+        result = xr.DataArray(result.values, dims=['time'], coords={'time': [str(label) for label in result.index]})
+    shard = result.rename('result').to_dataset()
+    shard.attrs.update({'diagnostic': diagnostic, 'model': model, 'realization': realization, 'column': column})
+
+    path = shard_path(store_dir, diagnostic, model, realization)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    try:
+        shard.to_netcdf(temp_path, mode='w')
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return path
+
+def read_shards(store_dir, diagnostic):
+    # Reads every shard stored for a diagnostic
+    # Inputs:
+    #  store_dir: Root directory of the result store (or a list of store directories to combine)
+    #  diagnostic: Name of the diagnostic, e.g. 'eli'
+    # Returns:
+    #  shards: List of loaded shard Datasets, sorted by model and column name
+
+    # Import necessary modules
+    import os
+    import glob
+    import xarray as xr
+
+    store_dirs = [store_dir] if isinstance(store_dir, str) else list(store_dir)
+    shards = []
+    for directory in store_dirs:
+        for path in sorted(glob.glob(os.path.join(directory, diagnostic, '*', '*.nc'))):
+            with xr.open_dataset(path) as shard:
+                shards.append(shard.load())
+    shards.sort(key=lambda shard: (shard.attrs['model'], shard.attrs['column']))
+
+    return shards
+
+def consolidate_table(store_dir, diagnostic):
+    # Builds the wide (time x realization) table for a time-series diagnostic from its shards
+    # Inputs:
+    #  store_dir: Root directory of the result store (or a list of store directories to combine)
+    #  diagnostic: Name of the diagnostic, e.g. 'eli'
+    # Returns:
+    #  table: DataFrame indexed by 'YYYY-MM' labels with one column per realization
+    #  column_models: Dictionary mapping each column to the model it came from
+
+    # Import necessary modules
+    import pandas as pd
+
+    shards = read_shards(store_dir, diagnostic)
+    columns = {shard.attrs['column']: shard['result'].to_series() for shard in shards}
+    column_models = {shard.attrs['column']: shard.attrs['model'] for shard in shards}
+    table = pd.DataFrame(columns).sort_index()
+    table.index.name = None
+
+    return table, column_models
+
+def build_composite(store_dir, diagnostic):
+    # Builds the ensemble composite for a field diagnostic (e.g. 'bias') from its shards
+    # NOTE: The realizations of each model are averaged together, which is the same as computing the field from the
+    #       model's realization mean, since every field diagnostic is linear in the SSTs.
+    # Inputs:
+    #  store_dir: Root directory of the result store (or a list of store directories to combine)
+    #  diagnostic: Name of the diagnostic, e.g. 'bias'
+    # Returns:
+    #  composite: Dataset with one '<model>-ts' variable per model, as written by the *_ens_calculator functions
+
+    # Import necessary modules
+    import xarray as xr
+
+    model_fields = {}
+    for shard in read_shards(store_dir, diagnostic):
+        model_fields.setdefault(shard.attrs['model'], []).append(shard['result'])
+    composite = xr.Dataset({f'{model}-ts': xr.concat(fields, dim='realization').mean('realization')
+                            for model, fields in model_fields.items()})
+
+    return composite
+
+def build_ensemble_tables(store_dir, output_dir, diagnostics=('eli',)):
+    # Consolidates the result store into the tables the plotting and significance testing scripts read
+    # Inputs:
+    #  store_dir: Root directory of the result store (or a list of store directories to combine)
+    #  output_dir: Directory to write the tables to
+    #  diagnostics: Diagnostics to consolidate
+    # Returns:
+    #  out_files: List of the tables that were written
+    #  Writes, per diagnostic, the monthly table ('ELI_table.csv' / 'niño_3.4_table.csv'); for ELI also
+    #  'djf_data.csv' (realizations x DJF seasons), 'ens_averages.csv' (DJF seasons x models) and its summary cache
+    #  'ens_averages.summary.json' (see load_summary); field diagnostics
+    #  are written as composites ('composite_bias.nc', 'composite_change.nc', 'djf_zonal_averages.nc')
+
+    # Import necessary modules
+    import os
+    from .cmip6_processing import seasonal_means
+    from .summary import load_summary, summary_path
+
+    table_files = {'eli': 'ELI_table.csv', 'niño3.4': 'niño_3.4_table.csv'}
+    composite_files = {'bias': 'composite_bias.nc', 'change': 'composite_change.nc', 'zonal': 'djf_zonal_averages.nc'}
+    out_files = []
+    for diagnostic in diagnostics:
+        if diagnostic in composite_files:
+            composite = build_composite(store_dir, diagnostic)
+            if composite.data_vars:
+                out_files.append(os.path.join(output_dir, composite_files[diagnostic]))
+                composite.to_netcdf(out_files[-1], mode='w')
+            continue
+        table, column_models = consolidate_table(store_dir, diagnostic)
+        if table.empty:
+            continue
+        out_files.append(os.path.join(output_dir, table_files.get(diagnostic, f'{diagnostic}_table.csv')))
+        table.to_csv(out_files[-1])
+        if diagnostic == 'eli':
+            djf_table = seasonal_means(table, 'DJF')
+            out_files.append(os.path.join(output_dir, 'djf_data.csv'))
+            djf_table.T.to_csv(out_files[-1])
+            ens_averages = djf_table.T.groupby(column_models).mean().T
+            ens_averages.index.name = 'Datetimes'
+            out_files.append(os.path.join(output_dir, 'ens_averages.csv'))
+            ens_averages.to_csv(out_files[-1])
+            load_summary(out_files[-1], ens_averages, 'Datetimes') # Refresh the figures' cached per-model statistics
+            out_files.append(summary_path(out_files[-1]))
+
+    return out_files
+
+def partition_store_dir(store_dir, partition, partitions):
+    # Gets the result store one partition of a sharded ensemble run writes to
+    # NOTE: Every partition has a store (and manifest) of its own, so nodes never write to the same files and a store
+    #       can sit on node-local disk and be copied back afterwards.
+    # Inputs:
+    #  store_dir: Root directory of the ensemble's result store
+    #  partition: Index of the partition (see parse_partition)
+    #  partitions: Number of partitions
+    # Returns:
+    #  path: '<store_dir>/partitions/<partition>-of-<partitions>'
+
+    # Import necessary modules
+    import os
+
+    path = os.path.join(store_dir, 'partitions', f'{partition}-of-{partitions}')
+
+    return path
+
+def save_partition_report(partition_dir, report):
+    # Writes the report of a partition's run into its store, marking the partition as finished
+    # Inputs:
+    #  partition_dir: The partition's result store (see partition_store_dir)
+    #  report: JSON-compatible dictionary ('partition', 'partitions', 'diagnostics', 'tasks', 'failures', ...)
+    # Returns:
+    #  path: Path to the written 'partition.json'
+
+    # Import necessary modules
+    import os
+    import json
+    import uuid
+
+    path = os.path.join(partition_dir, 'partition.json')
+    os.makedirs(partition_dir, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as report_file:
+        json.dump(report, report_file, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+    return path
+
+def merge_partitions(store_dir, output_dir, partitions=None, diagnostics=None, allow_partial=False):
+    # Combines the result stores of a sharded ensemble run into the ensemble tables and composites
+    # NOTE: Refuses to merge until every partition has written its report (see save_partition_report), unless
+    #       allow_partial is set, so a node that died can't silently leave realizations out of the tables.
+    # Inputs:
+    #  store_dir: Root directory of the ensemble's result store
+    #  output_dir: Directory to write the tables to
+    #  partitions: Number of partitions of the run to merge (needed only when runs with different counts exist)
+    #  diagnostics: Diagnostics to consolidate (defaults to every diagnostic the partitions ran)
+    #  allow_partial: If True, merge whichever partitions have finished
+    # Returns:
+    #  out_files: List of the tables that were written (see build_ensemble_tables)
+    #  reports: List of the partition reports that were merged, in partition order
+
+    # Import necessary modules
+    import os
+    import re
+    import json
+    import glob
+
+    found = {}
+    for path in glob.glob(os.path.join(store_dir, 'partitions', '*-of-*')):
+        match = re.fullmatch(r'(\d+)-of-(\d+)', os.path.basename(path))
+        if match:
+            found.setdefault(int(match.group(2)), {})[int(match.group(1))] = path
+    if partitions is None:
+        if len(found) != 1:
+            raise ValueError(f'Found partitioned runs with {sorted(found) or "no"} partitions in {store_dir}; choose one')
+        partitions = next(iter(found))
+    partition_dirs = found.get(partitions, {})
+    reports, missing = [], []
+    for partition in range(partitions):
+        report_file = os.path.join(partition_dirs.get(partition, ''), 'partition.json')
+        if not os.path.isfile(report_file):
+            missing.append(partition)
+            continue
+        with open(report_file) as report_data:
+            reports.append(json.load(report_data))
+    if missing and not allow_partial:
+        raise FileNotFoundError(f'Partitions {missing} of {partitions} have not finished in {store_dir}')
+    if diagnostics is None:
+        diagnostics = sorted({diagnostic for report in reports for diagnostic in report['diagnostics']})
+    store_dirs = [partition_dirs[report['partition']] for report in reports]
+    out_files = build_ensemble_tables(store_dirs, output_dir, diagnostics)
+
+    return out_files, reports
@@ -0,0 +1,258 @@
+def period_mask(labels, start=None, end=None):
+    # Selects the rows of a table that fall in a period of years, by the year each label starts with
+    # Inputs:
+    #  labels: Row labels starting with a year, e.g. 'YYYY-MM' months or 'YYYY-YYYY' seasons (or plain years)
+    #  start: First year of the period (None for no lower bound)
+    #  end: Last year of the period, inclusive (None for no upper bound)
+    # Returns:
+    #  in_period: Boolean array, True for rows in the period
+
+    # Import necessary modules
+    import numpy as np
+    import pandas as pd
+
+    years = pd.Index(labels).astype(str).str[:4].astype(int).values
+    in_period = np.ones(len(years), dtype=bool)
+    if start is not None:
+        in_period &= years >= start
+    if end is not None:
+        in_period &= years <= end
+
+    return in_period
+
+def _group_moments(weights, values, valid):
+    # Weighted counts, means and variances of every column for every row of a weight matrix (one matrix product each)
+    import numpy as np
+    counts = weights @ valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (weights @ values)/counts
+        variances = ((weights @ (values*values)) - counts*means**2)/(counts - 1)
+    return counts, means, variances
+
+def _t_statistic(first_moments, second_moments, equal_var=True):
+    # Two-sample t statistic and degrees of freedom (pooled variance, or Welch's when equal_var is False)
+    import numpy as np
+    (count_a, mean_a, var_a), (count_b, mean_b, var_b) = first_moments, second_moments
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if equal_var:
+            dof = count_a + count_b - 2
+            pooled = ((count_a - 1)*var_a + (count_b - 1)*var_b)/dof
+            t = (mean_a - mean_b)/np.sqrt(pooled*(1/count_a + 1/count_b))
+        else:
+            se_a, se_b = var_a/count_a, var_b/count_b
+            t = (mean_a - mean_b)/np.sqrt(se_a + se_b)
+            dof = (se_a + se_b)**2/(se_a**2/(count_a - 1) + se_b**2/(count_b - 1))
+    return t, dof
+
+def _prepare(sample):
+    # Splits a (samples x columns) array into zero-filled values and a 0/1 array marking the values that aren't missing
+    import numpy as np
+    sample = np.asarray(sample, dtype='float64')
+    valid = ~np.isnan(sample)
+    return np.where(valid, sample, 0), valid.astype('float64')
+
+def _statistic(first_moments, second_moments, statistic, equal_var):
+    if statistic == 'mean_difference':
+        return first_moments[1] - second_moments[1]
+    return _t_statistic(first_moments, second_moments, equal_var)[0]
+
+def t_test(first, second, equal_var=True):
+    # Runs a two-sample t-test on every column at once, ignoring missing values
+    # NOTE: Gives the same statistics and p-values as calling scipy.stats.ttest_ind on each column's non-missing values.
+    # Inputs:
+    #  first: Array (samples x columns) for the first period
+    #  second: Array (samples x columns) for the second period
+    #  equal_var: If False, use Welch's t-test
+    # Returns:
+    #  statistic: t statistic for every column
+    #  pvalue: Two-sided p-value for every column
+
+    # Import necessary modules
+    import numpy as np
+    from scipy import stats
+
+    first_values, first_valid = _prepare(first)
+    second_values, second_valid = _prepare(second)
+    statistic, dof = _t_statistic(_group_moments(np.ones((1, len(first_values))), first_values, first_valid),
+                                  _group_moments(np.ones((1, len(second_values))), second_values, second_valid), equal_var)
+    pvalue = 2*stats.t.sf(np.abs(statistic), dof)
+
+    return statistic[0], pvalue[0]
+
+def _permutation_batch(n_resamples, seed, pooled, valid, n_first, statistic, equal_var):
+    # Draws a batch of label permutations and returns each one's statistic for every column
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    order = rng.permuted(np.tile(np.arange(len(pooled)), (n_resamples, 1)), axis=1)
+    membership = np.zeros((n_resamples, len(pooled)))
+    np.put_along_axis(membership, order[:, :n_first], 1, axis=1)
+    return _statistic(_group_moments(membership, pooled, valid), _group_moments(1 - membership, pooled, valid), statistic, equal_var)
+
+def _bootstrap_batch(n_resamples, seed, first, first_valid, second, second_valid):
+    # Draws a batch of bootstrap resamples of each period and returns each one's difference in means for every column
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    means = []
+    for sample, valid in ((first, first_valid), (second, second_valid)):
+        weights = rng.multinomial(len(sample), np.full(len(sample), 1/len(sample)), size=n_resamples).astype('float64')
+        means.append(_group_moments(weights, sample, valid)[1])
+    return means[0] - means[1]
+
+def _resample(batch_function, arguments, n_resamples, batch_size, workers, seed):
+    # Runs a resampling function in batches with independent seeds, optionally spread across processes
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+    batch_sizes = [min(batch_size, n_resamples - start) for start in range(0, n_resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = list(pool.map(batch_function, batch_sizes, seeds, *[[argument]*len(seeds) for argument in arguments]))
+    else:
+        batches = [batch_function(size, batch_seed, *arguments) for size, batch_seed in zip(batch_sizes, seeds)]
+    return np.concatenate(batches)
+
+def permutation_test(first, second, n_resamples=10000, statistic='mean_difference', equal_var=True, batch_size=1000,
+                     workers=None, seed=None):
+    # Runs a two-sample permutation test on every column at once
+    # NOTE: Each batch of permutations is applied to all columns together as one matrix product, so the cost hardly
+    #       grows with the number of models. Missing values stay missing wherever they are permuted to.
+    # Inputs:
+    #  first: Array (samples x columns) for the first period
+    #  second: Array (samples x columns) for the second period
+    #  n_resamples: Number of random permutations
+    #  statistic: 'mean_difference' or 't'
+    #  equal_var: If False and statistic is 't', use Welch's t statistic
+    #  batch_size: Number of permutations drawn at a time (bounds memory use)
+    #  workers: Number of processes to spread the batches over (None or 1 runs them in this process)
+    #  seed: Random seed, for reproducible p-values
+    # Returns:
+    #  observed: The statistic for every column
+    #  pvalue: Two-sided permutation p-value for every column
+
+    # Import necessary modules
+    import numpy as np
+
+    if statistic not in ('mean_difference', 't'):
+        raise ValueError(f"statistic must be 'mean_difference' or 't', got {statistic}")
+    first_values, first_valid = _prepare(first)
+    second_values, second_valid = _prepare(second)
+    observed = _statistic(_group_moments(np.ones((1, len(first_values))), first_values, first_valid),
+                          _group_moments(np.ones((1, len(second_values))), second_values, second_valid), statistic, equal_var)[0]
+
+    pooled, valid = np.concatenate([first_values, second_values]), np.concatenate([first_valid, second_valid])
+    resampled = _resample(_permutation_batch, (pooled, valid, len(first_values), statistic, equal_var),
+                          n_resamples, batch_size, workers, seed)
+    exceed = np.sum(np.abs(resampled) >= np.abs(observed)*(1 - 1e-12), axis=0)
+    pvalue = np.where(np.isnan(observed), np.nan, (exceed + 1)/(n_resamples + 1))
+
+    return observed, pvalue
+
+def bootstrap_test(first, second, n_resamples=10000, confidence=0.95, batch_size=1000, workers=None, seed=None):
+    # Runs a two-sample bootstrap test of the difference in means on every column at once
+    # NOTE: Each period is resampled with replacement (as weights, so all columns share one matrix product). The
+    #       p-value comes from the resampled differences shifted to a zero mean difference, which imposes the null.
+    # Inputs:
+    #  first: Array (samples x columns) for the first period
+    #  second: Array (samples x columns) for the second period
+    #  n_resamples: Number of bootstrap resamples
+    #  confidence: Level of the percentile confidence interval for the difference
+    #  batch_size: Number of resamples drawn at a time (bounds memory use)
+    #  workers: Number of processes to spread the batches over (None or 1 runs them in this process)
+    #  seed: Random seed, for reproducible p-values
+    # Returns:
+    #  observed: Difference in means (first minus second) for every column
+    #  pvalue: Two-sided bootstrap p-value for every column
+    #  interval: Array (2 x columns) with the lower and upper confidence bounds of the difference
+
+    # Import necessary modules
+    import warnings
+    import numpy as np
+
+    first_values, first_valid = _prepare(first)
+    second_values, second_valid = _prepare(second)
+    observed = _statistic(_group_moments(np.ones((1, len(first_values))), first_values, first_valid),
+                          _group_moments(np.ones((1, len(second_values))), second_values, second_valid), 'mean_difference', True)[0]
+
+    resampled = _resample(_bootstrap_batch, (first_values, first_valid, second_values, second_valid),
+                          n_resamples, batch_size, workers, seed)
+    exceed = np.sum(np.abs(resampled - observed) >= np.abs(observed)*(1 - 1e-12), axis=0)
+    pvalue = np.where(np.isnan(observed), np.nan, (exceed + 1)/(n_resamples + 1))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # A column with no values has a NaN interval
+        interval = np.nanpercentile(resampled, [50*(1 - confidence), 50*(1 + confidence)], axis=0)
+
+    return observed, pvalue, interval
+
+def adjust_pvalues(pvalues, method='fdr_bh'):
+    # Corrects p-values for testing many models at once
+    # Inputs:
+    #  pvalues: Array of p-values (missing values are left out of the correction and stay missing)
+    #  method: 'bonferroni', 'holm' (step-down family-wise error) or 'fdr_bh' (Benjamini-Hochberg false discovery rate)
+    # Returns:
+    #  adjusted: Array of adjusted p-values
+
+    # Import necessary modules
+    import numpy as np
+
+    pvalues = np.asarray(pvalues, dtype='float64')
+    adjusted = np.full(pvalues.shape, np.nan)
+    tested = ~np.isnan(pvalues)
+    p = pvalues[tested]
+    n = len(p)
+    order = np.argsort(p)
+    if method == 'bonferroni':
+        corrected = p*n
+    elif method == 'holm':
+        corrected = np.empty(n)
+        corrected[order] = np.maximum.accumulate(p[order]*(n - np.arange(n)))
+    elif method == 'fdr_bh':
+        corrected = np.empty(n)
+        corrected[order] = np.minimum.accumulate((p[order]*n/np.arange(1, n + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"method must be 'bonferroni', 'holm' or 'fdr_bh', got {method}")
+    adjusted[tested] = np.minimum(corrected, 1)
+
+    return adjusted
+
+def significance_table(table, first_period, second_period, test='t', n_resamples=10000, correction='fdr_bh',
+                       alpha=0.05, workers=None, seed=0):
+    # Tests every column of a table for a difference between two periods in one vectorized pass
+    # Inputs:
+    #  table: DataFrame with one row per time step/season (labels starting with a year) and one column per model
+    #  first_period: (start, end) years of the first period, e.g. (2050, None) for 2050 onwards
+    #  second_period: (start, end) years of the second period, e.g. (1851, 1900)
+    #  test: 't', 'welch', 'permutation' or 'bootstrap'
+    #  n_resamples: Number of resamples for the permutation and bootstrap tests
+    #  correction: Multiple-comparison correction (see adjust_pvalues), or None
+    #  alpha: Significance level applied to the (adjusted) p-values
+    #  workers: Number of processes for the resampling tests
+    #  seed: Random seed for the resampling tests
+    # Returns:
+    #  results: DataFrame indexed by column with the 'difference' in means (first minus second), the test
+    #           'statistic', 'pvalue', 'pvalue_adjusted' and whether the difference is 'significant'
+
+    # Import necessary modules
+    import warnings
+    import numpy as np
+    import pandas as pd
+
+    first = table.values[period_mask(table.index, *first_period)]
+    second = table.values[period_mask(table.index, *second_period)]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # A model with no values in a period has a NaN difference
+        difference = np.nanmean(first, axis=0) - np.nanmean(second, axis=0)
+    if test in ('t', 'welch'):
+        statistic, pvalue = t_test(first, second, equal_var=(test == 't'))
+    elif test == 'permutation':
+        statistic, pvalue = permutation_test(first, second, n_resamples, statistic='t', workers=workers, seed=seed)
+    elif test == 'bootstrap':
+        statistic, pvalue, interval = bootstrap_test(first, second, n_resamples, workers=workers, seed=seed)
+    else:
+        raise ValueError(f"test must be 't', 'welch', 'permutation' or 'bootstrap', got {test}")
+    adjusted = adjust_pvalues(pvalue, correction) if correction else pvalue
+    results = pd.DataFrame({'difference': difference, 'statistic': statistic, 'pvalue': pvalue,
+                            'pvalue_adjusted': adjusted, 'significant': adjusted < alpha}, index=table.columns)
+    if test == 'bootstrap':
+        results['lower'], results['upper'] = interval
+
+    return results
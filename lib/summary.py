@@ -0,0 +1,158 @@
+# Mean ELI bounds (°E) of the ENSO categories models are sorted into: below 160 is La Niña-like, above 165 El Niño-like
+eli_categories = {'la_nina': (None, 160), 'neutral': (160, 165), 'el_nino': (165, None)}
+
+def eli_category(mean_eli, categories=None):
+    # Assigns each model to an ENSO category from its mean ELI
+    # NOTE: Bounds are exclusive, as in the original scripts, so a mean of exactly 160 or 165°E gets no category.
+    # Inputs:
+    #  mean_eli: Series of mean ELI per model
+    #  categories: Dictionary of category name to (lower, upper) bounds (defaults to eli_categories)
+    # Returns:
+    #  category: Series of category names per model (None where no category applies)
+
+    # Import necessary modules
+    import numpy as np
+    import pandas as pd
+
+    category = pd.Series(None, index=mean_eli.index, dtype=object)
+    for name, (lower, upper) in (categories or eli_categories).items():
+        inside = np.ones(len(mean_eli), dtype=bool)
+        if lower is not None:
+            inside &= (mean_eli > lower).to_numpy()
+        if upper is not None:
+            inside &= (mean_eli < upper).to_numpy()
+        category[inside] = name
+
+    return category
+
+def summary_stats(table, kde_points=200, categorize=True):
+    # Calculates the per-column statistics the figures are drawn from, in one vectorized pass over the table
+    # NOTE: Quartiles, whiskers (furthest points within 1.5 IQR of the box) and fliers follow matplotlib's boxplot,
+    #       and the densities seaborn's kdeplot (Gaussian kernel, Scott's bandwidth), so the figures look the same
+    #       as when they were drawn from the raw columns. Densities share one grid so they can be stored as a table.
+    # Inputs:
+    #  table: DataFrame with one column per model (e.g. ens_averages.csv); NaNs are ignored
+    #  kde_points: Number of points in the density grid
+    #  categorize: If True, add each column's ENSO category (see eli_category)
+    # Returns:
+    #  stats: DataFrame indexed by column with 'count', 'mean', 'median', 'q1', 'q3', 'whislo', 'whishi', 'fliers'
+    #         (list of values outside the whiskers) and 'category'
+    #  kde: DataFrame of densities indexed by the grid of values, one column per input column
+
+    # Import necessary modules
+    import numpy as np
+    import pandas as pd
+
+    values = table.to_numpy(dtype=float)
+    if values.size == 0:
+        # Nothing to summarize (e.g. an ELI group without any models): one row of NaN statistics per column, no densities
+        stats = pd.DataFrame({'count': np.zeros(values.shape[1], dtype=int)}, index=table.columns)
+        for column in ['mean', 'median', 'q1', 'q3', 'whislo', 'whishi']:
+            stats[column] = np.nan
+        stats['fliers'] = [[] for _ in range(values.shape[1])]
+        if categorize:
+            stats['category'] = eli_category(stats['mean'])
+        kde = pd.DataFrame(np.zeros((0, values.shape[1])), index=pd.Index([], dtype=float, name='value'), columns=table.columns)
+        return stats, kde
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    q1, median, q3 = np.nanpercentile(values, [25, 50, 75], axis=0)
+    reach = 1.5*(q3 - q1)
+    whislo = np.nanmin(np.where(values >= q1 - reach, values, np.nan), axis=0)
+    whishi = np.nanmax(np.where(values <= q3 + reach, values, np.nan), axis=0)
+    outside = valid & ((values < whislo) | (values > whishi))
+    stats = pd.DataFrame({'count': count, 'mean': np.nanmean(values, axis=0), 'median': median, 'q1': q1, 'q3': q3,
+                          'whislo': whislo, 'whishi': whishi}, index=table.columns)
+    stats['fliers'] = [values[outside[:, column], column].tolist() for column in range(values.shape[1])]
+    if categorize:
+        stats['category'] = eli_category(stats['mean'])
+
+    # Gaussian kernel densities on a grid covering every column's data plus three bandwidths either side (NaN for a
+    # column with fewer than two distinct values, which has no bandwidth)
+    bandwidth = count.astype(float)**(-1/5)*np.nanstd(values, axis=0, ddof=1)
+    bandwidth[~(bandwidth > 0)] = np.nan
+    widest = np.nanmax(bandwidth) if np.isfinite(bandwidth).any() else 0
+    grid = np.linspace(np.nanmin(values) - 3*widest, np.nanmax(values) + 3*widest, kde_points)
+    density = np.zeros((kde_points, values.shape[1]))
+    for start in range(0, values.shape[0], 64): # Blocks of rows bound the size of the grid x rows x columns array
+        block = values[start:start + 64]
+        distance = (grid[:, None, None] - block[None])/bandwidth
+        density += np.nansum(np.exp(-0.5*distance**2), axis=1)
+    density /= count*bandwidth*np.sqrt(2*np.pi)
+    density[:, np.isnan(bandwidth)] = np.nan
+    kde = pd.DataFrame(density, index=pd.Index(grid, name='value'), columns=table.columns)
+
+    return stats, kde
+
+def summary_path(table_file):
+    # Gets the path of the summary cache kept next to a table
+    # Inputs:
+    #  table_file: Path to a CSV table, e.g. 'ens_averages.csv'
+    # Returns:
+    #  path: Path to '<table>.summary.json' in the same directory
+
+    # Import necessary modules
+    import os
+
+    path = f'{os.path.splitext(table_file)[0]}.summary.json'
+
+    return path
+
+def load_summary(table_file, table=None, index_col=0, kde_points=200, categorize=True):
+    # Gets a table's summary statistics from its cache, recalculating and rewriting the cache if the table changed
+    # NOTE: The cache records the table's size, mtime and SHA-1 hash (see file_signature); a table that was only
+    #       touched keeps its cache.
+    # Inputs:
+    #  table_file: Path to a CSV table with one column per model
+    #  table: The table, if it has already been read (read from table_file only if the cache is out of date)
+    #  index_col: Index column of the CSV
+    #  kde_points: Number of points in the density grid
+    #  categorize: If True, include each column's ENSO category (see eli_category)
+    # Returns:
+    #  stats: DataFrame of per-column statistics (see summary_stats)
+    #  kde: DataFrame of per-column densities (see summary_stats)
+
+    # Import necessary modules
+    import os
+    import json
+    import pandas as pd
+    from .manifest import file_signature
+
+    path = summary_path(table_file)
+    cache = None
+    if os.path.isfile(path):
+        with open(path) as cache_file:
+            cache = json.load(cache_file)
+    previous = cache['table'] if cache else None
+    signature = file_signature(table_file, previous)
+    settings = {'kde_points': kde_points, 'categorize': categorize}
+    if cache and cache['table']['sha1'] == signature['sha1'] and cache['settings'] == settings:
+        stats = pd.DataFrame.from_dict(cache['stats'], orient='index')
+        if 'category' in stats:
+            stats['category'] = pd.Series([category if isinstance(category, str) else None for category in stats['category']],
+                                          index=stats.index, dtype=object)
+        kde = pd.DataFrame(cache['kde']['density'], index=pd.Index(cache['kde']['grid'], name='value'))[list(stats.index)]
+        if signature != previous: # Keep the new mtime so the next check doesn't hash the table again
+            cache['table'] = signature
+            _write_json(cache, path)
+        return stats, kde
+
+    if table is None:
+        table = pd.read_csv(table_file, index_col=index_col)
+    stats, kde = summary_stats(table, kde_points, categorize)
+    cache = {'table': signature, 'settings': settings,
+             'stats': json.loads(stats.to_json(orient='index', double_precision=15)),
+             'kde': {'grid': kde.index.tolist(), 'density': {column: kde[column].tolist() for column in kde}}}
+    _write_json(cache, path)
+
+    return stats, kde
+
+def _write_json(data, path):
+    # Writes a JSON file through a temporary file, so readers never see it half-written
+    import os
+    import json
+    import uuid
+    temp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as out_file:
+        json.dump(data, out_file)
+    os.replace(temp_path, path)
@@ -0,0 +1,202 @@
+def synthetic_time(start_year=1850, years=251, calendar='noleap'):
+    # Builds a mid-month monthly time axis in any CF calendar
+    # Inputs:
+    #  start_year: First year of the axis
+    #  years: Number of years
+    #  calendar: CF calendar, e.g. 'gregorian', 'noleap' or '360_day'
+    # Returns:
+    #  time: CFTimeIndex with one entry per month, on the 15th
+
+    # Import necessary modules
+    import datetime
+    import xarray as xr
+
+    time = xr.date_range(f'{start_year:04d}-01-01', periods=12*years, freq='MS', calendar=calendar, use_cftime=True)
+    time = time + datetime.timedelta(days=14)
+
+    return time
+
+def synthetic_grid(n_lat, n_lon, north_to_south=False):
+    # Builds a regular global grid of cell centres
+    # Inputs:
+    #  n_lat: Number of latitudes
+    #  n_lon: Number of longitudes (running east from 0°E)
+    #  north_to_south: If True, latitudes run from north to south as in ERSST
+    # Returns:
+    #  lat: Latitudes (°N)
+    #  lon: Longitudes (°E, 0-360)
+
+    # Import necessary modules
+    import numpy as np
+
+    lat = -90 + (np.arange(n_lat) + 0.5)*180/n_lat
+    lon = (np.arange(n_lon) + 0.5)*360/n_lon
+    if north_to_south:
+        lat = lat[::-1]
+
+    return lat, lon
+
+def synthetic_sst_field(lat, lon, time, seed=0, dtype='float32'):
+    # Builds a surface temperature field (K) with a tropical warm pool, a seasonal cycle and a wandering ENSO signal
+    # NOTE: The ENSO signal is an AR(1) index on a central/eastern Pacific pattern whose centre shifts east with the
+    #       index, so ELI and Niño 3.4 both see realistic-looking variability.
+    # Inputs:
+    #  lat, lon: Grid coordinates (°N, °E)
+    #  time: Time axis (see synthetic_time)
+    #  seed: Random seed
+    #  dtype: Data type of the returned field
+    # Returns:
+    #  ts: Array of shape (time, lat, lon)
+
+    # Import necessary modules
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    lat_rad = np.deg2rad(np.asarray(lat))[:, None]
+    lon_deg = np.asarray(lon)[None, :]
+    months = np.array([date.month for date in time])
+    climatology = 271.35 + 30*np.cos(lat_rad)**3 + 2*np.cos(np.deg2rad(lon_deg - 150))*np.exp(-(np.rad2deg(lat_rad)/15)**2)
+    seasonal_cycle = np.sin(lat_rad)*np.cos(2*np.pi*(months - 2)/12)[:, None, None]
+
+    enso_index = np.zeros(len(time))
+    shocks = rng.standard_normal(len(time))
+    for month in range(1, len(time)):
+        enso_index[month] = 0.9*enso_index[month - 1] + 0.45*shocks[month]
+    ts = np.empty((len(time), len(lat), len(lon)), dtype=dtype)
+    for month in range(len(time)):
+        centre = 210 + 15*enso_index[month]
+        enso_pattern = np.exp(-((lon_deg - centre)/35)**2 - (np.rad2deg(lat_rad)/12)**2)
+        ts[month] = climatology + seasonal_cycle[month] + 1.5*enso_index[month]*enso_pattern \
+                    + 0.3*rng.standard_normal((len(lat), len(lon)))
+
+    return ts
+
+def synthetic_land_fraction(lat, lon):
+    # Builds a land fraction field (0-1) with a few idealized continents and fractional coastlines
+    # Inputs:
+    #  lat, lon: Grid coordinates (°N, °E)
+    # Returns:
+    #  fraction: Array of shape (lat, lon) between 0 and 1
+
+    # Import necessary modules
+    import numpy as np
+
+    lat_deg = np.asarray(lat)[:, None]
+    lon_deg = np.asarray(lon)[None, :]
+    continents = [(20, 50, 10, 20), (-5, 15, 110, 15), (0, 290, 45, 12), (45, 100, 25, 50), (-75, 0, 15, 360)]
+    fraction = np.zeros((len(lat), len(lon)))
+    for centre_lat, centre_lon, lat_width, lon_width in continents:
+        lon_offset = (lon_deg - centre_lon + 180) % 360 - 180
+        fraction = np.maximum(fraction, np.clip(1.5 - np.hypot((lat_deg - centre_lat)/lat_width, lon_offset/lon_width), 0, 1))
+
+    return fraction
+
+def synthetic_realization(n_lat=90, n_lon=180, start_year=1850, years=251, calendar='noleap', long_names=False,
+                          seed=0, dtype='float32'):
+    # Builds a CMIP6-like ts_Amon Dataset
+    # Inputs:
+    #  n_lat, n_lon: Grid size
+    #  start_year: First year of the run
+    #  years: Number of years
+    #  calendar: CF calendar, e.g. 'gregorian', 'noleap' or '360_day'
+    #  long_names: If True, name the coordinates 'latitude'/'longitude' instead of 'lat'/'lon'
+    #  seed: Random seed (use a different one per realization)
+    #  dtype: Data type of 'ts'
+    # Returns:
+    #  data: Dataset with 'ts' (K) on (time, lat, lon)
+
+    # Import necessary modules
+    import xarray as xr
+
+    lat, lon = synthetic_grid(n_lat, n_lon)
+    time = synthetic_time(start_year, years, calendar)
+    data = xr.Dataset({'ts': (('time', 'lat', 'lon'), synthetic_sst_field(lat, lon, time, seed, dtype), {'units': 'K'})},
+                      coords={'time': time, 'lat': lat, 'lon': lon})
+    if long_names:
+        data = data.rename({'lat': 'latitude', 'lon': 'longitude'})
+
+    return data
+
+def synthetic_land_mask(n_lat=90, n_lon=180, convention='percent', long_names=False):
+    # Builds a CMIP6-like sftlf_fx Dataset
+    # Inputs:
+    #  n_lat, n_lon: Grid size
+    #  convention: Land fraction scale, a key into masks.sftlf_conventions ('fraction' 0-1, 'max10' 0-10, 'percent' 0-100)
+    #  long_names: If True, name the coordinates 'latitude'/'longitude' instead of 'lat'/'lon'
+    # Returns:
+    #  land_mask: Dataset with 'sftlf' on (lat, lon)
+
+    # Import necessary modules
+    import xarray as xr
+    from .masks import sftlf_conventions
+
+    lat, lon = synthetic_grid(n_lat, n_lon)
+    fraction = synthetic_land_fraction(lat, lon)*sftlf_conventions[convention]
+    land_mask = xr.Dataset({'sftlf': (('lat', 'lon'), fraction.astype('float32'), {'units': '%' if convention == 'percent' else '1'})},
+                           coords={'lat': lat, 'lon': lon})
+    if long_names:
+        land_mask = land_mask.rename({'lat': 'latitude', 'lon': 'longitude'})
+
+    return land_mask
+
+def synthetic_observations(n_lat=89, n_lon=180, start_year=1854, years=170, seed=1000):
+    # Builds an ERSST-like 'sst.mnmean.nc' Dataset (°C, latitudes north to south, land masked out)
+    # Inputs:
+    #  n_lat, n_lon: Grid size
+    #  start_year: First year of the record
+    #  years: Number of years
+    #  seed: Random seed
+    # Returns:
+    #  obs: Dataset with 'sst' (°C) on (time, lat, lon)
+
+    # Import necessary modules
+    import pandas as pd
+    import xarray as xr
+
+    lat, lon = synthetic_grid(n_lat, n_lon, north_to_south=True)
+    time = pd.date_range(f'{start_year}-01-01', periods=12*years, freq='MS')
+    ssts = synthetic_sst_field(lat, lon, synthetic_time(start_year, years, 'gregorian'), seed) - 273.15
+    ocean = synthetic_land_fraction(lat, lon) < 1
+    obs = xr.Dataset({'sst': (('time', 'lat', 'lon'), ssts.astype('float32'), {'units': 'degC'})},
+                     coords={'time': time, 'lat': lat, 'lon': lon}).where(ocean)
+
+    return obs
+
+def write_synthetic_ensemble(out_dir, models=('SYN-A',), realizations=2, n_lat=90, n_lon=180, start_year=1850,
+                             years=251, calendar='noleap', convention='percent', long_names=False, dtype='float32'):
+    # Writes a synthetic ensemble laid out like the real archive: '<out_dir>/CMIP6/<model>/' plus 'sst.mnmean.nc'
+    # Inputs:
+    #  out_dir: Directory to write to (used as data_dir by the *_ens_calculator functions)
+    #  models: Model names
+    #  realizations: Number of realizations per model
+    #  n_lat, n_lon: Model grid size
+    #  start_year: First year of every run
+    #  years: Number of years per run
+    #  calendar: CF calendar, e.g. 'gregorian', 'noleap' or '360_day'
+    #  convention: sftlf convention (see synthetic_land_mask)
+    #  long_names: If True, name the coordinates 'latitude'/'longitude' instead of 'lat'/'lon'
+    #  dtype: Data type of 'ts'
+    # Returns:
+    #  files: Dictionary with the 'obs' file and, per model, its (data_files, mask_file)
+
+    # Import necessary modules
+    import os
+
+    files = {'obs': os.path.join(out_dir, 'sst.mnmean.nc')}
+    if not os.path.isfile(files['obs']):
+        os.makedirs(out_dir, exist_ok=True)
+        synthetic_observations().to_netcdf(files['obs'])
+    for model_number, model in enumerate(models):
+        model_dir = os.path.join(out_dir, 'CMIP6', model)
+        os.makedirs(model_dir, exist_ok=True)
+        period = f'{start_year:04d}01-{start_year + years - 1:04d}12'
+        data_files = []
+        for realization in range(1, realizations + 1):
+            data_files.append(os.path.join(model_dir, f'ts_Amon_{model}_historical_r{realization}i1p1f1_gn_{period}.nc'))
+            synthetic_realization(n_lat, n_lon, start_year, years, calendar, long_names,
+                                  seed=100*model_number + realization, dtype=dtype).to_netcdf(data_files[-1])
+        mask_file = os.path.join(model_dir, f'sftlf_fx_{model}_historical_r1i1p1f1_gn.nc')
+        synthetic_land_mask(n_lat, n_lon, convention, long_names).to_netcdf(mask_file)
+        files[model] = (data_files, mask_file)
+
+    return files
@@ -0,0 +1,36 @@
+# Script to merge the result stores of a sharded ensemble run (run_ensemble.py --shard i/N) into the ensemble tables
+# and composites, once every partition has finished
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+# Initialize system variables
+
+import argparse
+import os
+
+from lib import merge_partitions
+
+parser = argparse.ArgumentParser(description='Build the ensemble tables from the per-partition result stores of a sharded run')
+parser.add_argument('--output-dir', default='/output', help='Directory to write the ensemble tables to')
+parser.add_argument('--store', default=None, help='Result store directory the partitions were written under (default: <output-dir>/store)')
+parser.add_argument('--shards', type=int, default=None, help='Number of partitions of the run to merge (only needed if runs with different counts exist)')
+parser.add_argument('--diagnostics', nargs='+', default=None, help='Diagnostics to consolidate (default: every diagnostic the partitions ran)')
+parser.add_argument('--allow-partial', action='store_true', help='Merge whichever partitions have finished instead of stopping')
+args = parser.parse_args()
+store_dir = args.store or os.path.join(args.output_dir, 'store')
+
+# Build the tables from every partition's store
+
+out_files, reports = merge_partitions(store_dir, args.output_dir, args.shards, args.diagnostics, args.allow_partial)
+for out_file in out_files:
+    print(f'Wrote {out_file}')
+
+# Send a summary to the screen
+
+print("-------------------------------------------------")
+print(f"Merged {len(reports)} of {reports[0]['partitions'] if reports else args.shards} partitions "
+      f"({sum(len(report['tasks']) for report in reports)} realizations)")
+for report in reports:
+    for data_file in report['failures']:
+        print(f"  failed in partition {report['partition']}: {data_file}")
+print("-------------------------------------------------")
@@ -5,11 +5,32 @@
 
 # Initialize system variables
 
-import sys
-
-model = sys.argv[1]
-f = sys.argv[2]
-mask = sys.argv[3]
+import argparse
+
+parser = argparse.ArgumentParser(description='Calculate the DJF Niño 3.4 index for one CMIP6 realization')
+parser.add_argument('model', help='Model name, e.g. ACCESS-CM2')
+parser.add_argument('f', help='Path to the ts_Amon file (or Zarr store from ingest.py) for the realization')
+parser.add_argument('mask', help='Path to the sftlf_fx land mask (NetCDF or Zarr) for the model')
+parser.add_argument('--stream', action='store_true', help='Read and process the file in blocks of time steps to bound memory use')
+parser.add_argument('--store', default='/output/store', help='Result store directory the realization is written to (default: /output/store)')
+parser.add_argument('--time-chunk', type=int, default=120, help='Number of time steps per block in streaming mode (default: 120)')
+parser.add_argument('--memory-limit', default=None,
+                    help='Memory budget, e.g. 4G; streams the file in blocks sized to stay under it (overrides --stream and --time-chunk)')
+parser.add_argument('--window', type=int, default=5, help='Years in the running climatology (default: 5)')
+parser.add_argument('--base-period', type=int, nargs=2, default=None, metavar=('START', 'END'),
+                    help='Use a fixed climatology over these years instead of the running one')
+parser.add_argument('--stage-log', default=None, help='JSON-lines file to record the time and memory of each processing stage in')
+parser.add_argument('--ocean-threshold', type=float, default=1.0,
+                    help='Land fraction below which a grid cell counts as ocean (default: 1.0, every cell that is not entirely land)')
+parser.add_argument('--area-weighting', default='none', choices=['none', 'coslat', 'area'],
+                    help='Weighting of the spatial means: none (every grid point counts equally, as in existing tables), cos(latitude), or the model\'s areacella/areacello cell areas when present (default: none)')
+parser.add_argument('--force', action='store_true', help='Recompute the realization even if the manifest records it as up to date')
+args = parser.parse_args()
+area_weighting = None if args.area_weighting == 'none' else args.area_weighting
+
+model = args.model
+f = args.f
+mask = args.mask
 
 # Directory management
 
@@ -24,7 +45,7 @@ os.chdir(path)
 from lib.cmip6_processing import model_formatter 
 filename = f.split('CMIP6')[1]
 realization_file = filename.split(f'{model}/')[1]
-realization = realization_file.split('.nc')[0]
+realization = realization_file.split('.nc')[0].split('.zarr')[0]
 format_realization = model_formatter(realization)
 
 # Print a couple of sanity checks to the screen
@@ -37,53 +58,51 @@ print('Realization is', format_realization)
 
 # Import other important modules
 
-import numpy as np
-import pandas as pd
-import xarray as xr
-import datetime
 import warnings
-from lib.cmip6_processing import calculate_niño
+from lib import diagnostic_params, input_signatures, is_current, record_result, run_realization, set_stage_log, update_manifest
 
 warnings.simplefilter("ignore","SerializationWarning:")
-
-# Read in files from working directory
-# Read in model data
-
-data = xr.open_dataset(f'{dir}{filename}')
-
-# Read in land mask
-
+if args.stage_log:
+    set_stage_log(args.stage_log)
+options = {'stream': args.stream, 'time_chunk': args.time_chunk, 'ocean_threshold': args.ocean_threshold,
+           'area_weighting': area_weighting, 'memory_limit': args.memory_limit,
+           'diagnostic_options': {'niño3.4': {'window': args.window, 'base_period': args.base_period}}}
+params = diagnostic_params('niño3.4', options)
+
+# Skip the realization if the manifest shows it was already computed from these exact files
+
+with update_manifest(args.store) as manifest: # Saves the refreshed mtimes of files that were touched but not changed
+    current = not args.force and is_current(manifest, args.store, 'niño3.4', model, f'{dir}{filename}', mask, params)
+if current:
+    print(f"{format_realization} is up to date in {args.store}; nothing to do")
+    raise SystemExit(0)
+
+# Read in model data and land mask, mask out land surfaces and calculate the index with the registered 'niño3.4'
+# diagnostic, which writes it to this realization's own shard in the result store; run consolidate.py to build the tables
+# Streaming mode reads, masks and averages one block of time steps at a time, so only one block of the field is in
+# memory, and appends each block's regional mean to the store's blocks file as soon as it is calculated
+
+signatures = input_signatures(f'{dir}{filename}', mask) # Taken before reading, so a file replaced mid-run is redone next time
+memory_report = {}
 try:
-    land_mask = xr.open_dataset(f'{mask}')
+    run_realization(model, f'{dir}{filename}', mask, ['niño3.4'], store_dir=args.store, memory_report=memory_report, **options)
 except FileNotFoundError:
     print("------------------------------------------")
     print(f"Land mask doesn't exist for {model}; no appropriate reprojection can be done")
     print("------------------------------------------")
-
-# Assign data arrays to variables; mask out land surfaces
-
-ts = data['ts']
-if model != "MCM-UA-1-0":
-    lon = data['lon']
-    lat = data['lat']
-else:
-    lon = data['longitude']
-    lat = data['latitude']
-
-land_masked = ts.where(land_mask['sftlf'] != 100)
-        
-sst_anomalies = calculate_niño(land_masked)
+    raise
 print(f"Successfully calculated Niño 3.4 index for {format_realization}!")
 
-# Send output to CSV
+# Record the result in the manifest
 
-niño_output = pd.read_csv('/output/niño_3.4_table.csv')
-niño_series = pd.Series(sst_anomalies, name= format_realization)
-niño_output.insert(0, format_realization, niño_series)
-niño_output.to_csv('/output/niño_3.4_table.csv')
+with update_manifest(args.store) as manifest:
+    record_result(manifest, args.store, 'niño3.4', model, f'{dir}{filename}', mask, params, signatures)
 
 # Send a nice message to the screen
 
 print("-------------------------------------------------")
 print(f"Successfully output realization {format_realization} for {model}!")
+if memory_report:
+    print(f"Peak memory {memory_report['observed_peak_mib']:.0f} MiB (estimated {memory_report['estimated_peak_mib']:.0f} MiB, "
+          f"limit {memory_report['memory_limit_mib']:.0f} MiB, {memory_report['time_chunk']} time steps per block)")
 print("-------------------------------------------------")
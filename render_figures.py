@@ -0,0 +1,41 @@
+# Script to render the full set of paper figures (boxplots, heatmaps and histograms) in one command
+# Reads the ensemble tables once, draws each figure on its own off-screen canvas and renders independent figures in
+# parallel worker processes, so it runs without a display
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+# Initialize system variables
+
+import argparse
+import os
+import time
+
+from lib import load_figure_tables, registered_figures, render_figures
+
+parser = argparse.ArgumentParser(description='Render the CMIP6 ensemble figures to image files')
+parser.add_argument('--output-dir', default='/output', help='Directory holding the ensemble tables (default: /output)')
+parser.add_argument('--fig-dir', default='/paper_images', help='Directory to save the figures to (default: /paper_images)')
+parser.add_argument('--figures', nargs='+', default=None, choices=sorted(registered_figures),
+                    help='Figures to render (default: all of them)')
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes (default: all cores)')
+parser.add_argument('--dpi', type=int, default=200, help='Resolution of the saved images (default: 200)')
+args = parser.parse_args()
+
+# Read every table once and render the figures
+
+start = time.perf_counter()
+tables = load_figure_tables(args.output_dir)
+failures = []
+for report in render_figures(tables, args.fig_dir, args.figures, args.workers, args.dpi):
+    if report['status'] == 'ok':
+        print(f"[ok] {report['file']}")
+    else:
+        failures.append(report)
+        print(f"[{report['status']}] {report['name']}: {report['error']}")
+
+# Send a summary to the screen
+
+print("-------------------------------------------------")
+print(f"Rendered {len(args.figures or registered_figures) - len(failures)} figures in {time.perf_counter() - start:.1f} s")
+for report in failures:
+    print(f"  {report['status']}: {report['name']}")
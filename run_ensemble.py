@@ -0,0 +1,112 @@
+# Script to calculate ENSO indices and SST composites for the CMIP6 ensemble on a pool of worker processes
+# Replaces the serial loop in iterateCMIP6.sh: every realization runs inside one long-lived Python process per worker,
+# and is read and masked once for all of the requested diagnostics
+# With --shard i/N it runs only partition i of N (balanced by input size), e.g. one per node of a job array, into its own
+# store under <store>/partitions; merge_shards.py then builds the tables. To try it on one machine, run every
+# partition in turn: for i in 0 1 2 3; do python run_ensemble.py --shard $i/4; done; python merge_shards.py
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+# Initialize system variables
+
+import argparse
+import os
+
+from lib import (build_ensemble_tables, diagnostic_params, ensemble_tasks, model_list, parse_memory_limit,
+                 parse_partition, partition_store_dir, partition_tasks, pending_tasks, record_result, registered_diagnostics,
+                 run_ensemble, save_partition_report, set_stage_log, update_manifest)
+
+parser = argparse.ArgumentParser(description='Calculate ELI, Niño 3.4 and SST composites for every realization in the CMIP6 ensemble')
+parser.add_argument('--models', nargs='+', default=model_list, help='Models to process (default: the full 33-model list)')
+parser.add_argument('--diagnostics', nargs='+', default=['eli'], choices=sorted(registered_diagnostics),
+                    help='Diagnostics to calculate for every realization in a single pass over its file (default: eli)')
+parser.add_argument('--data-dir', default='/CMIP6/', help='Directory holding one sub-directory per model')
+parser.add_argument('--output-dir', default='/output', help='Directory to write the ensemble tables to')
+parser.add_argument('--store', default=None, help='Result store directory for per-realization shards (default: <output-dir>/store)')
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes (default: all cores)')
+parser.add_argument('--time-limit', type=int, default=1800, help='Maximum number of seconds per realization (default: 1800)')
+parser.add_argument('--obs-file', default='/chinook2/nathane1/Thesis/sst.mnmean.nc',
+                    help='Observational SST file for the bias, change and zonal diagnostics')
+parser.add_argument('--season', default='DJF', help='Season for the zonal diagnostic (default: DJF)')
+parser.add_argument('--niño-window', type=int, default=5, help='Years in the running Niño 3.4 climatology (default: 5)')
+parser.add_argument('--niño-base-period', type=int, nargs=2, default=None, metavar=('START', 'END'),
+                    help='Use a fixed Niño 3.4 climatology over these years instead of the running one')
+parser.add_argument('--ocean-threshold', type=float, default=1.0,
+                    help='Land fraction below which a grid cell counts as ocean (default: 1.0, every cell that is not entirely land)')
+parser.add_argument('--area-weighting', default='none', choices=['none', 'coslat', 'area'],
+                    help='Weighting of the spatial means: none (every grid point counts equally, as in existing tables), cos(latitude), or the model\'s areacella/areacello cell areas when present (default: none)')
+parser.add_argument('--stream', action='store_true', help='Process each file in blocks of time steps to bound memory use')
+parser.add_argument('--time-chunk', type=int, default=120, help='Number of time steps per block in streaming mode')
+parser.add_argument('--memory-limit', default=None,
+                    help='Memory budget for the whole run, e.g. 64G, shared evenly between the workers; each file is streamed in '
+                         'blocks sized to keep its worker under its share (overrides --stream and --time-chunk)')
+parser.add_argument('--stage-log', default=None, help='JSON-lines file to record the time and memory of each processing stage in')
+parser.add_argument('--force', action='store_true', help='Recompute every realization, even those the manifest records as up to date')
+parser.add_argument('--shard', default=None, metavar='I/N',
+                    help='Run only partition I of N (numbered from 0) into its own store, leaving the tables to merge_shards.py')
+args = parser.parse_args()
+store_dir = args.store or os.path.join(args.output_dir, 'store')
+if args.shard:
+    partition, partitions = parse_partition(args.shard)
+    store_dir = partition_store_dir(store_dir, partition, partitions)
+options = {'stream': args.stream, 'time_chunk': args.time_chunk, 'obs_file': args.obs_file, 'ocean_threshold': args.ocean_threshold,
+           'area_weighting': None if args.area_weighting == 'none' else args.area_weighting,
+           'memory_limit': None if args.memory_limit is None else parse_memory_limit(args.memory_limit)//args.workers,
+           'diagnostic_options': {'zonal': {'time_option': args.season},
+                                  'niño3.4': {'window': args.niño_window, 'base_period': args.niño_base_period}}}
+if args.stage_log:
+    set_stage_log(args.stage_log) # Inherited by every worker process
+
+# Discover the work to do; the manifest skips realizations whose inputs and settings haven't changed since they were stored
+
+all_tasks = ensemble_tasks(args.models, args.diagnostics, args.data_dir)
+if args.shard:
+    all_tasks = partition_tasks(all_tasks, partition, partitions)
+with update_manifest(store_dir) as manifest:
+    tasks = all_tasks if args.force else pending_tasks(all_tasks, manifest, store_dir, options)
+task_lookup = {task[2]: task for task in tasks}
+print('---------------------------------------')
+print(f'Running {len(tasks)} tasks on {args.workers} workers ({len(all_tasks) - len(tasks)} realizations already up to date)')
+print('---------------------------------------')
+
+# Run every task; each worker writes its own shards and one bad file only marks its own task as failed
+
+failures = []
+for task_report in run_ensemble(tasks, workers=args.workers, time_limit=args.time_limit,
+                                options=options, store_dir=store_dir):
+    if task_report['status'] == 'ok':
+        diagnostics, model, data_file, mask_file = task_lookup[task_report['file']]
+        with update_manifest(store_dir) as manifest: # Re-read under the lock, so results other processes recorded are kept
+            for diagnostic in diagnostics:
+                record_result(manifest, store_dir, diagnostic, model, data_file, mask_file, diagnostic_params(diagnostic, options),
+                              task_report['signatures'])
+        memory = task_report['memory']
+        print(f"[ok] {task_report['diagnostic']} {os.path.basename(task_report['file'])} ({task_report['seconds']:.1f} s"
+              + (f", peak {memory['observed_peak_mib']:.0f} MiB of {memory['estimated_peak_mib']:.0f} MiB estimated)" if memory else ')'))
+    else:
+        failures.append(task_report)
+        print(f"[{task_report['status']}] {task_report['diagnostic']} {os.path.basename(task_report['file'])}: {task_report['error']}")
+
+# Consolidate the result store into the ensemble tables; a partition only records that it has finished, and the
+# tables are built from every partition's store by merge_shards.py
+
+if args.shard:
+    report_file = save_partition_report(store_dir, {'partition': partition, 'partitions': partitions, 'diagnostics': list(args.diagnostics),
+                                                    'tasks': [task[2] for task in all_tasks],
+                                                    'failures': [task_report['file'] for task_report in failures]})
+    print(f'Wrote {report_file}; run merge_shards.py once all {partitions} partitions have finished')
+else:
+    for out_file in build_ensemble_tables(store_dir, args.output_dir, args.diagnostics):
+        print(f'Wrote {out_file}')
+
+# Send a summary to the screen
+
+print("-------------------------------------------------")
+print(f"Finished {len(tasks) - len(failures)} of {len(tasks)} tasks successfully")
+for task_report in failures:
+    print(f"  {task_report['status']}: {task_report['diagnostic']} {task_report['file']}")
+if args.stage_log:
+    print(f'Stage timings were written to {args.stage_log}; run stage_report.py on it to rank the slowest models and stages')
+print("-------------------------------------------------")
+if failures:
+    raise SystemExit(1)
@@ -8,9 +8,8 @@
 import os
 import pandas as pd
 import seaborn as sns   
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy import stats
+from lib import significance_table
 
 # Directory management
 
@@ -26,32 +25,19 @@ if '1851' in data.index[0]:
     data = data.T
 #print(data)
 
-# Select future/historical data
-future_data = data.T.loc[[(int(data.columns[datetime][:4]) >= 2050) 
-                              for datetime in range(len(data.columns))]]
-historical_data = data.T.loc[[(int(data.columns[datetime][:4]) > 1850) &
-                              (int(data.columns[datetime][:4]) <= 1900)
-                              for datetime in range(len(data.columns))]]
-
-# Calculate T-scores (future_magnitude) and P-values (significance_future) for the dataset
-future_magnitude = []
-significance_future = []
-for model in future_data.columns:
-    future_magnitude.append(stats.ttest_ind(future_data[model].dropna(), historical_data[model].dropna()).statistic)
-    significance_future.append(stats.ttest_ind(future_data[model].dropna(), historical_data[model].dropna()).pvalue)
-    
-significant_future = pd.DataFrame(data = significance_future, index = future_data.columns, 
-                                  columns = ['Significant Differences in Future vs. Historical'])
-significant_future = significant_future.dropna()
+# Select future/historical periods by year and test every model at once
+# test can be 't', 'welch', 'permutation' or 'bootstrap'; correction can be 'fdr_bh', 'holm', 'bonferroni' or None
+# Only the resampling tests run in parallel, so worker processes are only started for them
+test = 't'
+correction = None
+workers = os.cpu_count() if test in ('permutation', 'bootstrap') else None
+significance = significance_table(data.T, (2050, None), (1851, 1900), test=test, n_resamples=10000,
+                                  correction=correction, workers=workers)
+significance = significance.dropna(subset=['pvalue'])
+significant_future = significance[['pvalue_adjusted']].rename(columns={'pvalue_adjusted': 'Significant Differences in Future vs. Historical'})
 
 # Set up hue information for plotting
-sig_hue = {}
-for sindex,sim in enumerate(significant_future.index):
-    if future_magnitude[sindex] > 0:
-        sig_hue[sim] = 'r'
-    if future_magnitude[sindex] < 0:
-        sig_hue[sim] = 'b'
-#significant_future.insert(0,'Significant Shading',sig_hue) #<- What's this for?
+sig_hue = {sim: ('r' if magnitude > 0 else 'b') for sim, magnitude in significance['statistic'].items() if magnitude != 0}
 
 warming = dict((model,color) for model,color in sig_hue.items() if  color == 'r')
 cooling = dict((model,color) for model,color in sig_hue.items() if  color == 'b')
@@ -0,0 +1,35 @@
+# Script to summarize the per-stage timing and memory logs written by run_ensemble.py, ELI.py and niño3-4.py
+# Ranks the slowest models, stages and single realization stages across the ensemble, and compares the estimated and
+# observed peak memory of runs with a memory limit
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+# Initialize system variables
+
+import argparse
+
+import pandas as pd
+
+from lib import stage_report
+
+parser = argparse.ArgumentParser(description='Rank the slowest models and stages from one or more stage logs')
+parser.add_argument('logs', nargs='+', help='JSON-lines stage log(s) to summarize')
+parser.add_argument('--top', type=int, default=10, help='Number of rows in each ranking (default: 10)')
+args = parser.parse_args()
+
+# Build the rankings and send them to the screen
+
+report = stage_report(args.logs, top=args.top)
+titles = {'models': 'Slowest models (summed over all stages and realizations)',
+          'stages': 'Time spent per stage across the ensemble',
+          'realizations': 'Slowest single stages',
+          'memory': 'Estimated vs. observed peak memory of memory-budget runs (MiB)',
+          'failed': 'Stages that failed'}
+with pd.option_context('display.width', 160, 'display.max_columns', 20, 'display.float_format', '{:.2f}'.format):
+    for key, title in titles.items():
+        if report[key].empty:
+            continue
+        print('-------------------------------------------------')
+        print(title)
+        print('-------------------------------------------------')
+        print(report[key].to_string())
@@ -0,0 +1,75 @@
+# Shared fixtures for the test suite: one small synthetic ensemble laid out like the real archive (see
+# write_synthetic_ensemble), written once per test session
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+
+import pytest
+
+# Models, realizations and grid of the synthetic ensemble; a 5° grid keeps points inside the ±5° ELI band, and the
+# full 1850-2100 record is needed by the 'change' diagnostic
+ensemble_models = ('SYN-A', 'SYN-B')
+ensemble_realizations = 2
+ensemble_grid = {'n_lat': 36, 'n_lon': 72}
+
+@pytest.fixture(scope='session', autouse=True)
+def regrid_cache(tmp_path_factory):
+    # Keeps the regridding weights and ocean masks the tests build out of the user's cache directory
+    cache_dir = str(tmp_path_factory.mktemp('regrid_cache'))
+    previous = os.environ.get('CMIP6_REGRID_CACHE')
+    os.environ['CMIP6_REGRID_CACHE'] = cache_dir
+    yield cache_dir
+    if previous is None:
+        os.environ.pop('CMIP6_REGRID_CACHE', None)
+    else:
+        os.environ['CMIP6_REGRID_CACHE'] = previous
+
+@pytest.fixture(scope='session')
+def ensemble(tmp_path_factory):
+    # Writes the synthetic ensemble; returns the files of write_synthetic_ensemble plus its 'data_dir'
+    from lib import write_synthetic_ensemble
+    out_dir = str(tmp_path_factory.mktemp('ensemble'))
+    files = write_synthetic_ensemble(out_dir, models=ensemble_models, realizations=ensemble_realizations, **ensemble_grid)
+    files['data_dir'] = os.path.join(out_dir, 'CMIP6')
+    return files
+
+@pytest.fixture(scope='session')
+def options(ensemble):
+    # run_realization settings shared by the tests that compare ways of running the same ensemble
+    return {'obs_file': ensemble['obs'], 'ocean_threshold': 1.0, 'area_weighting': 'coslat',
+            'diagnostic_options': {'niño3.4': {'window': 5, 'base_period': None}}}
+
+# Diagnostics whose result is a single spatial mean per time step come out bit-for-bit the same however the field is
+# read; the field diagnostics sum float32 values in a different order block by block, so they can differ by the last
+# digits of a float32 temperature
+exact_diagnostics = ['eli', 'niño3.4']
+field_tolerance = {'rtol': 1e-5, 'atol': 1e-3}
+
+def assert_same_results(expected, actual):
+    # Checks two dictionaries of run_realization results against each other, diagnostic by diagnostic
+    import numpy as np
+    assert sorted(expected) == sorted(actual)
+    for diagnostic, result in expected.items():
+        expected_values = np.asarray(result.values, dtype=float)
+        actual_values = np.asarray(actual[diagnostic].values, dtype=float)
+        assert expected_values.shape == actual_values.shape, diagnostic
+        assert not np.isnan(expected_values).all(), diagnostic
+        if diagnostic in exact_diagnostics:
+            np.testing.assert_array_equal(expected_values, actual_values, err_msg=diagnostic)
+            assert list(result.index) == list(actual[diagnostic].index)
+            assert result.name == actual[diagnostic].name
+        else:
+            np.testing.assert_allclose(actual_values, expected_values, err_msg=diagnostic, **field_tolerance)
+
+@pytest.fixture(scope='session')
+def realization(ensemble):
+    # The first realization of the first model, with its land mask
+    data_files, mask_file = ensemble['SYN-A']
+    return 'SYN-A', data_files[0], mask_file
+
+@pytest.fixture(scope='session')
+def in_memory(realization, options):
+    # Every registered diagnostic computed from the whole field loaded at once
+    from lib import registered_diagnostics, run_realization
+    return run_realization(*realization, list(registered_diagnostics), **options)
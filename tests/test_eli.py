@@ -0,0 +1,38 @@
+# Regression test of the vectorized calculate_eli against the per-month loop it replaced
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import numpy as np
+import pytest
+
+from lib import apply_ocean_mask, calculate_eli, load_ocean_mask, open_data
+
+from .conftest import ensemble_models, ensemble_realizations
+
+# First years of each realization to compare; the per-month loop takes a second or so per decade of record
+months = 360
+
+def loop_eli(ssts):
+    # The per-month ELI loop of the original scripts, kept here as the reference
+    monthly_ELI = []
+    ts_pac = ssts.sel(lon=slice(115, 290), lat=slice(-5, 5))
+    ts_tropics = ssts.sel(lat=slice(-5, 5))
+    for t in range(0, len(ts_pac)):
+        threshold_temp = np.nanmean(ts_tropics[t])
+        ELI_points = ts_pac[t]['lon'].where(ts_pac[t] > threshold_temp)
+        monthly_ELI.append(np.nanmean(ELI_points))
+    return np.array(monthly_ELI)
+
+@pytest.mark.parametrize('dtype, tolerance', [('float64', 1e-6), ('float32', 1e-3)])
+@pytest.mark.parametrize('model', ensemble_models)
+@pytest.mark.parametrize('member', range(ensemble_realizations))
+def test_matches_per_month_loop(ensemble, model, member, dtype, tolerance):
+    data_files, mask_file = ensemble[model]
+    with open_data(data_files[member]) as data:
+        ts = data['ts'].isel(time=slice(0, months)).astype(dtype).load()
+    ssts = apply_ocean_mask(ts, load_ocean_mask(mask_file, model))
+    expected = loop_eli(ssts)
+    monthly_ELI = calculate_eli(ssts)
+    assert not np.isnan(expected).all()
+    np.testing.assert_allclose(monthly_ELI.values, expected, rtol=0, atol=tolerance)
+    assert monthly_ELI.sizes['time'] == months and monthly_ELI.name == 'ELI'
@@ -0,0 +1,24 @@
+# Tests of run_realization: any subset of diagnostics gives the same results as a run of all of them
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import pytest
+
+from lib import run_realization
+
+from .conftest import assert_same_results
+
+@pytest.mark.parametrize('diagnostics', [['eli'], ['niño3.4'], ['eli', 'niño3.4'], ['zonal', 'bias']])
+def test_subsets_match_full_run(realization, options, in_memory, diagnostics):
+    # Reading only the box a subset of diagnostics needs must not change their results
+    subset = run_realization(*realization, diagnostics, **options)
+    assert_same_results({diagnostic: in_memory[diagnostic] for diagnostic in diagnostics}, subset)
+
+def test_unknown_diagnostic(realization):
+    with pytest.raises(KeyError):
+        run_realization(*realization, ['not-a-diagnostic'])
+
+def test_missing_land_mask(realization):
+    model, data_file, _ = realization
+    with pytest.raises(FileNotFoundError):
+        run_realization(model, data_file, None, ['eli'])
@@ -0,0 +1,100 @@
+# Tests of the ensemble driver: the tasks it runs, how it reports a failed realization, and that a sharded run
+# merged with merge_partitions gives the same tables as one unsharded run
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+
+import pandas as pd
+import pytest
+import xarray as xr
+
+from lib import (build_ensemble_tables, ensemble_tasks, merge_partitions, parse_partition, partition_store_dir,
+                 partition_tasks, run_task, save_partition_report)
+
+from .conftest import ensemble_models, ensemble_realizations
+
+diagnostics = ['eli', 'niño3.4', 'bias']
+partitions = 3
+
+def run_tasks(tasks, options, store_dir):
+    # Runs tasks one after another in this process, as the workers of run_ensemble would
+    reports = [run_task(*task, options=options, store_dir=store_dir) for task in tasks]
+    assert [report['status'] for report in reports] == ['ok']*len(tasks), [report['error'] for report in reports]
+    return reports
+
+def assert_same_outputs(expected_files, actual_files):
+    # Checks that two sets of ensemble tables hold the same values, file by file
+    assert sorted(map(os.path.basename, expected_files)) == sorted(map(os.path.basename, actual_files))
+    actual_by_name = {os.path.basename(path): path for path in actual_files}
+    for expected in expected_files:
+        actual = actual_by_name[os.path.basename(expected)]
+        if expected.endswith('.csv'):
+            pd.testing.assert_frame_equal(pd.read_csv(expected, index_col=0), pd.read_csv(actual, index_col=0))
+        elif expected.endswith('.nc'):
+            with xr.open_dataset(expected) as expected_data, xr.open_dataset(actual) as actual_data:
+                xr.testing.assert_identical(expected_data.load(), actual_data.load()[list(expected_data.data_vars)])
+
+@pytest.fixture(scope='module')
+def tasks(ensemble):
+    return ensemble_tasks(list(ensemble_models), diagnostics, ensemble['data_dir'])
+
+@pytest.fixture(scope='module')
+def unsharded(tasks, options, tmp_path_factory):
+    # Tables built from one store holding every realization
+    out_dir = str(tmp_path_factory.mktemp('unsharded'))
+    store_dir = os.path.join(out_dir, 'store')
+    run_tasks(tasks, options, store_dir)
+    return build_ensemble_tables(store_dir, out_dir, diagnostics)
+
+def run_partition(tasks, options, store_dir, partition):
+    # Runs one partition of the ensemble into its own store and marks it as finished
+    partition_dir = partition_store_dir(store_dir, partition, partitions)
+    selected = partition_tasks(tasks, partition, partitions)
+    run_tasks(selected, options, partition_dir)
+    save_partition_report(partition_dir, {'partition': partition, 'partitions': partitions, 'diagnostics': diagnostics,
+                                          'tasks': [task[2] for task in selected], 'failures': []})
+    return selected
+
+def test_tasks_cover_ensemble(tasks):
+    assert len(tasks) == len(ensemble_models)*ensemble_realizations
+    assert all(list(task[0]) == diagnostics and os.path.isfile(task[3]) for task in tasks)
+
+def test_run_task_returns_results(tasks, options, tmp_path):
+    report = run_tasks(tasks[:1], options, str(tmp_path))[0]
+    assert sorted(report['result']) == sorted(diagnostics)
+
+def test_run_task_catches_failures(tasks, tmp_path):
+    diagnostics, model, data_file, mask_file = tasks[0]
+    report = run_task(diagnostics, model, str(tmp_path/'missing.nc'), mask_file, store_dir=str(tmp_path))
+    assert report['status'] == 'failed' and report['error']
+
+def test_partitions_split_tasks(tasks):
+    # Every task lands in exactly one partition, and the split is the same every time it is worked out
+    selected = [partition_tasks(tasks, partition, partitions) for partition in range(partitions)]
+    assert sorted(task[2] for part in selected for task in part) == sorted(task[2] for task in tasks)
+    assert selected == [partition_tasks(tasks, partition, partitions) for partition in range(partitions)]
+
+def test_parse_partition():
+    assert parse_partition('2/8') == (2, 8)
+    for spec in ['8/8', '-1/4', '1', 'a/b', '0/0']:
+        with pytest.raises(ValueError):
+            parse_partition(spec)
+
+def test_sharded_merge_matches_unsharded(tasks, options, unsharded, tmp_path):
+    store_dir = str(tmp_path/'store')
+    for partition in range(partitions):
+        run_partition(tasks, options, store_dir, partition)
+    out_files, reports = merge_partitions(store_dir, str(tmp_path))
+    assert [report['partition'] for report in reports] == list(range(partitions))
+    assert_same_outputs(unsharded, out_files)
+
+def test_merge_waits_for_every_partition(tasks, options, tmp_path):
+    store_dir = str(tmp_path/'store')
+    finished = run_partition(tasks, options, store_dir, 0)
+    with pytest.raises(FileNotFoundError):
+        merge_partitions(store_dir, str(tmp_path), partitions)
+    out_files, reports = merge_partitions(store_dir, str(tmp_path), partitions, allow_partial=True)
+    assert [report['partition'] for report in reports] == [0]
+    eli_table = pd.read_csv(os.path.join(str(tmp_path), 'ELI_table.csv'), index_col=0)
+    assert len(eli_table.columns) == len(finished)
@@ -0,0 +1,51 @@
+# Tests that realizations converted to Zarr by ingest_file give the same results as the NetCDF originals
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from lib import find_realizations, ingest_file, input_size, input_stem, is_zarr, open_data, run_realization
+
+@pytest.fixture(scope='module')
+def ingested(ensemble, tmp_path_factory):
+    # The first realization of SYN-A and its land mask, in a model directory of their own next to their Zarr copies
+    data_files, mask_file = ensemble['SYN-A']
+    model_dir = tmp_path_factory.mktemp('zarr')/'SYN-A'
+    model_dir.mkdir()
+    originals = [shutil.copy(path, model_dir) for path in [data_files[0], mask_file]]
+    stores = [ingest_file(path, str(model_dir/f'{input_stem(path)}.zarr'), time_chunk=120, lat_chunk=16, lon_chunk=32)
+              for path in originals]
+    return originals[0], originals[1], stores[0], stores[1]
+
+def test_store_holds_same_data(ingested):
+    data_file, _, data_store, _ = ingested
+    assert is_zarr(data_store) and not is_zarr(data_file)
+    assert input_size(data_store) > 0
+    with open_data(data_file) as original, open_data(data_store) as converted:
+        np.testing.assert_array_equal(original['ts'].values, converted['ts'].values)
+        np.testing.assert_array_equal(original['time'].values, converted['time'].values)
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_zarr_results_match_netcdf(ingested, options, stream):
+    data_file, mask_file, data_store, mask_store = ingested
+    diagnostics = ['eli', 'niño3.4']
+    expected = run_realization('SYN-A', data_file, mask_file, diagnostics, stream=stream, **options)
+    actual = run_realization('SYN-A', data_store, mask_store, diagnostics, stream=stream, **options)
+    for diagnostic in diagnostics:
+        np.testing.assert_array_equal(expected[diagnostic].values, actual[diagnostic].values)
+        assert expected[diagnostic].name == actual[diagnostic].name
+
+def test_existing_store_is_kept(ingested):
+    data_file, _, data_store, _ = ingested
+    modified = os.stat(data_store).st_mtime
+    assert ingest_file(data_file, data_store) == data_store
+    assert os.stat(data_store).st_mtime == modified
+
+def test_find_realizations_prefers_zarr(ingested):
+    _, _, data_store, mask_store = ingested
+    data_files, mask_file = find_realizations('SYN-A', os.path.dirname(os.path.dirname(data_store)))
+    assert data_files == [data_store] and mask_file == mask_store
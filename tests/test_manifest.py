@@ -0,0 +1,116 @@
+# Tests of the result store's manifest: which realizations are up to date, and recording results safely
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+import shutil
+import threading
+
+import pandas as pd
+import pytest
+
+from lib import (diagnostic_params, file_signature, input_signatures, invalidate, is_current, load_manifest,
+                 pending_tasks, realization_name, record_result, run_task, update_manifest, write_shard)
+
+@pytest.fixture
+def inputs(ensemble, tmp_path):
+    # A private copy of one realization and its land mask, so the tests can touch and change them
+    data_files, mask_file = ensemble['SYN-A']
+    model_dir = tmp_path/'CMIP6'/'SYN-A'
+    model_dir.mkdir(parents=True)
+    data_file = shutil.copy(data_files[0], model_dir)
+    mask_file = shutil.copy(mask_file, model_dir)
+    return 'SYN-A', data_file, mask_file
+
+def store_result(store_dir, diagnostic, model, data_file, mask_file, params=None):
+    # Writes a placeholder shard for a realization and records it in the manifest
+    write_shard(pd.Series([1.0, 2.0], index=['1850-01', '1850-02'], name='r1'), store_dir, diagnostic, model,
+                realization_name(data_file))
+    with update_manifest(store_dir) as manifest:
+        return record_result(manifest, store_dir, diagnostic, model, data_file, mask_file, params)
+
+def test_file_signature_reuses_hash(inputs):
+    _, data_file, _ = inputs
+    signature = file_signature(data_file)
+    assert signature['size'] == os.path.getsize(data_file)
+    reused = file_signature(data_file, dict(signature, sha1='not-recomputed'))
+    assert reused['sha1'] == 'not-recomputed'
+
+def test_result_is_current_until_inputs_change(inputs, tmp_path):
+    store_dir = str(tmp_path/'store')
+    model, data_file, mask_file = inputs
+    params = diagnostic_params('eli', {'ocean_threshold': 1.0, 'area_weighting': 'coslat'})
+    store_result(store_dir, 'eli', model, data_file, mask_file, params)
+    manifest = load_manifest(store_dir)
+    assert is_current(manifest, store_dir, 'eli', model, data_file, mask_file, params)
+    assert not is_current(manifest, store_dir, 'eli', model, data_file, mask_file, dict(params, ocean_threshold=0.5))
+    assert not is_current(manifest, store_dir, 'niño3.4', model, data_file, mask_file, params)
+    with open(mask_file, 'ab') as mask:
+        mask.write(b'\0')
+    assert not is_current(manifest, store_dir, 'eli', model, data_file, mask_file, params)
+
+def test_touched_inputs_stay_current_and_are_saved(inputs, tmp_path):
+    # A file that is only touched is hashed once more, and its new mtime is saved so it isn't hashed again
+    store_dir = str(tmp_path/'store')
+    model, data_file, mask_file = inputs
+    store_result(store_dir, 'eli', model, data_file, mask_file)
+    os.utime(data_file, (1e9, 1e9))
+    with update_manifest(store_dir) as manifest:
+        assert is_current(manifest, store_dir, 'eli', model, data_file, mask_file)
+    entry = next(iter(load_manifest(store_dir).values()))
+    assert entry['input']['mtime'] == os.stat(data_file).st_mtime
+
+def test_record_result_uses_given_signatures(inputs, tmp_path):
+    store_dir = str(tmp_path/'store')
+    model, data_file, mask_file = inputs
+    signatures = input_signatures(data_file, mask_file)
+    with open(data_file, 'ab') as data:
+        data.write(b'\0') # Changed after the result was computed from it
+    with update_manifest(store_dir) as manifest:
+        entry = record_result(manifest, store_dir, 'eli', model, data_file, mask_file, signatures=signatures)
+    assert entry['input'] == signatures['input']
+    assert not is_current(load_manifest(store_dir), store_dir, 'eli', model, data_file, mask_file)
+
+def test_run_task_reports_signatures(inputs, options, tmp_path):
+    # Workers hash their inputs before reading them, so the parent can record results without hashing again
+    model, data_file, mask_file = inputs
+    report = run_task(('eli',), model, data_file, mask_file, options=options, store_dir=str(tmp_path/'store'))
+    assert report['status'] == 'ok', report['error']
+    assert report['signatures'] == input_signatures(data_file, mask_file)
+    assert list(report['result']) == ['eli']
+
+def test_pending_tasks_and_invalidate(inputs, tmp_path):
+    store_dir = str(tmp_path/'store')
+    model, data_file, mask_file = inputs
+    tasks = [(('eli', 'niño3.4'), model, data_file, mask_file)]
+    store_result(store_dir, 'eli', model, data_file, mask_file)
+    manifest = load_manifest(store_dir)
+    assert pending_tasks(tasks, manifest, store_dir) == [(('niño3.4',), model, data_file, mask_file)]
+    shard = manifest[next(iter(manifest))]['shard']
+    assert invalidate(manifest, store_dir, 'eli', data_file)
+    assert not os.path.exists(shard) and not manifest
+    assert not invalidate(manifest, store_dir, 'eli', data_file)
+
+def test_update_manifest_keeps_concurrent_records(inputs, tmp_path):
+    # Writers that share a store each add their own entry; none of them is lost
+    store_dir = str(tmp_path/'store')
+    model, data_file, mask_file = inputs
+    signatures = input_signatures(data_file, mask_file)
+    def record(number):
+        with update_manifest(store_dir) as manifest:
+            record_result(manifest, store_dir, f'diagnostic{number}', model, data_file, mask_file, signatures=signatures)
+    threads = [threading.Thread(target=record, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(load_manifest(store_dir)) == 8
+
+def test_update_manifest_discards_failed_updates(inputs, tmp_path):
+    store_dir = str(tmp_path/'store')
+    model, data_file, mask_file = inputs
+    with pytest.raises(RuntimeError):
+        with update_manifest(store_dir) as manifest:
+            record_result(manifest, store_dir, 'eli', model, data_file, mask_file)
+            raise RuntimeError('failed while recording')
+    assert load_manifest(store_dir) == {}
@@ -0,0 +1,83 @@
+# Tests of land fractions, ocean masks and area weights, whatever convention the land mask was stored in
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from lib import (apply_ocean_mask, area_weights, land_fraction, load_area_weights, load_land_fraction, load_ocean_mask,
+                 masks, ocean_mask, open_data, sftlf_conventions, synthetic_land_mask)
+
+@pytest.mark.parametrize('convention', sorted(sftlf_conventions))
+def test_conventions_give_same_fraction(convention):
+    expected = land_fraction(synthetic_land_mask(18, 36, 'fraction')['sftlf'])
+    fraction = land_fraction(synthetic_land_mask(18, 36, convention)['sftlf'])
+    assert fraction.attrs['convention'] == convention
+    assert fraction.dtype == np.float32
+    np.testing.assert_allclose(fraction.values, expected.values, rtol=1e-6)
+    assert 0 <= float(fraction.min()) and float(fraction.max()) == pytest.approx(1)
+
+@pytest.mark.parametrize('threshold', [0.5, 1.0])
+def test_ocean_mask_threshold(threshold):
+    fraction = land_fraction(synthetic_land_mask(18, 36)['sftlf'])
+    mask = ocean_mask(fraction, threshold)
+    np.testing.assert_array_equal(mask.values, fraction.values < threshold)
+    assert mask.attrs == {'threshold': threshold, 'convention': 'percent'}
+
+def test_ocean_mask_cache(ensemble, tmp_path):
+    # Masks are cached on disk by mask file and threshold, and a replaced mask file gets a new mask
+    mask_file = shutil.copy(ensemble['SYN-A'][1], tmp_path)
+    cache_dir = str(tmp_path/'cache')
+    first = load_ocean_mask(mask_file, 'SYN-A', 0.5, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    masks._ocean_masks.clear()
+    cached = load_ocean_mask(mask_file, 'SYN-A', 0.5, cache_dir=cache_dir)
+    assert cached.identical(first)
+    all_ocean = synthetic_land_mask(36, 72, 'fraction')
+    all_ocean['sftlf'][:] = 0
+    all_ocean['sftlf'][0, 0] = 1
+    all_ocean.to_netcdf(mask_file)
+    os.utime(mask_file, (1e9, 1e9))
+    replaced = load_ocean_mask(mask_file, 'SYN-A', 0.5, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    assert int(replaced.sum()) == replaced.size - 1 != int(first.sum())
+    assert replaced.attrs['convention'] == 'fraction'
+
+def test_apply_ocean_mask(ensemble):
+    data_files, mask_file = ensemble['SYN-A']
+    with open_data(data_files[0]) as data:
+        ts = data['ts'].isel(time=slice(0, 12)).load()
+    mask = load_ocean_mask(mask_file, 'SYN-A')
+    original = ts.values.copy()
+    masked = apply_ocean_mask(ts, mask)
+    np.testing.assert_array_equal(ts.values, original)
+    assert np.isnan(masked.values[:, ~mask.values]).all()
+    np.testing.assert_array_equal(masked.values[:, mask.values], original[:, mask.values])
+    in_place = apply_ocean_mask(ts, mask, inplace=True)
+    np.testing.assert_array_equal(in_place.values, masked.values)
+    assert np.isnan(ts.values[:, ~mask.values]).all()
+
+def test_apply_ocean_mask_to_unloaded_data(ensemble):
+    # A field still backed by its file is read and masked in place; a dask-backed field is always masked lazily
+    data_files, mask_file = ensemble['SYN-A']
+    mask = load_ocean_mask(mask_file, 'SYN-A')
+    with open_data(data_files[0]) as data:
+        ts = data['ts'].isel(time=slice(0, 12))
+        in_place = apply_ocean_mask(ts, mask, inplace=True)
+        assert np.isnan(in_place.values[:, ~mask.values]).all()
+        chunked = data['ts'].isel(time=slice(0, 12)).chunk({'time': 4})
+        lazy = apply_ocean_mask(chunked, mask, inplace=True)
+        assert lazy.chunks is not None and not np.isnan(chunked.values).any()
+        np.testing.assert_array_equal(lazy.values, in_place.values)
+
+def test_area_weights(ensemble):
+    data_files, mask_file = ensemble['SYN-A']
+    fraction = load_land_fraction(mask_file)
+    weights = area_weights(fraction['lat'])
+    np.testing.assert_allclose(weights.values, np.cos(np.deg2rad(fraction['lat'].values)))
+    # Without an areacella file next to the mask, 'area' falls back to the cos(latitude) weights
+    np.testing.assert_allclose(load_area_weights(mask_file, 'SYN-A', 'area').values,
+                               load_area_weights(mask_file, 'SYN-A', 'coslat').values)
@@ -0,0 +1,119 @@
+# Tests of memory budgets: reading limits, planning stream blocks that fit under them, and running on a budget
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from lib import (block_overhead, current_rss_mib, eli_region, ensemble_stats, fixed_overhead_mib, grid_copies, instrument,
+                 load_observations, open_data, parse_memory_limit, plan_chunks, registered_diagnostics, run_realization,
+                 sst_bias_ens_calculator, sst_change_ens_calculator, zonal_avg_ens_calculator, zonal_diff_ens_calculator)
+
+from .conftest import assert_same_results, ensemble_grid
+
+@pytest.mark.parametrize('limit, expected', [('4G', 4*2**30), ('512MB', 512*2**20), ('512MiB', 512*2**20),
+                                             ('2.5GiB', int(2.5*2**30)), (' 64 k ', 64*2**10), ('1T', 2**40),
+                                             ('1000', 1000), (2048, 2048), (1.5e9, 1500000000)])
+def test_parse_memory_limit(limit, expected):
+    assert parse_memory_limit(limit) == expected
+
+@pytest.mark.parametrize('limit', ['', 'lots', '4X', '-1G', '4 G B'])
+def test_parse_memory_limit_rejects(limit):
+    with pytest.raises(ValueError):
+        parse_memory_limit(limit)
+
+def test_plan_fits_under_limit(ensemble):
+    data_file = ensemble['SYN-A'][0][0]
+    limit_mib = int(current_rss_mib() + fixed_overhead_mib) + 64
+    plan = plan_chunks(data_file, f'{limit_mib}MiB')
+    assert set(plan) == {'time_chunk', 'lat_chunk', 'memory_limit_mib', 'baseline_mib', 'estimated_peak_mib'}
+    assert plan['time_chunk'] >= 1 and plan['lat_chunk'] is None
+    assert plan['memory_limit_mib'] == limit_mib
+    assert plan['baseline_mib'] <= plan['estimated_peak_mib'] <= plan['memory_limit_mib']
+
+def test_plan_grows_with_limit(ensemble):
+    data_file = ensemble['SYN-A'][0][0]
+    base_mib = int(current_rss_mib() + fixed_overhead_mib)
+    small = plan_chunks(data_file, f'{base_mib + 8}MiB')
+    large = plan_chunks(data_file, f'{base_mib + 4096}MiB')
+    assert small['time_chunk'] < large['time_chunk']
+    # Reading only the ELI region lets more time steps into the same budget
+    assert plan_chunks(data_file, f'{base_mib + 8}MiB', region=eli_region)['time_chunk'] > small['time_chunk']
+
+@pytest.fixture
+def half_step_limit(realization, monkeypatch):
+    # With a fixed baseline the budget can be set to half a time step over the fixed allowance, so each time step
+    # has to be read in bands of latitude
+    monkeypatch.setattr(instrument, 'current_rss_mib', lambda: 100.0)
+    with open_data(realization[1]) as data:
+        grid_mib = data.sizes['lat']*data.sizes['lon']*8/2**20
+        step_mib = block_overhead*data['ts'].dtype.itemsize*data.sizes['lat']*data.sizes['lon']/2**20
+    return (100 + fixed_overhead_mib + grid_copies*grid_mib + step_mib/2)*2**20
+
+def test_plan_splits_or_refuses_tiny_limits(realization, half_step_limit):
+    plan = plan_chunks(realization[1], half_step_limit)
+    assert plan['time_chunk'] == 1 and 1 <= plan['lat_chunk'] < ensemble_grid['n_lat']
+    assert plan['estimated_peak_mib'] <= plan['memory_limit_mib']
+    with pytest.raises(MemoryError):
+        plan_chunks(realization[1], '64MiB')
+
+def test_bands_only_for_field_diagnostics(realization, options, in_memory, half_step_limit):
+    # Field diagnostics reduce each band on its own, so they can be computed in bands; the indices need whole time
+    # steps, so a run that reads the whole grid for them as well can't go under the limit
+    banded = run_realization(*realization, ['bias'], memory_limit=half_step_limit, **options)
+    assert_same_results({'bias': in_memory['bias']}, banded)
+    for diagnostics in (['eli', 'bias'], ['niño3.4', 'zonal']):
+        with pytest.raises(MemoryError):
+            run_realization(*realization, diagnostics, memory_limit=half_step_limit, **options)
+
+def test_memory_budget_matches_in_memory(realization, options, in_memory):
+    # With the observations already loaded, a budget a few tens of MiB over what the process uses only fits part of
+    # the record per block
+    obs = load_observations(options['obs_file'])
+    memory_report = {}
+    limit = f'{int(current_rss_mib() + fixed_overhead_mib) + 24}MiB'
+    budgeted = run_realization(*realization, list(registered_diagnostics), obs=obs, memory_limit=limit,
+                               memory_report=memory_report, **options)
+    assert_same_results(in_memory, budgeted)
+    assert 1 <= memory_report['time_chunk'] < len(in_memory['eli'])
+    assert memory_report['estimated_peak_mib'] <= memory_report['memory_limit_mib']
+    assert memory_report['observed_peak_mib'] > 0
+
+def test_streamed_ensemble_stats_match_in_memory(ensemble, tmp_path):
+    # The budget fits a few years of the Welford update at a time, and the blocks don't divide the record
+    data_files = ensemble['SYN-A'][0]
+    expected = ensemble_stats(data_files)
+    limit = f'{int(current_rss_mib() + fixed_overhead_mib) + 4}MiB'
+    streamed = ensemble_stats(data_files, memory_limit=limit, out_store=str(tmp_path/'stats.zarr'))
+    assert 1 < len(streamed.chunks['time']) and streamed.attrs['realizations'] == len(data_files)
+    for name in ('mean', 'variance', 'spread'):
+        np.testing.assert_array_equal(streamed[name].values, expected[name].values)
+    with pytest.raises(ValueError):
+        ensemble_stats(data_files, memory_limit=limit)
+
+@pytest.mark.parametrize('calculator, out_files', [
+    (lambda *args, **kwargs: sst_bias_ens_calculator(0, ['SYN-A'], *args, **kwargs), ['composite_bias.nc']),
+    (lambda *args, **kwargs: sst_change_ens_calculator(0, ['SYN-A'], *args, **kwargs), ['composite_change.nc']),
+    (lambda *args, **kwargs: zonal_avg_ens_calculator(0, 'DJF', [120, 280], [5, -5], ['SYN-A'], *args, **kwargs),
+     ['djf_zonal_averages.nc']),
+    (lambda *args, **kwargs: zonal_diff_ens_calculator(0, 'DJF', 'hist+future', [120, 280], [5, -5], ['SYN-A'], *args,
+                                                       **kwargs), ['hist_zonal_averages.nc', 'future_zonal_averages.nc'])])
+def test_calculators_on_a_budget(ensemble, tmp_path, monkeypatch, calculator, out_files):
+    # Each calculator writes the same composite whether the ensemble mean is loaded whole or streamed on a budget
+    monkeypatch.chdir(tmp_path) # The calculators change into their data directory
+    obs = load_observations(ensemble['obs'])
+    outputs = {}
+    for run in ['loaded', 'budget']:
+        memory_limit = None if run == 'loaded' else f'{int(current_rss_mib() + fixed_overhead_mib) + 8}MiB'
+        data_dir = tmp_path/run
+        (data_dir/'CMIP6').mkdir(parents=True)
+        os.symlink(os.path.join(ensemble['data_dir'], 'SYN-A'), data_dir/'CMIP6'/'SYN-A')
+        assert calculator(obs, f'{data_dir}/', memory_limit=memory_limit) == 'SYN-A'
+        assert sorted(os.listdir(data_dir)) == sorted(['CMIP6'] + out_files) # The scratch store is removed
+        outputs[run] = [xr.load_dataset(data_dir/out_file) for out_file in out_files]
+    for loaded, budget in zip(outputs['loaded'], outputs['budget']):
+        xr.testing.assert_allclose(loaded, budget, rtol=1e-12, atol=1e-12)
+        assert not np.isnan(loaded['SYN-A-ts'].values).all()
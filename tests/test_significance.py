@@ -0,0 +1,90 @@
+# Tests that the vectorized significance tests agree with scipy column by column and are reproducible
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from lib import adjust_pvalues, bootstrap_test, period_mask, permutation_test, significance_table, t_test
+
+@pytest.fixture
+def samples():
+    # Two periods of eight models: some shifted between periods, some not, one with missing values, one all missing
+    rng = np.random.default_rng(1)
+    first = rng.normal(0, 1, (40, 8)) + np.array([0, 0, 0, 0.5, 1, 2, 0, 0])
+    second = rng.normal(0, 2, (30, 8))
+    first[::5, 6] = np.nan
+    second[::4, 6] = np.nan
+    first[:, 7] = second[:, 7] = np.nan
+    return first, second
+
+@pytest.mark.parametrize('equal_var', [True, False])
+def test_t_test_matches_scipy(samples, equal_var):
+    first, second = samples
+    statistic, pvalue = t_test(first, second, equal_var)
+    for column in range(first.shape[1] - 1):
+        expected = stats.ttest_ind(first[:, column], second[:, column], equal_var=equal_var, nan_policy='omit')
+        assert statistic[column] == pytest.approx(expected.statistic)
+        assert pvalue[column] == pytest.approx(expected.pvalue)
+    assert np.isnan(statistic[-1]) and np.isnan(pvalue[-1])
+
+def test_permutation_test_is_reproducible(samples):
+    first, second = samples
+    observed, pvalue = permutation_test(first, second, 2000, statistic='t', batch_size=300, seed=3)
+    np.testing.assert_allclose(observed[:-1], t_test(first, second)[0][:-1])
+    again = permutation_test(first, second, 2000, statistic='t', batch_size=300, seed=3)[1]
+    spread = permutation_test(first, second, 2000, statistic='t', batch_size=300, workers=2, seed=3)[1]
+    np.testing.assert_array_equal(pvalue, again)
+    np.testing.assert_array_equal(pvalue, spread)
+    assert np.isnan(pvalue[-1])
+    assert pvalue[5] == pytest.approx(1/2001) and pvalue[0] > 0.05
+
+def test_permutation_p_values_agree_with_t_test(samples):
+    first, second = samples
+    _, pvalue = permutation_test(first[:, :-2], second[:, :-2], 5000, statistic='t', seed=0)
+    np.testing.assert_allclose(pvalue, t_test(first[:, :-2], second[:, :-2])[1], atol=0.03)
+    with pytest.raises(ValueError):
+        permutation_test(first, second, 10, statistic='median')
+
+@pytest.mark.filterwarnings('error::RuntimeWarning') # The all-missing column doesn't warn
+def test_bootstrap_test(samples):
+    first, second = samples
+    observed, pvalue, interval = bootstrap_test(first, second, 2000, seed=4)
+    np.testing.assert_allclose(observed[:-1], np.nanmean(first[:, :-1], axis=0) - np.nanmean(second[:, :-1], axis=0))
+    assert interval.shape == (2, first.shape[1])
+    assert (interval[0, :-1] <= observed[:-1]).all() and (observed[:-1] <= interval[1, :-1]).all()
+    assert pvalue[5] < 0.01 and pvalue[0] > 0.05
+    np.testing.assert_array_equal(pvalue, bootstrap_test(first, second, 2000, workers=2, seed=4)[1])
+
+def test_adjust_pvalues():
+    pvalues = np.array([0.01, 0.04, np.nan, 0.03, 0.2])
+    np.testing.assert_allclose(adjust_pvalues(pvalues, 'bonferroni'), [0.04, 0.16, np.nan, 0.12, 0.8])
+    np.testing.assert_allclose(adjust_pvalues(pvalues, 'holm'), [0.04, 0.09, np.nan, 0.09, 0.2])
+    np.testing.assert_allclose(adjust_pvalues(pvalues, 'fdr_bh'), [0.04, 0.05333333, np.nan, 0.05333333, 0.2])
+    np.testing.assert_allclose(adjust_pvalues(pvalues, 'fdr_bh')[~np.isnan(pvalues)],
+                               stats.false_discovery_control(pvalues[~np.isnan(pvalues)]))
+    with pytest.raises(ValueError):
+        adjust_pvalues(pvalues, 'sidak')
+
+def test_period_mask():
+    labels = ['1850-01', '1900-12', '1901-01', '2049-1950', '2050']
+    np.testing.assert_array_equal(period_mask(labels, 1851, 1900), [False, True, False, False, False])
+    np.testing.assert_array_equal(period_mask(labels, 2049), [False, False, False, True, True])
+    assert period_mask(labels).all()
+
+@pytest.mark.filterwarnings('error::RuntimeWarning')
+@pytest.mark.parametrize('test', ['t', 'welch', 'permutation', 'bootstrap'])
+def test_significance_table(samples, test):
+    first, second = samples
+    index = [f'{year}-01' for year in range(1851, 1881)] + [f'{year}-01' for year in range(2050, 2090)]
+    table = pd.DataFrame(np.concatenate([second, first]), index=index, columns=[f'model{i}' for i in range(8)])
+    results = significance_table(table, (2050, None), (1851, 1900), test, n_resamples=500, seed=0)
+    assert list(results.index) == list(table.columns)
+    np.testing.assert_allclose(results['difference'][:-1],
+                               np.nanmean(first[:, :-1], axis=0) - np.nanmean(second[:, :-1], axis=0))
+    np.testing.assert_allclose(results['pvalue_adjusted'], adjust_pvalues(results['pvalue'].values, 'fdr_bh'))
+    assert results.loc['model5', 'significant'] and not results.loc['model0', 'significant']
+    assert not results.loc['model7', 'significant']
+    assert ('lower' in results) == (test == 'bootstrap')
@@ -0,0 +1,60 @@
+# Tests that streaming a realization in time blocks gives the same results as loading it whole
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from lib import (blocks_path, calculate_eli, load_ocean_mask, open_data, realization_name, registered_diagnostics,
+                 run_realization, shard_path, stream_index)
+
+from .conftest import assert_same_results
+
+@pytest.mark.parametrize('time_chunk', [7, 12, 120, 5000])
+def test_stream_matches_in_memory(realization, options, in_memory, time_chunk):
+    streamed = run_realization(*realization, list(registered_diagnostics), stream=True, time_chunk=time_chunk, **options)
+    assert_same_results(in_memory, streamed)
+
+@pytest.mark.parametrize('time_chunk', [7, 120, 5000])
+def test_blockwise_stream_matches_in_memory(realization, options, in_memory, time_chunk):
+    # Runs of only blockwise diagnostics go through stream_index instead of dask
+    diagnostics = ['eli', 'niño3.4']
+    streamed = run_realization(*realization, diagnostics, stream=True, time_chunk=time_chunk, **options)
+    assert_same_results({diagnostic: in_memory[diagnostic] for diagnostic in diagnostics}, streamed)
+
+def test_blocks_file_is_written_block_by_block(realization, tmp_path):
+    # A run that fails partway leaves every block calculated before the failure in the blocks file
+    model, data_file, mask_file = realization
+    out_file = str(tmp_path/'blocks.csv')
+    def failing_eli(block):
+        if block['time'].dt.year.values[0] >= 1853:
+            raise RuntimeError('stopped after three years')
+        return xr.Dataset({'eli': calculate_eli(block)})
+    with open_data(data_file) as data:
+        with pytest.raises(RuntimeError):
+            stream_index(data['ts'], load_ocean_mask(mask_file, model), failing_eli, time_chunk=12, out_file=out_file)
+        expected = stream_index(data['ts'].isel(time=slice(0, 36)), load_ocean_mask(mask_file, model), calculate_eli)
+    written = pd.read_csv(out_file, index_col=0)
+    assert list(written.columns) == ['eli'] and len(written) == 36
+    np.testing.assert_allclose(written['eli'].values, expected.values)
+
+def test_blocks_file_is_removed_once_stored(realization, options, tmp_path):
+    model, data_file, mask_file = realization
+    store_dir = str(tmp_path/'store')
+    results = run_realization(model, data_file, mask_file, ['eli'], store_dir=store_dir, stream=True, time_chunk=120,
+                              **options)
+    assert results == {'eli': shard_path(store_dir, 'eli', model, realization_name(data_file))}
+    assert os.path.isfile(results['eli']) and not os.path.exists(blocks_path(store_dir, model, realization_name(data_file)))
+
+def test_stream_index_leaves_input_unchanged(realization):
+    # Masking in place must only ever touch the copy the run read itself
+    model, data_file, mask_file = realization
+    with open_data(data_file) as data:
+        ts = data['ts'].isel(time=slice(0, 24)).load()
+    original = ts.values.copy()
+    stream_index(ts, load_ocean_mask(mask_file, model), lambda block: block.mean(('lat', 'lon')), time_chunk=5)
+    np.testing.assert_array_equal(ts.values, original)
@@ -0,0 +1,82 @@
+# Tests that the cached summary statistics match what matplotlib and scipy would calculate from the raw columns
+# Date: 10/18/2026
+# Coded with Python 3.8.10
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from matplotlib import cbook
+from scipy import stats as scipy_stats
+
+from lib import eli_category, load_summary, render_figure, summary_path, summary_stats
+
+@pytest.fixture
+def table():
+    # DJF ELI-like table: one model per ENSO category, one with missing seasons and outliers, one with a single value
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame({'la_nina': rng.normal(150, 8, 60), 'neutral': rng.normal(162, 6, 60),
+                          'el_nino': rng.normal(175, 10, 60), 'gappy': rng.normal(170, 5, 60), 'single': np.nan})
+    table.loc[::7, 'gappy'] = np.nan
+    table.loc[[3, 9], 'gappy'] = [120, 230]
+    table.loc[0, 'single'] = 160
+    return table
+
+def test_boxplot_stats_match_matplotlib(table):
+    stats, _ = summary_stats(table)
+    for column in table:
+        expected = cbook.boxplot_stats(table[column].dropna().to_numpy())[0]
+        row = stats.loc[column]
+        assert row['count'] == table[column].notna().sum()
+        for key, name in [('med', 'median'), ('q1', 'q1'), ('q3', 'q3'), ('whislo', 'whislo'), ('whishi', 'whishi'),
+                          ('mean', 'mean')]:
+            assert row[name] == pytest.approx(expected[key]), (column, name)
+        assert sorted(row['fliers']) == pytest.approx(sorted(expected['fliers'])), column
+
+def test_densities_match_scipy(table):
+    _, kde = summary_stats(table, kde_points=50)
+    for column in table:
+        values = table[column].dropna().to_numpy()
+        if len(values) < 2:
+            assert kde[column].isna().all()
+            continue
+        expected = scipy_stats.gaussian_kde(values, bw_method='scott')(kde.index.to_numpy())
+        np.testing.assert_allclose(kde[column].to_numpy(), expected, rtol=1e-9, atol=1e-15)
+
+def test_categories():
+    mean_eli = pd.Series([150, 160, 162, 165, 170], index=list('abcde'))
+    category = eli_category(mean_eli)
+    assert list(category.dropna().items()) == [('a', 'la_nina'), ('c', 'neutral'), ('e', 'el_nino')]
+    assert category[['b', 'd']].isna().all()
+
+@pytest.mark.parametrize('empty', [pd.DataFrame(index=range(5)), pd.DataFrame({'a': []}, dtype=float)])
+def test_empty_tables(empty):
+    stats, kde = summary_stats(empty)
+    assert list(stats.index) == list(empty.columns) and (stats['count'] == 0).all()
+    assert kde.empty and list(kde.columns) == list(empty.columns)
+
+def test_summary_cache(table, tmp_path):
+    table_file = str(tmp_path/'ens_averages.csv')
+    table.to_csv(table_file)
+    stats, kde = load_summary(table_file)
+    assert os.path.isfile(summary_path(table_file))
+    cached_stats, cached_kde = load_summary(table_file, table=pd.DataFrame()) # The cache is used, not the table
+    numeric = ['count', 'mean', 'median', 'q1', 'q3', 'whislo', 'whishi']
+    pd.testing.assert_frame_equal(stats[numeric], cached_stats[numeric], check_dtype=False)
+    assert stats['category'].fillna('').equals(cached_stats['category'].fillna(''))
+    np.testing.assert_allclose(cached_kde.to_numpy(), kde.to_numpy())
+    table.iloc[:, :2].to_csv(table_file)
+    changed_stats, _ = load_summary(table_file)
+    assert list(changed_stats.index) == list(table.columns[:2])
+
+def test_boxplots_of_empty_groups(table, tmp_path):
+    # No model falls in the neutral group; its boxplots are drawn empty instead of failing
+    without_neutral = table.drop(columns='neutral')
+    tables = {'ens_averages': without_neutral,
+              'niño_averages': pd.DataFrame(np.random.default_rng(1).normal(0, 1, (200, 4)), columns=without_neutral.columns),
+              'ersst_niño': pd.DataFrame({'ERSST_v5': np.random.default_rng(2).normal(0, 1, 200)})}
+    tables['ens_summary'], tables['ens_summary_kde'] = summary_stats(without_neutral)
+    tables['ersst_summary'], _ = summary_stats(pd.DataFrame({'ERSST_v5': table['neutral']}), categorize=False)
+    for name in ['neutral_boxplot', 'nino_neutral_boxplot', 'la_nina_boxplot', 'nino_en_boxplot']:
+        assert os.path.isfile(render_figure(name, str(tmp_path), tables, dpi=50))
@@ -13,14 +13,21 @@ import pandas as pd
 import xarray as xr
 import numpy as np
 from datetime import datetime
-from lib import zonal_avg_ens_calculator
+from lib import load_observations, zonal_avg_ens_calculator
 
-# Set base directory, open data file
+# Set base directory, open observational data once for the whole ensemble
 
 data_dir = '' #Fill these in with your local file paths
 home_dir = ''
-os.chdir(data_dir)
-obs_ssts = xr.open_dataset('sst.mnmean.nc')
+obs = load_observations(os.path.join(data_dir, 'sst.mnmean.nc'))
+
+# Optional memory budget per model, e.g. '4G'; each model's ensemble mean is then streamed in blocks sized to stay
+# under it instead of being loaded whole
+memory_limit = None
+
+# Region to average over (latitudes run north to south on the observational grid)
+lon_bounds = [120, 280]
+lat_bounds = [5, -5]
 
 model_list = ["ACCESS-CM2", "ACCESS-ESM1-5", "AWI-CM-1-1-MR", "BCC-CSM2-MR", "CAMS-CSM1-0", "CanESM5", "CESM2", "CESM2-WACCM", "CMCC-CM2-SR5", 
               "CNRM-CM6-1", "CNRM-CM6-1-HR", "CNRM-ESM2-1", "EC-Earth3", "EC-Earth3-Veg", "FGOALS-f3-L", "FGOALS-g3", "GFDL-CM4", "GFDL-ESM4", 
@@ -28,12 +35,7 @@ model_list = ["ACCESS-CM2", "ACCESS-ESM1-5", "AWI-CM-1-1-MR", "BCC-CSM2-MR", "CA
               "MPI-ESM1-2-HR", "MPI-ESM1-2-LR", "MPI-ESM2-0", "NESM3", "NorESM2-LM", "NorESM2-MM", "TaiESM1"]
 ens_size = range(len(model_list))
 
-# Iterate over models in the ensemble; output to file
+# Iterate over models in the ensemble; each call adds the model to 'djf_zonal_averages.nc'
 for model in ens_size:
-    ens_data, model_run = zonal_avg_ens_calculator(model_list,model)
-    os.chdir(data_dir)
-    if os.path.isfile('ens_zonal_averages.nc'):
-        ens_data.to_netcdf('ens_zonal_averages.nc',mode='a')
-    else:
-        ens_data.to_netcdf('ens_zonal_averages.nc',mode='w')
+    model_run = zonal_avg_ens_calculator(model, 'DJF', lon_bounds, lat_bounds, model_list, obs, data_dir, memory_limit)
     print(f'Sent updated data with {model_run} included!')